@@ -0,0 +1,52 @@
+"""
+Benchmark of the staging formats, write time, read time and size on disk of a
+normalized prints file, a normalized taps file and a pays file saved with every format of `tr.STAGING_FORMATS`.
+
+Usage:
+    python -m benchmarks.bench_codecs --rows 10000000
+"""
+import argparse
+import os
+import tempfile
+import pandas as pd
+from benchmarks.synthetic import synthetic_prints, synthetic_pays, timed
+from etl.extr import extraction as extr
+from etl.trsf import transform as trsf
+from etl.utils import pprint
+from etl import transversal as tr
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--formats', nargs='+', default=list(tr.STAGING_FORMATS))
+    args = parser.parse_args()
+
+    pprint.title(f'Benchmark : Staging formats | {args.rows} rows')
+    frames: dict[str, pd.DataFrame] = {
+        '010_prints': trsf.arrow_json_normalize(table=extr.cast_table(table=synthetic_prints(rows=args.rows))),
+        '010_taps': trsf.arrow_json_normalize(table=extr.cast_table(table=synthetic_prints(rows=args.rows // 5, seed=1))),
+        '010_pays': extr.to_pandas(table=extr.cast_table(table=synthetic_pays(rows=args.rows // 10))),
+    }
+    results: list[dict[str, object]] = []
+    with tempfile.TemporaryDirectory() as folder:
+        for name, df in frames.items():
+            for fmt in args.formats:
+                _, t_write = timed(lambda: tr.to_parquet(array=((df, name),), file_path=folder, fmt=fmt))
+                path_file: str = tr.get_parquet_path(file_path=folder, name=name)
+                df_read, t_read = timed(lambda: extr.load_parquet(file_path=path_file))
+                pd.testing.assert_frame_equal(df, df_read)
+                results.append({
+                    'file': name,
+                    'format': fmt,
+                    'write_s': t_write.total_seconds(),
+                    'read_s': t_read.total_seconds(),
+                    'size_mb': os.path.getsize(path_file) / 1024 ** 2,
+                })
+
+    pprint.success('Same output with every format')
+    print(pd.DataFrame(results).round(3).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark of the json normalization step, pandas `json_normalize` against the
+arrow columnar normalizer, over a synthetic prints file, and the memory of the
+normalized dataframe with and without the schema of the sources.
+
+Usage:
+    python -m benchmarks.bench_normalize --rows 10000000
+"""
+import argparse
+import os
+import tempfile
+import pandas as pd
+import pyarrow.parquet as pq
+from benchmarks.synthetic import synthetic_prints, timed
+from etl.extr import extraction as extr
+from etl.trsf import transform as trsf
+from etl.utils import pprint
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    pprint.title(f'Benchmark : Normalize | {args.rows} rows')
+    with tempfile.TemporaryDirectory() as folder:
+        path_file: str = os.path.join(folder, 'prints.parquet.gzip')
+        pq.write_table(synthetic_prints(rows=args.rows), path_file, compression='gzip')
+
+        df_pandas, t_pandas = timed(
+            lambda: trsf.pdjson_normalize(df=extr.load_parquet(file_path=path_file))
+        )
+        pprint.time(f'pandas json_normalize : {t_pandas}')
+
+        df_arrow, t_arrow = timed(
+            lambda: trsf.arrow_json_normalize(table=extr.load_parquet_table(file_path=path_file))
+        )
+        pprint.time(f'arrow normalize       : {t_arrow}')
+
+        df_typed, t_typed = timed(
+            lambda: trsf.arrow_json_normalize(table=extr.cast_table(table=extr.load_parquet_table(file_path=path_file)))
+        )
+        pprint.time(f'arrow normalize typed : {t_typed}')
+
+    pd.testing.assert_frame_equal(df_pandas, df_arrow, check_dtype=False)
+    pprint.success(f'Same output, speedup x{t_pandas / t_arrow:.1f}')
+
+    mb_pandas: float = df_pandas.memory_usage(deep=True).sum() / 1024 ** 2
+    mb_typed: float = df_typed.memory_usage(deep=True).sum() / 1024 ** 2
+    pprint.info(f'memory {mb_pandas:.1f} MB -> {mb_typed:.1f} MB with the schema, x{mb_pandas / mb_typed:.1f} smaller')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Benchmark of the steps of the pipelines over synthetic sources, the time of every
+step is saved in 'benchmarks/results/<rows>/<commit>.json' and compared with the
+results of a previous commit, the benchmark fails when a step is slower than the
+baseline by more than the threshold.
+
+Usage:
+    python -m benchmarks.bench_pipeline --rows 1000000
+    python -m benchmarks.bench_pipeline --rows 1000000 --baseline benchmarks/results/1000000/ac5f72b.json
+"""
+import argparse
+import contextlib
+import datetime as dt
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import pandas as pd
+import pyarrow as pa
+from typing import Any, Callable
+from benchmarks.synthetic import write_sources
+from pipeline import (
+    pipe_extr as pextr,
+    pipe_trsf as ptrsf,
+)
+from etl.utils import pprint
+
+
+REPO: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS: str = os.path.join(REPO, 'benchmarks', 'results')
+TO_GROUP: tuple[tuple[str, list[str], str], ...] = (
+    ('022_021_010_taps', ['user_id', 'day', 'event_data_value_prop'], 'count'),
+    ('022_021_010_pays', ['user_id', 'pay_date', 'value_prop'], 'sum'),
+    ('021_010_prints', ['user_id', 'day', 'event_data_value_prop', 'event_data_position'], 'count'),
+)
+
+
+def export() -> None:
+    """ Export the processed CSV files as `ptrsf.run` does """
+    ptrsf.export_csv(name='030_022_021_010_taps', path='data/processed/taps.csv')
+    ptrsf.export_csv(name='030_022_021_010_pays', path='data/processed/pays.csv')
+    ptrsf.export_csv(name='021_010_prints', path='data/processed/prints.csv')
+    ptrsf.export_csv(name='040_features', path='data/processed/features.csv')
+
+
+STEPS: dict[str, Callable[[], Any]] = {
+    'extract': pextr.run,
+    'normalize': functools.partial(ptrsf.step_normalize, to_norm=('prints', 'taps', 'pays')),
+    'filter': lambda: (
+        ptrsf.filter_last_weeks(to_norm=('010_prints',), weeks=ptrsf.WEEKS['prints']),
+        ptrsf.filter_last_weeks(to_norm=('010_taps', '010_pays'), weeks=ptrsf.WEEKS['taps']),
+    ),
+    'user_filter': functools.partial(
+        ptrsf.filter_by_values,
+        to_filter=('021_010_taps', '021_010_pays'),
+        filter_from='021_010_prints',
+    ),
+    'grouping': functools.partial(ptrsf.step_grouping, to_group=TO_GROUP),
+    'features': lambda: ptrsf.step_features(weeks=ptrsf.WEEKS['taps'], last_weeks=ptrsf.WEEKS['prints']),
+    'export': export,
+}
+
+
+def get_commit() -> str:
+    """ Get the short hash of the current commit, with '-dirty' if the tree has changes """
+    try:
+        commit: str = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, text=True).strip()
+        dirty: str = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty.strip() else commit
+
+
+def run_steps(*, steps: list[str], repeat: int) -> dict[str, float]:
+    """
+    Run the steps in order in the current folder, every step runs `repeat` times
+    and its best time is kept, the console output of the steps is discarded
+
+    Parameters
+    ----------
+    steps: list[str]
+        The names of the steps, keys of `STEPS`
+    repeat: int
+        The number of runs of every step
+
+    Returns
+    -------
+    dict[str, float]
+        The best time of every step in seconds
+    """
+    times: dict[str, float] = {}
+    for step in steps:
+        best: float = float('inf')
+        for _ in range(repeat):
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start: float = time.perf_counter()
+                STEPS[step]()
+                best = min(best, time.perf_counter() - start)
+        times[step] = best
+        pprint.time(f'{step:<12} {best:.3f} s')
+    return times
+
+
+def find_baseline(*, folder: str, exclude: str) -> str | None:
+    """ Get the newest results file of a folder, other than the excluded one """
+    if not os.path.isdir(folder):
+        return None
+    files: list[str] = [
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.endswith('.json') and os.path.join(folder, name) != exclude
+    ]
+    return max(files, key=os.path.getmtime) if files else None
+
+
+def compare(
+        *,
+        current: dict[str, float],
+        baseline: dict[str, float],
+        threshold: float,
+        min_seconds: float,
+    ) -> list[str]:
+    """
+    Compare the times of the steps with the ones of the baseline
+
+    Parameters
+    ----------
+    current: dict[str, float]
+        The time of every step
+    baseline: dict[str, float]
+        The time of every step in the baseline
+    threshold: float
+        The slowdown allowed, e.g. 0.2 for 20%
+    min_seconds: float
+        The slowdowns smaller than this are noise and never regressions
+
+    Returns
+    -------
+    list[str]
+        The names of the steps that regressed
+    """
+    rows: list[dict[str, Any]] = []
+    regressions: list[str] = []
+    for step, seconds in current.items():
+        base: float | None = baseline.get(step)
+        regressed: bool = base is not None and seconds > base * (1 + threshold) and seconds - base > min_seconds
+        if regressed:
+            regressions.append(step)
+        rows.append({
+            'step': step,
+            'baseline_s': base,
+            'current_s': seconds,
+            'change': f'{seconds / base - 1:+.1%}' if base else '',
+            'regressed': regressed,
+        })
+    print(pd.DataFrame(rows).round(3).to_string(index=False))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--steps', nargs='+', default=list(STEPS), choices=list(STEPS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=None, help='results file to compare with, by default the newest one')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--min-seconds', type=float, default=0.05)
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    commit: str = get_commit()
+    folder: str = os.path.join(RESULTS, str(args.rows))
+    output: str = os.path.join(folder, f'{commit}.json')
+    pprint.title(f'Benchmark : Pipeline | {args.rows} prints | commit {commit}')
+
+    cwd: str = os.getcwd()
+    with tempfile.TemporaryDirectory() as work:
+        for layer in ('external', 'raw', 'staging', 'processed'):
+            os.makedirs(os.path.join(work, 'data', layer))
+        counts: dict[str, int] = write_sources(folder=os.path.join(work, 'data', 'external'), rows=args.rows, seed=args.seed)
+        pprint.info(f'sources: {counts}')
+        os.chdir(work)
+        try:
+            times: dict[str, float] = run_steps(steps=args.steps, repeat=args.repeat)
+        finally:
+            os.chdir(cwd)
+
+    results: dict[str, Any] = {
+        'commit': commit,
+        'date': dt.datetime.now().isoformat(timespec='seconds'),
+        'rows': counts,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'versions': {'python': platform.python_version(), 'pandas': pd.__version__, 'pyarrow': pa.__version__},
+        'steps': times,
+    }
+    baseline_path: str | None = args.baseline or find_baseline(folder=folder, exclude=output)
+    if not args.no_save:
+        os.makedirs(folder, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+        pprint.success(f'results saved in {{ {output} }}')
+
+    if baseline_path is None:
+        pprint.warning('No baseline to compare with')
+        return
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline: dict[str, Any] = json.load(file)
+    pprint.info(f'baseline: commit {baseline["commit"]} {{ {baseline_path} }}')
+    regressions: list[str] = compare(
+        current=times,
+        baseline=baseline['steps'],
+        threshold=args.threshold,
+        min_seconds=args.min_seconds,
+    )
+    if regressions:
+        pprint.error(f'Steps slower than the baseline by more than {args.threshold:.0%}: {regressions}')
+        sys.exit(1)
+    pprint.success('No regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+Synthetic data with the same schema as the raw files, shared by the benchmarks.
+
+The sources of the pipelines, `prints.json`, `taps.json` and `pays.csv`, can be
+generated in a folder, e.g. to run the pipelines without the private data:
+
+Usage:
+    python -m benchmarks.synthetic --rows 1000000 --folder data/external
+"""
+import argparse
+import os
+import numpy as np
+import pyarrow as pa
+from datetime import datetime
+from etl.utils import pprint
+
+
+VALUE_PROPS: tuple[str, ...] = (
+    'cellphone_recharge', 'credits_consumer', 'link_cobro',
+    'point', 'prepaid', 'send_money', 'transport',
+)
+VALUE_PROP_WEIGHTS: tuple[float, ...] = (0.08, 0.12, 0.05, 0.30, 0.10, 0.20, 0.15)
+TAP_RATES: tuple[float, ...] = (0.10, 0.20, 0.05, 0.12, 0.08, 0.15, 0.10)
+PAY_RATES: tuple[float, ...] = (0.60, 0.20, 0.30, 0.40, 0.50, 0.35, 0.70)
+PAY_MEANS: tuple[float, ...] = (3.0, 6.0, 4.0, 3.5, 3.0, 4.5, 1.5)
+POSITION_WEIGHTS: tuple[float, ...] = (0.4, 0.3, 0.2, 0.1)
+FIRST_DAY: np.datetime64 = np.datetime64('2020-11-01')
+
+
+def synthetic_prints(*, rows: int, seed: int = 0) -> pa.Table:
+    """
+    Build a synthetic prints table with the same schema as the raw prints parquet,
+    the taps have the same schema
+
+    Parameters
+    ----------
+    rows: int
+        Number of rows of the table
+    seed: int, Optional
+        Seed of the random generator, by default 0
+
+    Returns
+    -------
+    pa.Table
+        An arrow table with the columns day, event_data{position, value_prop} and user_id
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    days: np.ndarray = np.datetime64('2020-11-01') + rng.integers(0, 30, rows).astype('timedelta64[D]')
+    event_data: pa.StructArray = pa.StructArray.from_arrays(
+        [
+            pa.array(rng.integers(0, 4, rows)),
+            pa.array(np.array(VALUE_PROPS, dtype=object)[rng.integers(0, len(VALUE_PROPS), rows)]),
+        ],
+        names=['position', 'value_prop'],
+    )
+    table: pa.Table = pa.table({
+        'day': pa.array(days.astype(str)),
+        'event_data': event_data,
+        'user_id': pa.array(rng.integers(1, 100_000, rows)),
+    })
+    return table
+
+
+def synthetic_pays(*, rows: int, seed: int = 0) -> pa.Table:
+    """
+    Build a synthetic pays table with the same schema as the raw pays parquet
+
+    Parameters
+    ----------
+    rows: int
+        Number of rows of the table
+    seed: int, Optional
+        Seed of the random generator, by default 0
+
+    Returns
+    -------
+    pa.Table
+        An arrow table with the columns pay_date, total, user_id and value_prop
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    days: np.ndarray = np.datetime64('2020-11-01') + rng.integers(0, 30, rows).astype('timedelta64[D]')
+    table: pa.Table = pa.table({
+        'pay_date': pa.array(days.astype(str)),
+        'total': pa.array(np.round(rng.random(rows) * 100, 2)),
+        'user_id': pa.array(rng.integers(1, 100_000, rows)),
+        'value_prop': pa.array(np.array(VALUE_PROPS, dtype=object)[rng.integers(0, len(VALUE_PROPS), rows)]),
+    })
+    return table
+
+
+def _user_cdf(*, users: int, skew: float, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """ Get the ids of the users in random order and the cumulative distribution of their zipf activity """
+    weights: np.ndarray = 1 / np.arange(1, users + 1) ** skew
+    ids: np.ndarray = rng.permutation(users) + 1
+    return ids, np.cumsum(weights) / weights.sum()
+
+
+def _events_lines(*, days: np.ndarray, positions: np.ndarray, value_props: np.ndarray, user_ids: np.ndarray) -> str:
+    """ Format the events as json lines with the nested `event_data` of the sources """
+    return ''.join(
+        f'{{"day": "{day}", "event_data": {{"position": {position}, "value_prop": "{value_prop}"}}, "user_id": {user_id}}}\n'
+        for day, position, value_prop, user_id in zip(days.tolist(), positions.tolist(), value_props.tolist(), user_ids.tolist())
+    )
+
+
+def write_sources(
+        *,
+        folder: str,
+        rows: int,
+        seed: int = 0,
+        days: int = 30,
+        users: int | None = None,
+        skew: float = 1.1,
+        chunk_size: int = 1_000_000,
+    ) -> dict[str, int]:
+    """
+    Generate the sources of the pipelines, `prints.json`, `taps.json` and `pays.csv`,
+    the same seed and chunk size always generate the same files
+
+    The users follow a zipf activity and the value props and positions have fixed
+    weights. The taps are drawn from the prints with a rate by value prop that
+    decreases with the position, and the pays from the taps with a rate by value
+    prop, paid the same day or up to 2 days later, with log-normal totals.
+
+    Parameters
+    ----------
+    folder: str
+        Path of the folder where the files are written
+    rows: int
+        Number of prints, the files are written by chunks so any size fits in memory
+    seed: int, Optional
+        Seed of the random generator, by default 0
+    days: int, Optional
+        Number of days of the prints starting at 2020-11-01, by default 30
+    users: int | None, Optional
+        Number of users, by default one for every 50 prints, at least 100
+    skew: float, Optional
+        Exponent of the zipf activity of the users, by default 1.1
+    chunk_size: int, Optional
+        Number of prints generated at once, by default 1_000_000
+
+    Returns
+    -------
+    dict[str, int]
+        The number of rows of every file
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    ids, cdf = _user_cdf(users=users or max(rows // 50, 100), skew=skew, rng=rng)
+    value_props: np.ndarray = np.array(VALUE_PROPS)
+    os.makedirs(folder, exist_ok=True)
+    counts: dict[str, int] = {'prints': 0, 'taps': 0, 'pays': 0}
+    with (
+        open(os.path.join(folder, 'prints.json'), 'w', encoding='utf-8') as prints,
+        open(os.path.join(folder, 'taps.json'), 'w', encoding='utf-8') as taps,
+        open(os.path.join(folder, 'pays.csv'), 'w', encoding='utf-8') as pays,
+    ):
+        pays.write('pay_date,total,user_id,value_prop\n')
+        for chunk, start in enumerate(range(0, rows, chunk_size)):
+            size: int = min(chunk_size, rows - start)
+            chunk_rng: np.random.Generator = np.random.default_rng([seed, chunk])
+            day: np.ndarray = np.sort(chunk_rng.integers(0, days, size))
+            user_id: np.ndarray = ids[np.minimum(np.searchsorted(cdf, chunk_rng.random(size)), len(ids) - 1)]
+            value_prop: np.ndarray = chunk_rng.choice(len(VALUE_PROPS), size, p=VALUE_PROP_WEIGHTS)
+            position: np.ndarray = chunk_rng.choice(len(POSITION_WEIGHTS), size, p=POSITION_WEIGHTS)
+            dates: np.ndarray = (FIRST_DAY + day.astype('timedelta64[D]')).astype(str)
+            prints.write(_events_lines(days=dates, positions=position, value_props=value_props[value_prop], user_ids=user_id))
+
+            tapped: np.ndarray = chunk_rng.random(size) < np.array(TAP_RATES)[value_prop] / (1 + position)
+            taps.write(_events_lines(
+                days=dates[tapped],
+                positions=position[tapped],
+                value_props=value_props[value_prop[tapped]],
+                user_ids=user_id[tapped],
+            ))
+
+            paid: np.ndarray = np.flatnonzero(tapped)
+            paid = paid[chunk_rng.random(len(paid)) < np.array(PAY_RATES)[value_prop[paid]]]
+            pay_day: np.ndarray = np.minimum(day[paid] + chunk_rng.integers(0, 3, len(paid)), days - 1)
+            total: np.ndarray = np.round(chunk_rng.lognormal(np.array(PAY_MEANS)[value_prop[paid]], 0.8), 2)
+            pays.write(''.join(
+                f'{pay_date},{amount},{user},{prop}\n'
+                for pay_date, amount, user, prop in zip(
+                    (FIRST_DAY + pay_day.astype('timedelta64[D]')).astype(str).tolist(),
+                    total.tolist(),
+                    user_id[paid].tolist(),
+                    value_props[value_prop[paid]].tolist(),
+                )
+            ))
+            counts['prints'] += size
+            counts['taps'] += int(tapped.sum())
+            counts['pays'] += len(paid)
+    return counts
+
+
+def timed(func):
+    """ Run a function without arguments and return its result and elapsed time """
+    start = datetime.now()
+    result = func()
+    return result, datetime.now() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--folder', default='data/external')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args()
+
+    counts, elapsed = timed(lambda: write_sources(folder=args.folder, rows=args.rows, seed=args.seed, days=args.days))
+    pprint.success(f'Sources written in {{ {args.folder} }} in {elapsed}: {counts}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,211 @@
+import collections
+import json
+import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.json as pajson
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator
+from etl.utils import (
+    database as db,
+    storage,
+)
+
+
+# Types of the columns of the sources, by their normalized name, e.g. the `position`
+# field of the `event_data` struct is `event_data_position`, the integers and the
+# indices of the dictionaries are widened when the values of a source do not fit
+SCHEMA: dict[str, pa.DataType] = {
+    'day': pa.date32(),
+    'pay_date': pa.date32(),
+    'user_id': pa.int32(),
+    'total': pa.float64(),
+    'value_prop': pa.dictionary(pa.int8(), pa.string()),
+    'event_data_position': pa.int8(),
+    'event_data_value_prop': pa.dictionary(pa.int8(), pa.string()),
+}
+INT_TYPES: tuple[pa.DataType, ...] = (pa.int8(), pa.int16(), pa.int32(), pa.int64())
+JSON_BLOCK_SIZE: int = 16 << 20
+PANDAS_TYPES: dict[pa.DataType, Any] = {
+    pa.date32(): pd.ArrowDtype(pa.date32()),
+    pa.string(): pd.StringDtype('pyarrow'),
+    pa.large_string(): pd.StringDtype('pyarrow'),
+}
+
+
+def _fit_int(*, data_type: pa.DataType, low: int, high: int) -> pa.DataType:
+    """ Get the narrowest signed integer type, at least as wide as the given one, that holds a range of values """
+    return next(
+        (
+            candidate for candidate in INT_TYPES
+            if candidate.bit_width >= data_type.bit_width and -(1 << candidate.bit_width - 1) <= low and high < 1 << candidate.bit_width - 1
+        ),
+        pa.int64(),
+    )
+
+
+def fit_type(*, array: pa.ChunkedArray, data_type: pa.DataType) -> pa.DataType:
+    """
+    Widen a signed integer type, or the indices of a dictionary type, until the
+    values of a column fit in it, from their minimum and maximum or from their
+    number of distinct values
+
+    Parameters
+    ----------
+    array: pa.ChunkedArray
+        The values of the column
+    data_type: pa.DataType
+        The type of the column in the schema
+
+    Returns
+    -------
+    pa.DataType
+        The type, the given one if the values fit in it
+    """
+    if pa.types.is_dictionary(data_type) and pa.types.is_signed_integer(data_type.index_type):
+        if pa.types.is_dictionary(array.type):
+            values: pa.Array = pa.concat_arrays([chunk.dictionary for chunk in array.chunks]) if array.num_chunks else pa.array([])
+            count: int = len(values.unique())
+        else:
+            count: int = pc.count_distinct(array).as_py()
+        return pa.dictionary(_fit_int(data_type=data_type.index_type, low=0, high=max(0, count - 1)), data_type.value_type)
+    if pa.types.is_signed_integer(data_type) and (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)):
+        low, high = pc.min_max(array).values()
+        if low.as_py() is None:
+            return data_type
+        return _fit_int(data_type=data_type, low=int(low.as_py()), high=int(high.as_py()))
+    return data_type
+
+
+def wide_type(data_type: pa.DataType) -> pa.DataType:
+    """ Get the widest type of a column of the schema, int64 for the signed integers and int32 indices for the dictionaries """
+    if pa.types.is_dictionary(data_type) and pa.types.is_signed_integer(data_type.index_type):
+        return pa.dictionary(pa.int32() if data_type.index_type.bit_width <= 32 else data_type.index_type, data_type.value_type)
+    if pa.types.is_signed_integer(data_type):
+        return pa.int64()
+    return data_type
+
+
+def _schema_type(*, name: str, array: pa.ChunkedArray, schema: dict[str, pa.DataType], sep: str, fit: bool) -> pa.DataType:
+    """ Get the type of a column in the schema, the fields of the structs are looked up by their normalized name """
+    if pa.types.is_struct(array.type):
+        return pa.struct([
+            pa.field(field.name, _schema_type(name=f'{name}{sep}{field.name}', array=child, schema=schema, sep=sep, fit=fit))
+            for field, child in zip(array.type, array.flatten())
+        ])
+    if name not in schema:
+        return array.type
+    return fit_type(array=array, data_type=schema[name]) if fit else wide_type(schema[name])
+
+
+def cast_table(*, table: pa.Table, schema: dict[str, pa.DataType] = SCHEMA, sep: str = '_', fit: bool = True) -> pa.Table:
+    """
+    Cast the columns of an arrow table to the types of a schema, the columns that
+    are not in the schema keep their type and the integers that do not fit in the
+    type of the schema are widened, see `fit_type`. The chunks of a stream are cast
+    with `fit=False`, the types of a chunk then do not depend on its values, so all
+    the chunks of a file have the same schema
+
+    Parameters
+    ----------
+    table: pa.Table
+        The table to cast
+    schema: dict[str, pa.DataType], Optional
+        The types of the columns by their normalized name, by default `SCHEMA`
+    sep: str, Optional
+        The separator between the names of a struct and its fields, by default '_'
+    fit: bool, Optional
+        If the integers take the narrowest type their values fit in, otherwise they
+        take the widest one, see `wide_type`, by default True
+
+    Returns
+    -------
+    pa.Table
+        The table with the types of the schema
+    """
+    target: pa.Schema = pa.schema(
+        [
+            pa.field(field.name, _schema_type(name=field.name, array=table.column(field.name), schema=schema, sep=sep, fit=fit))
+            for field in table.schema
+        ],
+        metadata=table.schema.metadata,
+    )
+    table_cast: pa.Table = table.cast(target)
+    return table_cast
+
+
+def to_pandas(*, table: pa.Table) -> pd.DataFrame:
+    """
+    Convert an arrow table to a pandas dataframe keeping the compact types, the dates
+    and strings are backed by arrow and the dictionaries are categoricals whose
+    categories are sorted, so grouping by them gives the same order as the strings
+
+    Parameters
+    ----------
+    table: pa.Table
+        The table to convert
+
+    Returns
+    -------
+    pd.DataFrame
+        A pandas dataframe with the data from the table
+    """
+    df: pd.DataFrame = table.to_pandas(types_mapper=PANDAS_TYPES.get)
+    for column in df.columns[[isinstance(dtype, pd.CategoricalDtype) for dtype in df.dtypes]]:
+        df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+    return df
+
+
+def drop_pandas_index(*, table: pa.Table) -> pa.Table:
+    """
+    Drop the columns of a table that hold the index of the pandas dataframe it was
+    saved from, e.g. '__index_level_0__', so they are not taken as data
+
+    Parameters
+    ----------
+    table: pa.Table
+        The table read from a file saved by pandas
+
+    Returns
+    -------
+    pa.Table
+        The table without the index columns
+    """
+    metadata: dict[str, Any] | None = table.schema.pandas_metadata
+    if metadata is None:
+        return table
+    index: list[str] = [column for column in metadata.get('index_columns', []) if isinstance(column, str)]
+    return table.drop_columns([column for column in index if column in table.column_names])
+
+
+def apply_schema(*, df: pd.DataFrame, schema: dict[str, pa.DataType] = SCHEMA, fit: bool = True) -> pd.DataFrame:
+    """
+    Cast the columns of a dataframe to the types of a schema, the values are parsed
+    once here, e.g. the dates, so the next steps do not work with python strings
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The dataframe to cast
+    schema: dict[str, pa.DataType], Optional
+        The types of the columns by their normalized name, by default `SCHEMA`
+    fit: bool, Optional
+        If the integers take the narrowest type their values fit in, False for the
+        chunks of a stream, see `cast_table`, by default True
+
+    Returns
+    -------
+    pd.DataFrame
+        A pandas dataframe with the types of the schema
+    """
+    table: pa.Table = cast_table(table=pa.Table.from_pandas(df, preserve_index=False), schema=schema, fit=fit)
+    df_cast: pd.DataFrame = to_pandas(table=table)
+    return df_cast
 
 
 def load_csv(*, file_path: str, delimeter: str = ',') -> pd.DataFrame:
@@ -17,10 +224,32 @@ def load_csv(*, file_path: str, delimeter: str = ',') -> pd.DataFrame:
     pd.DataFrame
         A pandas dataframe with the data from the csv file
     """
-    df: pd.DataFrame = pd.read_csv(file_path, delimiter=delimeter)
+    df: pd.DataFrame = pd.read_csv(storage.local_path(file_path), delimiter=delimeter)
     return df
 
 
+def load_csv_table(*, file_path: str, delimeter: str = ',') -> pa.Table:
+    """
+    Reads a csv file with the multithreaded reader of arrow, which releases the GIL
+    while it parses, so other files can be read by other threads at the same time
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file
+    delimeter: str
+        The delimeter of the file
+
+    Returns
+    -------
+    pa.Table
+        An arrow table with the data from the csv file, with the types inferred by arrow
+    """
+    with storage.open_input_stream(file_path) as stream:
+        table: pa.Table = csv.read_csv(stream, parse_options=csv.ParseOptions(delimiter=delimeter))
+    return table
+
+
 def load_json(*, file_path: str, multi_json: bool = False) -> pd.DataFrame:
     """
     Reads a json file and returns a pandas dataframe
@@ -37,24 +266,707 @@ def load_json(*, file_path: str, multi_json: bool = False) -> pd.DataFrame:
     pd.DataFrame
         A pandas dataframe with the data from the json file
     """
-    df: pd.DataFrame = pd.read_json(file_path) if not multi_json else pd.read_json(file_path, lines=True)
+    path: str = storage.local_path(file_path)
+    df: pd.DataFrame = pd.read_json(path) if not multi_json else pd.read_json(path, lines=True)
     return df
 
 
-def load_parquet(*, file_path: str) -> pd.DataFrame:
+def iter_json_blocks(*, file_path: str, block_size: int = JSON_BLOCK_SIZE, offset: int = 0) -> Iterator[pa.Buffer]:
     """
-    Reads a parquet file and returns a pandas dataframe
+    Reads a json lines file in blocks of whole lines, the compressed files, e.g.
+    '.json.gz' or '.json.zst', are decompressed while they are read
 
     Parameters
     ----------
     file_path: str
-        The path of the file
+        The path of the file, its compression is detected from its extension
+    block_size: int
+        The number of bytes read per block, a block ends at the last newline of the
+        bytes read, by default 16 MiB
+    offset: int
+        The offset of the first line to read in the decompressed file, the plain files
+        are read from it and the bytes before it are skipped in the compressed ones,
+        by default 0
+
+    Yields
+    ------
+    pa.Buffer
+        The bytes of a block of lines, the blocks are contiguous
+    """
+    if offset and not storage.is_compressed(file_path):
+        stream: pa.NativeFile = storage.open_input_file(file_path)
+        stream.seek(offset)
+    else:
+        stream: pa.NativeFile = storage.open_input_stream(file_path)
+        skipped: int = 0
+        while skipped < offset:
+            data: bytes = stream.read(min(block_size, offset - skipped))
+            if not data:
+                break
+            skipped += len(data)
+    with stream:
+        rest: bytes = b''
+        while True:
+            data: bytes = stream.read(block_size)
+            if not data:
+                break
+            end: int = data.rfind(b'\n') + 1
+            if end == 0:
+                rest += data
+                continue
+            yield pa.py_buffer(rest + data[:end])
+            rest = data[end:]
+        if rest.strip():
+            yield pa.py_buffer(rest)
+
+
+def _parse_json_block(block: pa.Buffer) -> pa.Table:
+    """ Parse a block of json lines, with the types inferred from the block """
+    return pajson.read_json(
+        pa.BufferReader(block),
+        read_options=pajson.ReadOptions(use_threads=False, block_size=block.size + 1),
+    )
+
+
+def _conform_array(array: pa.Array, data_type: pa.DataType) -> pa.Array:
+    """ Cast an array to a type, the fields missing in its structs are filled with nulls """
+    if array.type == data_type:
+        return array
+    if pa.types.is_struct(array.type) and pa.types.is_struct(data_type):
+        children: dict[str, pa.Array] = dict(zip((field.name for field in array.type), array.flatten()))
+        return pa.StructArray.from_arrays(
+            [
+                _conform_array(children[field.name], field.type) if field.name in children
+                else pa.nulls(len(array), field.type)
+                for field in data_type
+            ],
+            fields=list(data_type),
+            mask=array.is_null(),
+        )
+    return array.cast(data_type)
+
+
+def conform_table(*, table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """
+    Cast a table to a wider schema, e.g. the schema unified from the blocks of a json
+    lines file, the columns and struct fields it does not have are filled with nulls
+
+    Parameters
+    ----------
+    table: pa.Table
+        The table to cast
+    schema: pa.Schema
+        The schema, with all the columns and struct fields of the table
+
+    Returns
+    -------
+    pa.Table
+        The table with the schema
+    """
+    columns: list[pa.ChunkedArray] = [
+        pa.chunked_array(
+            [_conform_array(chunk, field.type) for chunk in table.column(field.name).chunks],
+            type=field.type,
+        )
+        if field.name in table.column_names else pa.nulls(table.num_rows, field.type)
+        for field in schema
+    ]
+    table_conform: pa.Table = pa.table(columns, schema=schema)
+    return table_conform
+
+
+def concat_tables(*, tables: list[pa.Table]) -> pa.Table:
+    """
+    Concatenate the tables of the blocks of a json lines file, or the chunks made of
+    them, with the schema of the last one, which is the widest
+
+    Parameters
+    ----------
+    tables: list[pa.Table]
+        The tables, in the order of the file
+
+    Returns
+    -------
+    pa.Table
+        The concatenated table
+    """
+    table_concat: pa.Table = pa.concat_tables([conform_table(table=table, schema=tables[-1].schema) for table in tables])
+    return table_concat
+
+
+def iter_json_tables(
+        *,
+        file_path: str,
+        block_size: int = JSON_BLOCK_SIZE,
+        workers: int | None = None,
+        offset: int = 0,
+    ) -> Iterator[tuple[pa.Table, int]]:
+    """
+    Reads a json lines file as a stream of tables in the order of the file, one per
+    block of lines, the blocks are parsed by arrow in a thread pool, which releases
+    the GIL, while the next blocks are read and decompressed
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, its compression is detected from its extension
+    block_size: int
+        The number of bytes of every block of lines, by default 16 MiB
+    workers: int | None
+        The number of blocks parsed at the same time, by default the number of cores
+    offset: int
+        The offset of the first line to read in the decompressed file, by default 0
+
+    Yields
+    ------
+    tuple[pa.Table, int]
+        The table of every block, with the schema unified from the types inferred in
+        the blocks read so far, so a column that is null in the first blocks or that
+        only appears in a later block keeps its values, and the offset of the end of
+        the block in the decompressed file
+    """
+    workers = workers or os.cpu_count() or 1
+    blocks: Iterator[pa.Buffer] = iter_json_blocks(file_path=file_path, block_size=block_size, offset=offset)
+    first: pa.Buffer | None = next(blocks, None)
+    if first is None:
+        return
+    offset += first.size
+    table: pa.Table = _parse_json_block(first)
+    schema: pa.Schema = table.schema
+    yield table, offset
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending: collections.deque = collections.deque()
+        for block in blocks:
+            offset += block.size
+            pending.append((pool.submit(_parse_json_block, block), offset))
+            if len(pending) > workers:
+                future, end = pending.popleft()
+                table = future.result()
+                schema = pa.unify_schemas([schema, table.schema], promote_options='permissive')
+                yield conform_table(table=table, schema=schema), end
+        while pending:
+            future, end = pending.popleft()
+            table = future.result()
+            schema = pa.unify_schemas([schema, table.schema], promote_options='permissive')
+            yield conform_table(table=table, schema=schema), end
+
+
+def iter_json_batches(
+        *,
+        file_path: str,
+        block_size: int = JSON_BLOCK_SIZE,
+        workers: int | None = None,
+    ) -> Iterator[pa.RecordBatch]:
+    """
+    Reads a json lines file as a stream of record batches in the order of the file,
+    the blocks of lines are parsed in parallel by `iter_json_tables`
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, its compression is detected from its extension
+    block_size: int
+        The number of bytes of every block of lines, by default 16 MiB
+    workers: int | None
+        The number of blocks parsed at the same time, by default the number of cores
+
+    Yields
+    ------
+    pa.RecordBatch
+        The record batches, with the schema unified from the blocks read so far, so
+        the schema of a batch can be wider than the one of the batches before it
+    """
+    for table, _ in iter_json_tables(file_path=file_path, block_size=block_size, workers=workers):
+        yield from table.to_batches()
+
+
+def load_json_table(*, file_path: str, block_size: int = JSON_BLOCK_SIZE, workers: int | None = None) -> pa.Table:
+    """
+    Reads a json lines file, plain or compressed, with its blocks parsed in parallel
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, its compression is detected from its extension
+    block_size: int
+        The number of bytes of every block of lines, by default 16 MiB
+    workers: int | None
+        The number of blocks parsed at the same time, by default the number of cores
+
+    Returns
+    -------
+    pa.Table
+        An arrow table with the data from the json file, with the types inferred by arrow
+    """
+    tables: list[pa.Table] = [table for table, _ in iter_json_tables(file_path=file_path, block_size=block_size, workers=workers)]
+    table: pa.Table = concat_tables(tables=tables) if tables else pa.table({})
+    return table
+
+
+def iter_json_chunks(*, file_path: str, chunk_size: int = 1_000_000) -> Iterator[pa.Table]:
+    """
+    Reads a json lines file in chunks, so only one chunk is kept in memory at a time,
+    the lines are parsed in parallel by `iter_json_tables` and the chunks are kept as
+    arrow tables, so their structs are never converted to python objects
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, plain or compressed
+    chunk_size: int
+        The number of lines to read per chunk, by default 1_000_000
+
+    Yields
+    ------
+    pa.Table
+        An arrow table with at most `chunk_size` rows from the json file
+    """
+    pending: list[pa.Table] = []
+    rows: int = 0
+    for table, _ in iter_json_tables(file_path=file_path):
+        pending.append(table)
+        rows += table.num_rows
+        while rows >= chunk_size:
+            table = concat_tables(tables=pending)
+            yield table.slice(0, chunk_size)
+            pending, rows = [table.slice(chunk_size)], rows - chunk_size
+    if rows:
+        yield concat_tables(tables=pending)
+
+
+def iter_json_offset_chunks(
+        *,
+        file_path: str,
+        chunk_size: int = 1_000_000,
+        block_size: int = JSON_BLOCK_SIZE,
+        offset: int = 0,
+    ) -> Iterator[tuple[pa.Table, int]]:
+    """
+    Reads a json lines file in chunks of whole blocks of lines, with the offset in
+    the file where every chunk ends, so a read can be resumed after any chunk, the
+    chunks are kept as arrow tables
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, plain or compressed
+    chunk_size: int
+        The minimum number of lines of every chunk but the last one, the blocks are
+        never split, by default 1_000_000
+    block_size: int
+        The number of bytes of every block of lines, by default 16 MiB
+    offset: int
+        The offset of the first line to read in the decompressed file, by default 0
+
+    Yields
+    ------
+    tuple[pa.Table, int]
+        An arrow table with the lines of the chunk and the offset of its end
+    """
+    pending: list[pa.Table] = []
+    rows: int = 0
+    for table, end in iter_json_tables(file_path=file_path, block_size=block_size, offset=offset):
+        pending.append(table)
+        rows += table.num_rows
+        if rows >= chunk_size:
+            yield concat_tables(tables=pending), end
+            pending, rows = [], 0
+    if pending:
+        yield concat_tables(tables=pending), end
+
+
+def iter_sql_chunks(
+        *,
+        query: str,
+        url: str,
+        chunk_size: int = 100_000,
+        params: tuple[Any, ...] | None = None,
+    ) -> Iterator[pd.DataFrame]:
+    """
+    Reads the result of a SQL query in chunks, with the record batches of ADBC when
+    the connection is an ADBC one and otherwise with the chunks of `pd.read_sql`,
+    the connection is taken from the pool of the database until the last chunk is read
+
+    Parameters
+    ----------
+    query: str
+        The SQL query
+    url: str
+        The url of the database, e.g. 'sqlite:///data/external/meli.db'
+    chunk_size: int
+        The number of rows to read per chunk, ADBC reads the batches of its driver,
+        by default 100_000
+    params: tuple[Any, ...] | None
+        The parameters of the query, by default None
+
+    Yields
+    ------
+    pd.DataFrame
+        A pandas dataframe with the rows of a chunk
+    """
+    with db.get_pool(url=url).connection() as conn:
+        if db.is_adbc(conn=conn):
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            for batch in cursor.fetch_record_batch():
+                yield batch.to_pandas()
+            cursor.close()
+            return
+        yield from pd.read_sql(query, conn, params=params, chunksize=chunk_size)
+
+
+def load_parquet(
+        *,
+        file_path: str,
+        columns: list[str] | None = None,
+        filters: list[tuple[str, str, Any]] | None = None,
+    ) -> pd.DataFrame:
+    """
+    Reads a parquet file and returns a pandas dataframe, the column selection
+    and the row filters are pushed down to pyarrow, so row groups whose
+    statistics do not match the filters are not read
+
+    The path can also be a hive partitioned dataset, e.g. `day=YYYY-MM-DD/part-0.parquet`,
+    in that case the filters on the partition column skip whole directories, or an
+    Arrow IPC file (`.arrow`), which is memory-mapped
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, or of the folder of the partitioned dataset
+    columns: list[str] | None, Optional
+        The columns to read, by default all of them
+    filters: list[tuple[str, str, Any]] | None, Optional
+        The row filters, e.g. [('day', '>=', '2020-11-01')], by default None
 
     Returns
     -------
     pd.DataFrame
         A pandas dataframe with the data from the parquet file
     """
-    df: pd.DataFrame = pd.read_parquet(file_path, engine='pyarrow')
+    if is_dataset(file_path=file_path):
+        df: pd.DataFrame = load_dataset(file_path=file_path, columns=columns, filters=filters)
+        return df
+    if is_feather(file_path=file_path):
+        df: pd.DataFrame = to_pandas(table=_load_feather_table(file_path=file_path, columns=columns, filters=filters))
+        return df
+
+    filesystem, path = storage.resolve(file_path)
+    table: pa.Table = pq.read_table(
+        path,
+        columns=columns,
+        filters=filters,
+        use_pandas_metadata=True,
+        filesystem=filesystem,
+    )
+    df: pd.DataFrame = to_pandas(table=table)
     return df
 
+
+def is_dataset(*, file_path: str) -> bool:
+    """
+    Check if a path is a partitioned parquet dataset instead of a single file
+
+    Parameters
+    ----------
+    file_path: str
+        The path to check
+
+    Returns
+    -------
+    bool
+        True if the path is a folder
+    """
+    return storage.is_dir(file_path)
+
+
+def open_dataset(*, file_path: str, schema: dict[str, pa.DataType] = SCHEMA) -> ds.Dataset:
+    """
+    Open a hive partitioned parquet dataset, the partition columns get their type
+    from the schema instead of being inferred from the folder names, e.g. the days
+    are dates and not strings
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the folder of the dataset
+    schema: dict[str, pa.DataType], Optional
+        The types of the columns by their normalized name, the partition columns
+        that are not in it are strings, by default `SCHEMA`
+
+    Returns
+    -------
+    ds.Dataset
+        The dataset
+    """
+    names: list[str] = sorted({entry.split('=', 1)[0] for entry in storage.listdir(file_path) if '=' in entry})
+    partitioning: ds.Partitioning = ds.partitioning(
+        pa.schema([(name, schema.get(name, pa.string())) for name in names]),
+        flavor='hive',
+    )
+    filesystem, path = storage.resolve(file_path)
+    dataset: ds.Dataset = ds.dataset(path, format='parquet', partitioning=partitioning, filesystem=filesystem)
+    return dataset
+
+
+def is_feather(*, file_path: str) -> bool:
+    """
+    Check if a path is an Arrow IPC (Feather v2) file instead of a parquet file
+
+    Parameters
+    ----------
+    file_path: str
+        The path to check
+
+    Returns
+    -------
+    bool
+        True if the path has the `.arrow` extension
+    """
+    return file_path.endswith('.arrow')
+
+
+def _load_feather_table(
+        *,
+        file_path: str,
+        columns: list[str] | None = None,
+        filters: list[tuple[str, str, Any]] | None = None,
+    ) -> pa.Table:
+    """
+    Reads an Arrow IPC file into an arrow table, memory-mapped when there are no
+    filters, so the uncompressed buffers are not copied, the remote files are
+    memory-mapped from the local cache
+    """
+    if not filters:
+        table: pa.Table = feather.read_table(storage.local_path(file_path), columns=columns, memory_map=True)
+        return table
+    filesystem, path = storage.resolve(file_path)
+    dataset: ds.Dataset = ds.dataset(path, format='ipc', filesystem=filesystem)
+    table: pa.Table = dataset.to_table(columns=columns, filter=pq.filters_to_expression(filters))
+    return table
+
+
+def load_dataset(
+        *,
+        file_path: str,
+        columns: list[str] | None = None,
+        filters: list[tuple[str, str, Any]] | None = None,
+    ) -> pd.DataFrame:
+    """
+    Reads a hive partitioned parquet dataset and returns a pandas dataframe, the
+    partition column gets its type from `SCHEMA` and the columns keep the order
+    they had when the dataset was written
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the folder of the dataset
+    columns: list[str] | None, Optional
+        The columns to read, by default all of them
+    filters: list[tuple[str, str, Any]] | None, Optional
+        The row filters, e.g. [('day', '>=', '2020-11-01')], by default None
+
+    Returns
+    -------
+    pd.DataFrame
+        A pandas dataframe with the data from the dataset
+    """
+    df: pd.DataFrame = to_pandas(table=_load_dataset_table(file_path=file_path, columns=columns, filters=filters))
+    return df
+
+
+def _load_dataset_table(
+        *,
+        file_path: str,
+        columns: list[str] | None = None,
+        filters: list[tuple[str, str, Any]] | None = None,
+    ) -> pa.Table:
+    """
+    Reads a hive partitioned parquet dataset into an arrow table, moving the partition
+    column back to the position it had in the pandas metadata of the dataset
+    """
+    dataset: ds.Dataset = open_dataset(file_path=file_path)
+    expression: ds.Expression | None = pq.filters_to_expression(filters) if filters else None
+    table: pa.Table = dataset.to_table(columns=columns, filter=expression)
+
+    metadata: dict[bytes, bytes] = dataset.schema.metadata or {}
+    if b'pandas' in metadata:
+        fields: list[str] = [col['field_name'] for col in json.loads(metadata[b'pandas'])['columns']]
+        order: list[str] = [col for col in fields if col in table.column_names]
+        table = table.select(order + [col for col in table.column_names if col not in order])
+    return table
+
+
+def iter_batches(*, file_path: str, batch_size: int = 65_536) -> Iterator[pa.RecordBatch]:
+    """
+    Read a parquet file, a partitioned dataset or an Arrow IPC file by record batches,
+    only one batch is kept in memory, the columns of the pandas index are not read
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, or of the folder of the partitioned dataset
+    batch_size: int, Optional
+        The maximum number of rows of every batch, by default 65_536
+
+    Returns
+    -------
+    Iterator[pa.RecordBatch]
+        An iterator over the record batches of the file
+    """
+    if is_dataset(file_path=file_path):
+        dataset: ds.Dataset = open_dataset(file_path=file_path)
+        columns: list[str] = drop_pandas_index(table=dataset.schema.empty_table()).column_names
+        return iter(dataset.to_batches(columns=columns, batch_size=batch_size))
+    if is_feather(file_path=file_path):
+        table: pa.Table = drop_pandas_index(table=_load_feather_table(file_path=file_path))
+        return iter(table.to_batches(max_chunksize=batch_size))
+
+    parquet: pq.ParquetFile = pq.ParquetFile(storage.open_input_file(file_path), pre_buffer=True)
+    columns: list[str] = drop_pandas_index(table=parquet.schema_arrow.empty_table()).column_names
+    return parquet.iter_batches(batch_size=batch_size, columns=columns)
+
+
+def estimate_size(*, file_path: str, sample_rows: int = 65_536) -> tuple[int, int]:
+    """
+    Get the number of rows of a parquet file, a partitioned dataset or an Arrow IPC
+    file and the size its table takes in memory, without reading all of it, the
+    size is extrapolated from the first batch, since the dictionary and run length
+    encodings make the sizes of the parquet metadata much smaller
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, or of the folder of the partitioned dataset
+    sample_rows: int, Optional
+        The number of rows read to extrapolate the size, by default 65_536
+
+    Returns
+    -------
+    tuple[int, int]
+        The number of rows and the size in bytes of the table once read
+    """
+    if is_feather(file_path=file_path):
+        table: pa.Table = _load_feather_table(file_path=file_path)
+        return table.num_rows, table.nbytes
+
+    if is_dataset(file_path=file_path):
+        rows: int = open_dataset(file_path=file_path).count_rows()
+    else:
+        rows: int = pq.ParquetFile(storage.open_input_file(file_path)).metadata.num_rows
+    sample: pa.RecordBatch | None = next(iter_batches(file_path=file_path, batch_size=sample_rows), None)
+    if sample is None or sample.num_rows == 0:
+        return rows, 0
+    return rows, rows * sample.nbytes // sample.num_rows
+
+
+def get_parquet_columns(*, file_path: str) -> list[str]:
+    """
+    Reads the column names of a parquet file from its footer
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file
+
+    Returns
+    -------
+    list[str]
+        The names of the columns of the parquet file
+    """
+    if is_dataset(file_path=file_path):
+        columns: list[str] = open_dataset(file_path=file_path).schema.names
+        return columns
+    if is_feather(file_path=file_path):
+        filesystem, path = storage.resolve(file_path)
+        columns: list[str] = ds.dataset(path, format='ipc', filesystem=filesystem).schema.names
+        return columns
+
+    filesystem, path = storage.resolve(file_path)
+    columns: list[str] = pq.read_schema(path, filesystem=filesystem).names
+    return columns
+
+
+def get_max_statistic(*, file_path: str, column: str) -> Any:
+    """
+    Get the maximum value of a column of a parquet file from the row group
+    statistics of its footer, the column is only read if some row group
+    has no statistics
+
+    For a partitioned dataset the maximum of the partition column is taken
+    from the folder names, without opening any file
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, or of the folder of the partitioned dataset
+    column: str
+        The column to get the maximum of
+
+    Returns
+    -------
+    Any
+        The maximum value of the column
+    """
+    if is_dataset(file_path=file_path):
+        dataset: ds.Dataset = open_dataset(file_path=file_path)
+        scheme: str = f'{file_path.partition("://")[0]}://' if storage.is_remote(file_path) else ''
+        values: list[Any] = []
+        for fragment in dataset.get_fragments():
+            keys: dict[str, Any] = ds.get_partition_keys(fragment.partition_expression)
+            if column in keys:
+                values.append(keys[column])
+            else:
+                values.append(get_max_statistic(file_path=f'{scheme}{fragment.path}', column=column))
+        max_value: Any = max((value for value in values if value is not None), default=None)
+        return max_value
+    if is_feather(file_path=file_path):
+        max_value: Any = _load_feather_table(file_path=file_path, columns=[column]).column(column).to_pandas().max()
+        return max_value
+
+    filesystem, path = storage.resolve(file_path)
+    metadata: pq.FileMetaData = pq.ParquetFile(path, filesystem=filesystem).metadata
+    paths: list[str] = [metadata.schema.column(i).path for i in range(metadata.num_columns)]
+    index: int = paths.index(column)
+    max_value: Any = None
+    for i in range(metadata.num_row_groups):
+        stats: pq.Statistics | None = metadata.row_group(i).column(index).statistics
+        if stats is None or not stats.has_min_max:
+            max_value = pq.read_table(path, columns=[column], filesystem=filesystem).column(column).to_pandas().max()
+            return max_value
+        if max_value is None or stats.max > max_value:
+            max_value = stats.max
+    return max_value
+
+
+def load_parquet_table(
+        *,
+        file_path: str,
+        filters: list[tuple[str, str, Any]] | None = None,
+    ) -> pa.Table:
+    """
+    Reads a parquet file and returns an arrow table, nested columns are kept
+    as arrow structs instead of python dicts
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, or of the folder of the partitioned dataset
+    filters: list[tuple[str, str, Any]] | None, Optional
+        The row filters, e.g. [('day', '>', '2020-11-01')], by default None
+
+    Returns
+    -------
+    pa.Table
+        An arrow table with the data from the parquet file
+    """
+    if is_dataset(file_path=file_path):
+        table: pa.Table = _load_dataset_table(file_path=file_path, filters=filters)
+        return table
+    if is_feather(file_path=file_path):
+        table: pa.Table = _load_feather_table(file_path=file_path, filters=filters)
+        return table
+
+    filesystem, path = storage.resolve(file_path)
+    table: pa.Table = pq.read_table(path, filters=filters, filesystem=filesystem)
+    return table
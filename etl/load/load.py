@@ -1,27 +1,257 @@
 import pandas as pd
-from etl.utils import decorators as dec
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from typing import Iterable
+from etl.utils import (
+    decorators as dec,
+    logging as log,
+    database as db,
+    pprint,
+    storage,
+)
 
 
 @dec.time_it
 def dataframe_to_parquet(
         *,
-        df: pd.DataFrame,
+        df: pd.DataFrame | pa.Table,
         path: str = 'data/staging/dataframe.parquet.gzip',
         compression: str = 'gzip',
+        compression_level: int | None = None,
+        sort_by: str | None = None,
+        row_group_size: int | None = None,
     ) -> None:
     """
-    Save a pandas DataFrame to Parquet format.
+    Save a pandas DataFrame or an arrow Table to Parquet format.
 
     Parameters
     ----------
-    df : pd.DataFrame
-        The DataFrame to save.
+    df : pd.DataFrame | pa.Table
+        The DataFrame or Table to save.
     path : str | Optional
         The path where the DataFrame should be saved, by default 'data/staging/dataframe.parquet.gzip'
+    compression : str | Optional
+        The compression mode to use for the Parquet file, one of 'gzip', 'zstd',
+        'lz4', 'snappy', 'brotli' or 'none', by default 'gzip'
+    compression_level : int | None | Optional
+        The compression level of the codec, by default the pyarrow one
+    sort_by : str | None | Optional
+        Column to sort the rows by before saving, so the row group statistics of that
+        column do not overlap and the readers can skip row groups, by default None
+    row_group_size : int | None | Optional
+        Maximum number of rows per row group, by default the pyarrow one
+    """
+    if isinstance(df, pa.Table):
+        table: pa.Table = df.sort_by(sort_by) if sort_by is not None else df
+        with storage.atomic(path) as tmp:
+            filesystem, inner = storage.resolve(tmp)
+            pq.write_table(
+                table,
+                inner,
+                filesystem=filesystem,
+                compression=compression,
+                compression_level=compression_level,
+                row_group_size=row_group_size,
+            )
+        log.add(rows_out=table.num_rows, bytes_written=log.file_size(path))
+        return
+
+    if sort_by is not None:
+        df = df.sort_values(by=sort_by, kind='stable')
+    with storage.atomic(path) as tmp:
+        filesystem, inner = storage.resolve(tmp)
+        df.to_parquet(
+            inner,
+            filesystem=filesystem,
+            compression=compression,
+            compression_level=compression_level,
+            engine='pyarrow',
+            row_group_size=row_group_size,
+        )
+    log.add(rows_out=len(df), bytes_written=log.file_size(path))
+
+
+@dec.time_it
+def dataframe_to_feather(
+        *,
+        df: pd.DataFrame | pa.Table,
+        path: str = 'data/staging/dataframe.arrow',
+        compression: str = 'uncompressed',
+        sort_by: str | None = None,
+    ) -> None:
+    """
+    Save a pandas DataFrame or an arrow Table to Arrow IPC (Feather v2) format,
+    uncompressed files can be memory-mapped when they are read, without copying the data.
+
+    Parameters
+    ----------
+    df : pd.DataFrame | pa.Table
+        The DataFrame or Table to save.
+    path : str | Optional
+        The path where the DataFrame should be saved, by default 'data/staging/dataframe.arrow'
+    compression : str | Optional
+        The compression mode to use for the file, one of 'uncompressed', 'lz4'
+        or 'zstd', by default 'uncompressed'
+    sort_by : str | None | Optional
+        Column to sort the rows by before saving, by default None
+    """
+    if isinstance(df, pa.Table):
+        table: pa.Table = df.sort_by(sort_by) if sort_by is not None else df
+    else:
+        if sort_by is not None:
+            df = df.sort_values(by=sort_by, kind='stable')
+        table: pa.Table = pa.Table.from_pandas(df)
+    with storage.atomic(path) as tmp, storage.open_output_stream(tmp) as sink:
+        feather.write_feather(table, sink, compression=compression)
+    log.add(rows_out=len(df), bytes_written=log.file_size(path))
+
+
+@dec.time_it
+def dataframe_to_dataset(
+        *,
+        df: pd.DataFrame | pa.Table,
+        path: str = 'data/staging/dataframe',
+        partition_by: str = 'day',
+        compression: str = 'gzip',
+        compression_level: int | None = None,
+    ) -> None:
+    """
+    Save a pandas DataFrame or an arrow Table to a hive partitioned Parquet dataset,
+    one folder per value of the partition column, e.g. `day=YYYY-MM-DD/part-0.parquet`.
+
+    Only the partitions found in the DataFrame are replaced, the other partitions
+    already saved in the dataset are kept.
+
+    Parameters
+    ----------
+    df : pd.DataFrame | pa.Table
+        The DataFrame or Table to save.
+    path : str | Optional
+        The folder where the dataset should be saved, by default 'data/staging/dataframe'
+    partition_by : str | Optional
+        The column to partition the dataset by, by default 'day'
+    compression : str | Optional
+        The compression mode to use for the Parquet files, by default 'gzip'
+    compression_level : int | None | Optional
+        The compression level of the codec, by default the pyarrow one
+    """
+    table: pa.Table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df)
+    file_format: ds.ParquetFileFormat = ds.ParquetFileFormat()
+    filesystem, inner = storage.resolve(path)
+    ds.write_dataset(
+        table,
+        inner,
+        filesystem=filesystem,
+        format=file_format,
+        file_options=file_format.make_write_options(compression=compression, compression_level=compression_level),
+        partitioning=ds.partitioning(pa.schema([table.schema.field(partition_by)]), flavor='hive'),
+        basename_template='part-{i}.parquet',
+        existing_data_behavior='delete_matching',
+    )
+    log.add(rows_out=table.num_rows, bytes_written=log.file_size(path))
+
+
+@dec.time_it
+def chunks_to_parquet(
+        *,
+        chunks: Iterable[pd.DataFrame | pa.Table],
+        path: str = 'data/staging/dataframe.parquet.gzip',
+        compression: str = 'gzip',
+    ) -> int:
+    """
+    Save a stream of pandas DataFrames or arrow Tables to a single Parquet file, one row group per chunk.
+
+    Only the chunk being written is kept in memory, the schema of the file is taken
+    from the first chunk and the following chunks are cast to it.
+
+    Parameters
+    ----------
+    chunks : Iterable[pd.DataFrame | pa.Table]
+        The DataFrames or Tables to save, all of them with the same columns.
+    path : str | Optional
+        The path where the DataFrames should be saved, by default 'data/staging/dataframe.parquet.gzip'
     compression : str | Optional
         The compression mode to use for the Parquet file, by default 'gzip'
+
+    Returns
+    -------
+    int
+        The number of rows written
     """
-    df.to_parquet(path, compression=compression, engine='pyarrow')
+    writer: pq.ParquetWriter | None = None
+    rows: int = 0
+    with storage.atomic(path) as tmp:
+        try:
+            for chunk in chunks:
+                table: pa.Table = chunk if isinstance(chunk, pa.Table) else pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    filesystem, inner = storage.resolve(tmp)
+                    writer = pq.ParquetWriter(inner, table.schema, compression=compression, filesystem=filesystem)
+                else:
+                    table = table.cast(writer.schema)
+                writer.write_table(table)
+                rows += table.num_rows
+                log.add(rows_in=table.num_rows)
+        finally:
+            if writer is not None:
+                writer.close()
+    log.add(rows_out=rows, bytes_written=log.file_size(path))
+    return rows
+
+
+@dec.time_it
+def parts_to_parquet(
+        *,
+        parts: list[str],
+        path: str = 'data/staging/dataframe.parquet.gzip',
+        compression: str = 'gzip',
+    ) -> int:
+    """
+    Save the row groups of Parquet files to a single Parquet file, in their order,
+    e.g. the parts committed by a checkpointed extraction.
+
+    Only the row group being copied is kept in memory, the schema of the file is taken
+    from the first part and the row groups of the following parts are cast to it.
+
+    Parameters
+    ----------
+    parts : list[str]
+        The paths of the Parquet files to save.
+    path : str | Optional
+        The path where the row groups should be saved, by default 'data/staging/dataframe.parquet.gzip'
+    compression : str | Optional
+        The compression mode to use for the Parquet file, by default 'gzip'
+
+    Returns
+    -------
+    int
+        The number of rows written
+    """
+    writer: pq.ParquetWriter | None = None
+    rows: int = 0
+    with storage.atomic(path) as tmp:
+        try:
+            for part in parts:
+                parquet: pq.ParquetFile = pq.ParquetFile(storage.open_input_file(part))
+                for i in range(parquet.num_row_groups):
+                    table: pa.Table = parquet.read_row_group(i)
+                    if writer is None:
+                        filesystem, inner = storage.resolve(tmp)
+                        writer = pq.ParquetWriter(inner, table.schema, compression=compression, filesystem=filesystem)
+                    else:
+                        table = table.cast(writer.schema)
+                    writer.write_table(table)
+                    rows += table.num_rows
+                    log.add(rows_in=table.num_rows)
+        finally:
+            if writer is not None:
+                writer.close()
+    log.add(rows_out=rows, bytes_written=log.file_size(path))
+    return rows
 
 
 @dec.time_it
@@ -29,6 +259,7 @@ def dataframe_to_csv(
         *,
         df: pd.DataFrame,
         path: str = 'data/processed/dataframe.csv',
+        index: bool = True,
     ) -> None:
     """
     Save a pandas DataFrame to CSV format.
@@ -39,6 +270,142 @@ def dataframe_to_csv(
         The DataFrame to save.
     path : str | Optional
         The path where the DataFrame should be saved, by default 'data/processed/dataframe.csv'
+    index : bool | Optional
+        If the index of the DataFrame is written, by default True
+    """
+    with storage.atomic(path) as tmp, storage.open_output_stream(tmp) as sink:
+        df.to_csv(sink, index=index)
+    log.add(rows_out=len(df), bytes_written=log.file_size(path))
+
+
+@dec.time_it
+def batches_to_csv(
+        *,
+        batches: pa.Table | Iterable[pa.RecordBatch],
+        path: str = 'data/processed/dataframe.csv',
+        compression: str | None = None,
+    ) -> int:
+    """
+    Save an arrow Table or a stream of record batches to CSV format with the
+    native writer of arrow, the batches are written as soon as they are read.
+
+    The strings are quoted and the index of pandas is never written.
+
+    Parameters
+    ----------
+    batches : pa.Table | Iterable[pa.RecordBatch]
+        The Table or the record batches to save, all of them with the same schema.
+    path : str | Optional
+        The path where the CSV should be saved, by default 'data/processed/dataframe.csv'
+    compression : str | None | Optional
+        The compression of the file, e.g. 'gzip' for a '.csv.gz' file, by default None
+
+    Returns
+    -------
+    int
+        The number of rows written
+    """
+    if isinstance(batches, pa.Table):
+        batches = batches.to_batches()
+    writer: csv.CSVWriter | None = None
+    rows: int = 0
+    with storage.atomic(path) as tmp, storage.open_output_stream(tmp, compression=compression) as sink:
+        for batch in batches:
+            if writer is None:
+                writer = csv.CSVWriter(sink, batch.schema)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+            log.add(rows_in=batch.num_rows)
+        if writer is not None:
+            writer.close()
+    log.add(rows_out=rows, bytes_written=log.file_size(path))
+    return rows
+
+
+@dec.time_it
+def batches_to_database(
+        *,
+        batches: pa.Table | Iterable[pa.RecordBatch],
+        name: str,
+        url: str = 'sqlite:///data/processed/meli.db',
+        mode: str = 'append',
+        keys: list[str] | None = None,
+        batch_size: int = 50_000,
+    ) -> int:
+    """
+    Save an arrow Table or a stream of record batches to a table of a SQL database,
+    all the batches are written in one transaction, with the drop of the table when it
+    is replaced, with the bulk ingestion of ADBC
+    when the connection is an ADBC one and otherwise with `executemany` over batches
+    of rows.
+
+    The table is created from the schema of the batches if it does not exist.
+
+    Parameters
+    ----------
+    batches : pa.Table | Iterable[pa.RecordBatch]
+        The Table or the record batches to save, all of them with the same schema.
+    name : str
+        The name of the table.
+    url : str | Optional
+        The url of the database, e.g. 'duckdb:///data/processed/meli.duckdb', by default
+        'sqlite:///data/processed/meli.db'
+    mode : str | Optional
+        'append' to insert the rows, 'replace' to drop the table first, or 'upsert' to
+        update the rows whose keys are already in the table, e.g. the days of an
+        incremental run, the table must have been created by an upsert and the rows
+        with a null key are dropped, by default 'append'
+    keys : list[str] | None | Optional
+        The columns of the primary key of the table when it is created, needed to
+        upsert, by default None
+    batch_size : int | Optional
+        The number of rows of every `executemany`, by default 50_000
+
+    Returns
+    -------
+    int
+        The number of rows written
     """
-    df.to_csv(path)
+    if mode not in ('append', 'replace', 'upsert'):
+        raise ValueError(f'Mode {mode} not supported')
+    if mode == 'upsert' and not keys:
+        raise ValueError('The keys are needed to upsert')
+    if isinstance(batches, pa.Table):
+        batches = batches.to_batches(max_chunksize=batch_size)
 
+    pool: db.ConnectionPool = db.get_pool(url=url)
+    rows: int = 0
+    with pool.connection() as conn:
+        db.begin(conn=conn)
+        cursor = conn.cursor()
+        if mode == 'replace':
+            cursor.execute(f'DROP TABLE IF EXISTS {db.quote(name)}')
+        statement: str | None = None
+        for batch in batches:
+            batch = db.to_parameters(table=batch, dialect=pool.dialect)
+            if mode == 'upsert':
+                valid: pa.Array = pc.is_valid(batch.column(keys[0]))
+                for key in keys[1:]:
+                    valid = pc.and_(valid, pc.is_valid(batch.column(key)))
+                if not pc.all(valid).as_py():
+                    pprint.warning(f'{batch.num_rows - pc.sum(valid).as_py()} rows with a null key not upserted to {{ {name} }}')
+                    batch = batch.filter(valid)
+            if db.is_adbc(conn=conn) and mode != 'upsert':
+                cursor.adbc_ingest(name, batch, mode='create_append')
+            else:
+                if statement is None:
+                    cursor.execute(db.create_table_sql(name=name, schema=batch.schema, keys=keys))
+                    statement = db.insert_sql(
+                        name=name,
+                        columns=batch.schema.names,
+                        keys=keys if mode == 'upsert' else None,
+                        dialect=pool.dialect,
+                    )
+                for start in range(0, batch.num_rows, batch_size):
+                    chunk: pa.RecordBatch = batch.slice(start, batch_size)
+                    cursor.executemany(statement, list(zip(*(column.to_pylist() for column in chunk.columns))))
+            rows += batch.num_rows
+        conn.commit()
+        cursor.close()
+    log.add(rows_out=rows)
+    return rows
@@ -1,46 +1,274 @@
+import json
+import datetime as dt
 import pandas as pd
+import pyarrow as pa
 from etl.load import load
-from typing import TypeAlias
-from etl.utils import pprint
+from typing import Any, Iterable, TypeAlias
+from etl.utils import (
+    pprint,
+    profiling,
+    storage,
+)
 
 
 FileName: TypeAlias = str
-ParquetArray: TypeAlias = tuple[tuple[pd.DataFrame, FileName], ...]
+ParquetArray: TypeAlias = tuple[tuple[pd.DataFrame | pa.Table, FileName], ...]
 
+# format -> (file format, codec, extension)
+STAGING_FORMATS: dict[str, tuple[str, str, str]] = {
+    'parquet-gzip'   : ('parquet', 'gzip', '.parquet.gzip'),
+    'parquet-zstd'   : ('parquet', 'zstd', '.parquet.zstd'),
+    'parquet-lz4'    : ('parquet', 'lz4', '.parquet.lz4'),
+    'parquet-snappy' : ('parquet', 'snappy', '.parquet.snappy'),
+    'parquet-none'   : ('parquet', 'none', '.parquet'),
+    'feather'        : ('feather', 'uncompressed', '.arrow'),
+}
+STAGING_FORMAT: str = 'parquet-gzip'
 
-def to_parquet(*, array: ParquetArray, file_path: str, print_info: bool = False) -> None:
+
+def set_staging_format(*, fmt: str) -> None:
+    """
+    Set the format used by `to_parquet` when no format is given
+
+    Parameters
+    ----------
+    fmt: str
+        One of the keys of `STAGING_FORMATS`, the parquet codecs accept a level,
+        e.g. 'parquet-zstd:3'
+    """
+    global STAGING_FORMAT
+    parse_format(fmt=fmt)
+    STAGING_FORMAT = fmt
+
+
+def parse_format(*, fmt: str) -> tuple[str, str, int | None, str]:
+    """
+    Get the file format, codec, compression level and extension of a staging format
+
+    Parameters
+    ----------
+    fmt: str
+        One of the keys of `STAGING_FORMATS`, the parquet codecs accept a level,
+        e.g. 'parquet-zstd:3'
+
+    Returns
+    -------
+    tuple[str, str, int | None, str]
+        The file format, the codec, the compression level and the extension
+    """
+    name, _, level = fmt.partition(':')
+    if name not in STAGING_FORMATS:
+        raise ValueError(f'Format {fmt} not supported, use one of {list(STAGING_FORMATS)}')
+    file_format, codec, ext = STAGING_FORMATS[name]
+    return file_format, codec, int(level) if level else None, ext
+
+
+def _remove_saved(*, file_path: str, name: FileName, keep: str) -> None:
+    """ Remove the files saved with the same name in another format """
+    for path in [f'{file_path}/{name}'] + [f'{file_path}/{name}{ext}' for _, _, ext in STAGING_FORMATS.values()]:
+        if path != keep:
+            storage.remove(path)
+
+
+def to_parquet(
+        *,
+        array: ParquetArray,
+        file_path: str,
+        print_info: bool = False,
+        sort_by: str | None = None,
+        partition_by: str | None = None,
+        fmt: str | None = None,
+    ) -> None:
     """
     Save a dataframe in a parquet file
 
     Parameters
     ----------
     array: ParquetArray
-        An iterable object with the dataframes to be saved
+        An iterable object with the dataframes or arrow tables to be saved
     file_path: str
         Path of the parquet file to be saved
+    print_info: bool, Optional
+        If the statistics of the saved files are also printed when the profiler is
+        enabled, by default False
+    sort_by: str | None, Optional
+        Column to sort the dataframes by before saving, by default None
+    partition_by: str | None, Optional
+        Column to partition the dataframes by, if given every dataframe is saved as
+        a hive partitioned dataset in the folder `file_path/name`, by default None
+    fmt: str | None, Optional
+        The format of the files, one of the keys of `STAGING_FORMATS`, the partitioned
+        datasets are always saved in parquet, by default the one set with `set_staging_format`
     """
-    pprint.info(msg=f'Saving parquet into {{ {file_path} }}')
+    file_format, codec, level, ext = parse_format(fmt=fmt or STAGING_FORMAT)
+    pprint.info(msg=f'Saving {fmt or STAGING_FORMAT} into {{ {file_path} }}')
     for df, name in array:
-        load.dataframe_to_parquet(df=df, path=f'{file_path}/{name}.parquet.gzip')
+        if partition_by is not None:
+            path: str = f'{file_path}/{name}'
+            _remove_saved(file_path=file_path, name=name, keep=path)
+            load.dataframe_to_dataset(
+                df=df,
+                path=path,
+                partition_by=partition_by,
+                compression=codec if file_format == 'parquet' else 'none',
+                compression_level=level,
+            )
+        elif file_format == 'feather':
+            path: str = f'{file_path}/{name}{ext}'
+            _remove_saved(file_path=file_path, name=name, keep=path)
+            load.dataframe_to_feather(df=df, path=path, sort_by=sort_by, compression=codec)
+        else:
+            path: str = f'{file_path}/{name}{ext}'
+            _remove_saved(file_path=file_path, name=name, keep=path)
+            load.dataframe_to_parquet(
+                df=df,
+                path=path,
+                sort_by=sort_by,
+                compression=codec,
+                compression_level=level,
+            )
         pprint.success(f'parquet {{ {name} }} saved')
-        if print_info:
-            print_basic_df_info(df=df)
+        profiling.profile_file(path=path, console=print_info)
+
+
+def get_parquet_path(*, file_path: str, name: FileName) -> str:
+    """
+    Get the path of a saved parquet, the folder of the partitioned dataset if it
+    exists, the file saved in any of the staging formats otherwise
+
+    Parameters
+    ----------
+    file_path: str
+        Path of the folder where the parquet is saved
+    name: FileName
+        Name of the parquet
+
+    Returns
+    -------
+    str
+        The path to read the parquet from
+    """
+    if storage.is_dir(f'{file_path}/{name}'):
+        return f'{file_path}/{name}'
+    saved: list[str] = [
+        f'{file_path}/{name}{ext}' for _, _, ext in STAGING_FORMATS.values()
+        if storage.is_file(f'{file_path}/{name}{ext}')
+    ]
+    if saved:
+        return max(saved, key=storage.mtime)
+    return get_staging_path(file_path=file_path, name=name)
+
+
+def get_staging_path(*, file_path: str, name: FileName, partitioned: bool = False) -> str:
+    """
+    Get the path where `to_parquet` saves a file with the current staging format
+
+    Parameters
+    ----------
+    file_path: str
+        Path of the folder where the file is saved
+    name: FileName
+        Name of the file
+    partitioned: bool, Optional
+        If the file is saved as a partitioned dataset, by default False
+
+    Returns
+    -------
+    str
+        The path of the file, or of the folder of the dataset
+    """
+    if partitioned:
+        return f'{file_path}/{name}'
+    return f'{file_path}/{name}{parse_format(fmt=STAGING_FORMAT)[3]}'
+
+
+def chunks_to_parquet(*, chunks: Iterable[pd.DataFrame | pa.Table], name: FileName, file_path: str) -> None:
+    """
+    Save a stream of dataframes or arrow tables in a parquet file, writing each chunk as soon as it is read
+
+    Parameters
+    ----------
+    chunks: Iterable[pd.DataFrame | pa.Table]
+        An iterable object with the chunks of the dataframe to be saved
+    name: FileName
+        Name of the parquet file to be saved
+    file_path: str
+        Path of the parquet file to be saved
+    """
+    pprint.info(msg=f'Streaming parquet into {{ {file_path} }}')
+    _remove_saved(file_path=file_path, name=name, keep=f'{file_path}/{name}.parquet.gzip')
+    rows: int = load.chunks_to_parquet(chunks=chunks, path=f'{file_path}/{name}.parquet.gzip')
+    pprint.success(f'parquet {{ {name} }} saved, {rows} rows')
+    profiling.profile_file(path=f'{file_path}/{name}.parquet.gzip')
+
+
+def parts_to_parquet(*, parts: list[str], name: FileName, file_path: str) -> None:
+    """
+    Save the row groups of parquet parts in a parquet file, e.g. the parts of a checkpoint
+
+    Parameters
+    ----------
+    parts: list[str]
+        The paths of the parts, in order
+    name: FileName
+        Name of the parquet file to be saved
+    file_path: str
+        Path of the parquet file to be saved
+    """
+    pprint.info(msg=f'Saving {len(parts)} parts into {{ {file_path} }}')
+    _remove_saved(file_path=file_path, name=name, keep=f'{file_path}/{name}.parquet.gzip')
+    rows: int = load.parts_to_parquet(parts=parts, path=f'{file_path}/{name}.parquet.gzip')
+    pprint.success(f'parquet {{ {name} }} saved, {rows} rows')
+    profiling.profile_file(path=f'{file_path}/{name}.parquet.gzip')
+
+
+def read_watermark(*, name: str, path: str = 'data/staging/_watermarks.json', as_date: bool = False) -> Any:
+    """
+    Read the last value processed of a source, e.g. the last day of a file
+
+    Parameters
+    ----------
+    name: str
+        Name of the source
+    path: str, Optional
+        Path of the json file with the watermarks, by default 'data/staging/_watermarks.json'
+    as_date: bool, Optional
+        If the value is parsed as a date, in format '%Y-%m-%d', by default False
+
+    Returns
+    -------
+    Any
+        The last value processed, None if the source has not been processed yet
+    """
+    if not storage.is_file(path):
+        return None
+    with storage.open_input_stream(path) as stream:
+        watermarks: dict[str, Any] = json.loads(stream.read())
+    value: Any = watermarks.get(name)
+    if as_date and value is not None:
+        value = dt.date.fromisoformat(value)
+    return value
 
 
-def print_basic_df_info(*, df: pd.DataFrame) -> None:
+def write_watermark(*, name: str, value: Any, path: str = 'data/staging/_watermarks.json') -> None:
     """
-    Print basic information about a dataframe
+    Save the last value processed of a source, e.g. the last day of a file
 
     Parameters
     ----------
-    df: pd.DataFrame
-        The dataframe to be printed
+    name: str
+        Name of the source
+    value: Any
+        The last value processed, the dates are saved in format '%Y-%m-%d'
+    path: str, Optional
+        Path of the json file with the watermarks, by default 'data/staging/_watermarks.json'
     """
-    print()
-    pprint.info(f'shape: {df.shape}')
-    pprint.info(f'columns: {df.columns}')
-    pprint.info(f'data:\n{df.head()}')
-    pprint.info(f'null values:\n{df.isnull().sum()}')
-    pprint.info(f'dtypes:\n{df.dtypes}')
-    print()
+    watermarks: dict[str, Any] = {}
+    if storage.is_file(path):
+        with storage.open_input_stream(path) as stream:
+            watermarks = json.loads(stream.read())
+    watermarks[name] = value
+    with storage.atomic(path) as tmp, storage.open_output_stream(tmp) as sink:
+        sink.write(json.dumps(watermarks, indent=4, default=str).encode('utf-8'))
+    pprint.info(f'watermark {{ {name} }} -> {value}')
 
@@ -0,0 +1,287 @@
+"""
+Lazy transformations over arrow acero plans.
+
+Every function here receives and returns a `Plan`, nothing is read from disk
+until the plan is materialized with `to_table` or `to_dataframe`, so a chain
+of steps runs as one streaming query instead of one parquet round-trip per step.
+"""
+import pandas as pd
+import pyarrow as pa
+import pyarrow.acero as acero
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from typing import Any, TypeAlias
+from etl.extr import extraction as extr
+from etl.trsf import transform as trsf
+from etl.utils import storage
+
+
+Plan: TypeAlias = acero.Declaration
+
+
+def scan_parquet(*, file_path: str, filter: pc.Expression | None = None) -> tuple[Plan, pa.Schema]:
+    """
+    Build a plan that scans a parquet file, a partitioned dataset or an Arrow IPC file
+
+    Parameters
+    ----------
+    file_path: str
+        The path of the file, the `.arrow` files are read as Arrow IPC
+    filter: pc.Expression | None, Optional
+        Filter used to skip the row groups whose statistics do not match it,
+        the rows of the remaining row groups are not filtered, by default None
+
+    Returns
+    -------
+    tuple[Plan, pa.Schema]
+        The scan plan and the schema of the file
+    """
+    filesystem, path = storage.resolve(file_path)
+    if file_path.endswith('.arrow'):
+        dataset: ds.Dataset = ds.dataset(path, format='ipc', filesystem=filesystem)
+    elif extr.is_dataset(file_path=file_path):
+        dataset: ds.Dataset = extr.open_dataset(file_path=file_path)
+    else:
+        dataset: ds.Dataset = ds.dataset(path, format='parquet', filesystem=filesystem)
+    plan: Plan = acero.Declaration('scan', acero.ScanNodeOptions(dataset, filter=filter))
+    return plan, dataset.schema.remove_metadata()
+
+
+def from_table(*, table: pa.Table) -> Plan:
+    """
+    Build a plan that reads an in-memory arrow table
+
+    Parameters
+    ----------
+    table: pa.Table
+        The table to read
+
+    Returns
+    -------
+    Plan
+        The source plan
+    """
+    plan: Plan = acero.Declaration('table_source', acero.TableSourceNodeOptions(table))
+    return plan
+
+
+def _flatten_fields(*, fields: list[pa.Field], path: tuple[str, ...], sep: str) -> list[tuple[str, tuple[str, ...], pa.DataType]]:
+    """
+    Get the leaf fields of a schema, plain fields first and nested fields appended at the end,
+    which is the order used by `pd.json_normalize`
+    """
+    plain: list[tuple[str, tuple[str, ...], pa.DataType]] = []
+    nested: list[tuple[str, tuple[str, ...], pa.DataType]] = []
+    for field in fields:
+        field_path: tuple[str, ...] = (*path, field.name)
+        if pa.types.is_struct(field.type):
+            nested.extend(_flatten_fields(fields=list(field.type), path=field_path, sep=sep))
+        else:
+            plain.append((sep.join(field_path), field_path, field.type))
+    return plain + nested
+
+
+def normalize(
+        *,
+        plan: Plan,
+        schema: pa.Schema,
+        sep: str = '_',
+        types: dict[str, pa.DataType] | None = None,
+    ) -> tuple[Plan, list[str]]:
+    """
+    Flatten the struct columns of a plan, same output as `transform.arrow_json_normalize`
+
+    Parameters
+    ----------
+    plan: Plan
+        The plan to normalize
+    schema: pa.Schema
+        The schema of the plan
+    sep: str, Optional
+        The separator to use between columns, by default '_'
+    types: dict[str, pa.DataType] | None, Optional
+        The types to cast the columns to, by their normalized name, the dictionaries
+        are cast to their values, because the batches of a scan do not share the same
+        dictionary and the joins and aggregations cannot unify them, and the integers
+        are never narrowed, by default None
+
+    Returns
+    -------
+    tuple[Plan, list[str]]
+        The normalized plan and the names of its columns
+    """
+    leaves: list[tuple[str, tuple[str, ...], pa.DataType]] = _flatten_fields(fields=list(schema), path=(), sep=sep)
+    names: list[str] = [name for name, _, _ in leaves]
+    expressions: list[pc.Expression] = []
+    for name, field_path, field_type in leaves:
+        expression: pc.Expression = pc.field(field_path)
+        data_type: pa.DataType = (types or {}).get(name, field_type)
+        data_type = data_type.value_type if pa.types.is_dictionary(data_type) else data_type
+        if pa.types.is_integer(data_type) and pa.types.is_integer(field_type) and data_type.bit_width < field_type.bit_width:
+            # The values are not known while the plan is built, the integers are
+            # narrowed to the ones that fit by `to_dataframe`
+            data_type = field_type
+        if data_type != field_type:
+            expression = expression.cast(data_type)
+        expressions.append(expression)
+    plan_norm: Plan = acero.Declaration(
+        'project',
+        acero.ProjectNodeOptions(expressions, names),
+        inputs=[plan],
+    )
+    return plan_norm, names
+
+
+def filter_by_day(*, plan: Plan, date_col: str, start_date: Any, end_date: Any) -> Plan:
+    """
+    Filter a plan by date, both limits included
+
+    Parameters
+    ----------
+    plan: Plan
+        The plan to filter
+    date_col: str
+        The column to filter by
+    start_date: Any
+        The start date to filter by
+    end_date: Any
+        The end date to filter by
+
+    Returns
+    -------
+    Plan
+        The filtered plan
+    """
+    expression: pc.Expression = (pc.field(date_col) >= start_date) & (pc.field(date_col) <= end_date)
+    plan_filter: Plan = acero.Declaration('filter', acero.FilterNodeOptions(expression), inputs=[plan])
+    return plan_filter
+
+
+def distinct(*, plan: Plan, columns: list[str]) -> Plan:
+    """
+    Get the distinct values of some columns of a plan
+
+    Parameters
+    ----------
+    plan: Plan
+        The plan to read the values from
+    columns: list[str]
+        The columns to get the distinct values of
+
+    Returns
+    -------
+    Plan
+        A plan with the distinct values
+    """
+    plan_distinct: Plan = acero.Declaration('aggregate', acero.AggregateNodeOptions([], keys=columns), inputs=[plan])
+    return plan_distinct
+
+
+def filter_by_values(*, plan: Plan, values: Plan, columns: list[str]) -> Plan:
+    """
+    Keep the rows of a plan whose columns are found in another plan, a left semi join
+
+    Parameters
+    ----------
+    plan: Plan
+        The plan to filter
+    values: Plan
+        A plan with the values to keep, with the same column names
+    columns: list[str]
+        The columns to filter by
+
+    Returns
+    -------
+    Plan
+        The filtered plan
+    """
+    plan_filter: Plan = acero.Declaration(
+        'hashjoin',
+        acero.HashJoinNodeOptions('left semi', columns, columns),
+        inputs=[plan, distinct(plan=values, columns=columns)],
+    )
+    return plan_filter
+
+
+def group_by(*, plan: Plan, by: list[str], values: list[str], operation: str) -> Plan:
+    """
+    Group a plan by columns with the named aggregations of `transform.get_aggregations`,
+    the same as `transform.group_by` but unsorted, the rows with a null key are dropped
+
+    Parameters
+    ----------
+    plan: Plan
+        The plan to group
+    by: list[str]
+        The columns to group by
+    values: list[str]
+        The columns of the plan that are not keys
+    operation: str
+        The operation to perform on the grouped data, one of
+            - sum
+            - count
+            - mean
+
+    Returns
+    -------
+    Plan
+        The grouped plan
+    """
+    aggregates: list[tuple[str | list[str], str, None, str]] = [
+        ([] if column is None else column, f'hash_{function}', None, name)
+        for column, function, name in trsf.get_aggregations(columns=values, by=by, operation=operation)
+    ]
+    plan_valid: Plan = acero.Declaration('filter', acero.FilterNodeOptions(trsf.valid_keys(by=by)), inputs=[plan])
+    plan_group: Plan = acero.Declaration(
+        'aggregate',
+        acero.AggregateNodeOptions(aggregates, keys=by),
+        inputs=[plan_valid],
+    )
+    return plan_group
+
+
+def to_table(*, plan: Plan) -> pa.Table:
+    """
+    Run a plan and return its result
+
+    Parameters
+    ----------
+    plan: Plan
+        The plan to run
+
+    Returns
+    -------
+    pa.Table
+        An arrow table with the result of the plan
+    """
+    table: pa.Table = plan.to_table(use_threads=True)
+    return table
+
+
+def to_dataframe(
+        *,
+        plan: Plan,
+        types: dict[str, pa.DataType] | None = None,
+    ) -> pd.DataFrame:
+    """
+    Run a plan and return its result as a pandas dataframe
+
+    Parameters
+    ----------
+    plan: Plan
+        The plan to run
+    types: dict[str, pa.DataType] | None, Optional
+        The types to cast the columns to, e.g. the dictionaries decoded by `normalize`,
+        by default None
+
+    Returns
+    -------
+    pd.DataFrame
+        A pandas dataframe with the result of the plan, with the compact dtypes of
+        `extraction.to_pandas`
+    """
+    table: pa.Table = to_table(plan=plan)
+    if types is not None:
+        table = extr.cast_table(table=table, schema=types)
+    df: pd.DataFrame = extr.to_pandas(table=table)
+    return df
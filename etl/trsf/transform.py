@@ -1,5 +1,18 @@
+import functools
+import operator
+import os
+import tempfile
+import numpy as np
 import pandas as pd
-from typing import Any
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas.api.types import union_categoricals
+from typing import Any, Iterable, TypeAlias
+from etl.extr import extraction as extr
+from etl.utils import storage
+
+
+Aggregation: TypeAlias = tuple[str | None, str, str]
 
 
 def pdjson_normalize(*, df: pd.DataFrame, orient='records', sep='_') -> pd.DataFrame:
@@ -24,7 +37,77 @@ def pdjson_normalize(*, df: pd.DataFrame, orient='records', sep='_') -> pd.DataF
     return df_norm
 
 
-def filter_by_day(*, df: pd.DataFrame, date_col: str, start_date: str, end_date: str) -> pd.DataFrame:
+def _flatten_struct(*, name: str, column: pa.ChunkedArray, sep: str) -> list[tuple[str, pa.ChunkedArray]]:
+    """
+    Flatten a column into its leaf columns, keeping the order used by `pd.json_normalize`,
+    plain fields first and nested fields appended at the end.
+
+    Parameters
+    ----------
+    name
+        The name of the column.
+    column
+        The column to flatten.
+    sep
+        The separator to use between the parent and child names.
+
+    Returns
+    -------
+    list[tuple[str, pa.ChunkedArray]]
+        The leaf columns with their flattened names.
+    """
+    if not pa.types.is_struct(column.type):
+        return [(name, column)]
+
+    fields: list[pa.Field] = list(column.type)
+    children: list[pa.ChunkedArray] = column.flatten()
+    plain: list[tuple[str, pa.ChunkedArray]] = []
+    nested: list[tuple[str, pa.ChunkedArray]] = []
+    for field, child in zip(fields, children):
+        child_name: str = f'{name}{sep}{field.name}'
+        if pa.types.is_struct(field.type):
+            nested.extend(_flatten_struct(name=child_name, column=child, sep=sep))
+        else:
+            plain.append((child_name, child))
+    return plain + nested
+
+
+def arrow_json_normalize(*, table: pa.Table, sep: str = '_') -> pd.DataFrame:
+    """
+    Normalize an arrow table with struct columns into a dataframe with flat columns.
+
+    The struct columns are flattened in arrow memory, so no python object is
+    created per row, and the result has the same column names and order that
+    `pdjson_normalize` gives for the same data, with the compact dtypes of
+    `extraction.to_pandas`.
+
+    Parameters
+    ----------
+    table
+        The arrow table to normalize, e.g. read from a raw parquet file.
+    sep
+        The separator to use between columns in the dataframe.
+
+    Returns
+    -------
+    pd.DataFrame
+        A dataframe with the normalized columns.
+    """
+    plain: list[tuple[str, pa.ChunkedArray]] = []
+    nested: list[tuple[str, pa.ChunkedArray]] = []
+    for name, column in zip(table.column_names, table.columns):
+        if pa.types.is_struct(column.type):
+            nested.extend(_flatten_struct(name=name, column=column, sep=sep))
+        else:
+            plain.append((name, column))
+
+    columns: list[tuple[str, pa.ChunkedArray]] = plain + nested
+    table_norm: pa.Table = pa.table(dict(columns))
+    df_norm: pd.DataFrame = extr.to_pandas(table=table_norm)
+    return df_norm
+
+
+def filter_by_day(*, df: pd.DataFrame, date_col: str, start_date: Any, end_date: Any) -> pd.DataFrame:
     """
     Filter a dataframe by date.
 
@@ -35,9 +118,9 @@ def filter_by_day(*, df: pd.DataFrame, date_col: str, start_date: str, end_date:
     date_col
         The column in the dataframe to filter by.
     start_date
-        The start date to filter by.
+        The start date to filter by, of the same type as the column, e.g. a `datetime.date`.
     end_date
-        The end date to filter by.
+        The end date to filter by, of the same type as the column.
 
     Returns
     -------
@@ -73,6 +156,92 @@ def filter_by_values(*, df: pd.DataFrame, column: str, values: Any) -> pd.DataFr
     return df_filtered
 
 
+def build_key_set(*, df: pd.DataFrame, columns: list[str]) -> pd.Index:
+    """
+    Build the set of distinct keys of a dataframe, to be used by `semi_join`.
+
+    The hash table of the keys is built the first time they are looked up and
+    kept inside the index, so the same key set can filter several dataframes.
+
+    Parameters
+    ----------
+    df
+        The dataframe with the keys.
+    columns
+        The key columns, e.g. ['user_id'] or ['user_id', 'value_prop'].
+
+    Returns
+    -------
+    pd.Index
+        The distinct keys, a MultiIndex for composite keys.
+    """
+    if len(columns) == 1:
+        keys: pd.Index = pd.Index(df[columns[0]].unique(), name=columns[0])
+        return keys
+
+    keys: pd.Index = pd.MultiIndex.from_frame(df[columns].drop_duplicates())
+    return keys
+
+
+def semi_join(*, df: pd.DataFrame, keys: pd.Index, columns: list[str]) -> pd.DataFrame:
+    """
+    Keep the rows of a dataframe whose key columns are found in a key set.
+
+    Parameters
+    ----------
+    df
+        The dataframe to filter.
+    keys
+        The key set given by `build_key_set`.
+    columns
+        The key columns of the dataframe, in the same order as the key set.
+
+    Returns
+    -------
+    pd.DataFrame
+        A dataframe with the filtered data.
+    """
+    if len(columns) == 1:
+        target: pd.Index = pd.Index(df[columns[0]])
+    else:
+        target: pd.Index = pd.MultiIndex.from_frame(df[columns])
+    mask: Any = keys.get_indexer(target) != -1
+    df_filtered: pd.DataFrame = df[mask]
+    return df_filtered
+
+
+def key_set_filters(*, keys: pd.Index, columns: list[str]) -> list[tuple[str, str, Any]]:
+    """
+    Build parquet row filters from a key set, so the rows whose keys are out of the
+    range of the set are dropped while reading. The min and max of every key column
+    let the reader skip whole row groups, the filters are a superset of the semi
+    join, which keeps the exact keys. The values of the set are not pushed down as
+    an `in` filter, it grows with the set and is checked against every row read.
+
+    Parameters
+    ----------
+    keys
+        The key set given by `build_key_set`.
+    columns
+        The key columns of the parquet file, in the same order as the key set.
+
+    Returns
+    -------
+    list[tuple[str, str, Any]]
+        The row filters for `extraction.load_parquet`.
+    """
+    filters: list[tuple[str, str, Any]] = []
+    for level, column in enumerate(columns):
+        values: Any = keys.get_level_values(level).unique()
+        if len(values) == 0:
+            continue
+        filters.extend([
+            (column, '>=', values.min()),
+            (column, '<=', values.max()),
+        ])
+    return filters
+
+
 def get_max_data_column(*, df: pd.DataFrame, column: str) -> Any:
     """
     Get the maximum value from a column in a dataframe.
@@ -113,9 +282,184 @@ def get_column(*, df: pd.DataFrame, column: str) -> pd.Series:
     return column_data
 
 
-def group_by(*, df: pd.DataFrame, by: list[str], operation: str) -> pd.DataFrame:
+def get_aggregations(*, columns: list[str], by: list[str], operation: str) -> list[Aggregation]:
+    """
+    Get the named aggregations of an operation, count is a single `count_all`
+    measure named 'count', sum and mean are applied to every column that is not a key.
+
+    Parameters
+    ----------
+    columns : list[str]
+        The columns of the data.
+    by : list[str]
+        The columns to group by.
+    operation : str
+        The operation to perform on the grouped data, one of
+            - sum
+            - count
+            - mean
+
+    Returns
+    -------
+    list[Aggregation]
+        The aggregations as (column, function, name), the column of `count_all` is None.
+    """
+    if operation == 'count':
+        return [(None, 'count_all', 'count')]
+    if operation in ('sum', 'mean'):
+        return [(column, operation, column) for column in columns if column not in by]
+    raise ValueError(f'Operation {operation} not supported')
+
+
+def _sort_key(column: pa.ChunkedArray) -> tuple[np.ndarray, int]:
+    """
+    Get an integer key of a column with the same order and the number of its values,
+    the dictionaries are sorted by their values instead of their indices and the
+    nulls go last
+    """
+    column = column.combine_chunks() if column.num_chunks != 1 else column.chunk(0)
+    if pa.types.is_dictionary(column.type):
+        ranks: np.ndarray = np.empty(len(column.dictionary) + 1, dtype=np.int64)
+        ranks[pc.array_sort_indices(column.dictionary).to_numpy()] = np.arange(len(column.dictionary))
+        ranks[-1] = len(column.dictionary)
+        return ranks[column.indices.fill_null(-1).to_numpy(zero_copy_only=False)], len(ranks)
+    if pa.types.is_date32(column.type):
+        column = column.cast(pa.int32())
+    if pa.types.is_integer(column.type) and column.null_count < len(column):
+        low: int = pc.min(column).as_py()
+        high: int = pc.max(column).as_py()
+        values: np.ndarray = column.fill_null(high + 1).to_numpy().astype(np.int64) - low
+        return values, high - low + 2
+    ranks: np.ndarray = pc.rank(column, 'ascending', null_placement='at_end', tiebreaker='dense').to_numpy().astype(np.int64) - 1
+    return ranks, int(ranks.max()) + 1 if len(ranks) else 1
+
+
+def sort_table(*, table: pa.Table, by: list[str]) -> pa.Table:
+    """
+    Sort a table by columns, the dictionary columns are sorted by their values, as
+    the sorted categories of a pandas groupby.
+
+    The keys are packed in a single integer when their ranges allow it, which is
+    much faster than the multi-column sort of arrow.
+
+    Parameters
+    ----------
+    table : pa.Table
+        The table to sort.
+    by : list[str]
+        The columns to sort by.
+
+    Returns
+    -------
+    pa.Table
+        The sorted table.
+    """
+    if table.num_rows == 0:
+        return table
+    keys: list[tuple[np.ndarray, int]] = [_sort_key(table.column(column)) for column in by]
+    if np.prod([float(size) for _, size in keys]) < 2 ** 63:
+        packed: np.ndarray = np.zeros(table.num_rows, dtype=np.int64)
+        for values, size in keys:
+            packed = packed * size + values
+        indices: np.ndarray = np.argsort(packed, kind='stable')
+    else:
+        indices: np.ndarray = np.lexsort([values for values, _ in reversed(keys)])
+    return table.take(indices)
+
+
+def valid_keys(*, by: list[str]) -> pc.Expression:
+    """
+    Get the expression that keeps the rows whose keys are all valid, the groups of
+    the null keys are dropped the same as in the groupby of pandas.
+
+    Parameters
+    ----------
+    by : list[str]
+        The columns to group by.
+
+    Returns
+    -------
+    pc.Expression
+        The expression of the rows with all the keys valid.
+    """
+    return functools.reduce(operator.and_, [pc.field(column).is_valid() for column in by])
+
+
+def aggregate(
+        *,
+        table: pa.Table,
+        by: list[str],
+        aggregations: list[Aggregation],
+        sort: bool = True,
+    ) -> pa.Table:
+    """
+    Group a table by columns with the multi-threaded hash aggregation of arrow,
+    the keys can be dictionary columns and the rows with a null key are dropped.
+
+    Parameters
+    ----------
+    table : pa.Table
+        The table to group.
+    by : list[str]
+        The columns to group by.
+    aggregations : list[Aggregation]
+        The aggregations as (column, function, name), e.g. ('total', 'sum', 'total')
+        or (None, 'count_all', 'count').
+    sort : bool, Optional
+        If the groups are sorted by the keys, by default True.
+
+    Returns
+    -------
+    pa.Table
+        A flat table with the keys and the named aggregations as columns.
+    """
+    grouped: pa.Table = table.filter(valid_keys(by=by)).unify_dictionaries().group_by(by, use_threads=True).aggregate(
+        [([] if column is None else column, function) for column, function, _ in aggregations]
+    )
+    names: list[str] = [
+        function if column is None else f'{column}_{function}'
+        for column, function, _ in aggregations
+    ]
+    table_group: pa.Table = pa.table(
+        [grouped.column(column) for column in by] + [grouped.column(name) for name in names],
+        names=by + [name for _, _, name in aggregations],
+    )
+    return sort_table(table=table_group, by=by) if sort else table_group
+
+
+def group_by(*, table: pa.Table, by: list[str], operation: str) -> pa.Table:
     """
-    Group a dataframe by columns.
+    Group a table by columns, only the groups found in the data are kept.
+
+    Parameters
+    ----------
+    table : pa.Table
+        The table to group.
+    by : list[str]
+        The columns to group by.
+    operation : str
+        The operation to perform on the grouped data, one of
+            - sum
+            - count, the number of rows of every group in the column 'count'
+            - mean
+
+    Returns
+    -------
+    pa.Table
+        A flat table with the grouped data, sorted by the keys.
+    """
+    aggregations: list[Aggregation] = get_aggregations(columns=table.column_names, by=by, operation=operation)
+    table_group: pa.Table = aggregate(table=table, by=by, aggregations=aggregations)
+    return table_group
+
+
+def partial_group_by(*, df: pd.DataFrame, by: list[str], operation: str) -> pd.DataFrame:
+    """
+    Group a dataframe by columns keeping partial aggregates, which can be merged later
+    with `merge_partial_group_by` to get the same result as `group_by` over all the data.
+
+    For sum and count the partial aggregates are the grouped data itself, for mean
+    the sum and the count of every column are kept as `{column}_sum` and `{column}_count`.
 
     Parameters
     ----------
@@ -132,14 +476,328 @@ def group_by(*, df: pd.DataFrame, by: list[str], operation: str) -> pd.DataFrame
     Returns
     -------
     pd.DataFrame
-        A dataframe with the grouped data.
+        A flat dataframe with the group columns and the partial aggregates.
     """
-    df_grouped: Any = df.groupby(by=by)
-    if operation == 'sum':
-        df_grouped: Any = df_grouped.sum()
-    elif operation == 'count':
-        df_grouped: Any = df_grouped.count()
+    df_grouped: Any = df.groupby(by=by, observed=True)
+    if operation == 'count':
+        df_partial: pd.DataFrame = df_grouped.size().to_frame('count')
+    elif operation == 'sum':
+        df_partial: pd.DataFrame = df_grouped.sum()
     elif operation == 'mean':
-        df_grouped: Any = df_grouped.mean()
+        df_partial: pd.DataFrame = df_grouped.sum().add_suffix('_sum').join(df_grouped.count().add_suffix('_count'))
+    else:
+        raise ValueError(f'Operation {operation} not supported')
+    return df_partial.reset_index()
+
+
+def merge_partial_group_by(*, df: pd.DataFrame, by: list[str], operation: str) -> pd.DataFrame:
+    """
+    Merge the partial aggregates given by `partial_group_by`.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The dataframe with the partial aggregates, with the group columns as columns.
+    by : list[str]
+        The columns to group by.
+    operation : str
+        The operation of the partial aggregates, one of
+            - sum
+            - count
+            - mean
+
+    Returns
+    -------
+    pd.DataFrame
+        A flat dataframe with the grouped data, as given by `group_by`.
+    """
+    df_merged: pd.DataFrame = df.groupby(by=by, observed=True).sum()
+    if operation != 'mean':
+        return df_merged.reset_index()
+
+    columns: list[str] = [col.removesuffix('_sum') for col in df_merged.columns if col.endswith('_sum')]
+    df_mean: pd.DataFrame = pd.DataFrame(
+        {col: df_merged[f'{col}_sum'] / df_merged[f'{col}_count'] for col in columns},
+        index=df_merged.index,
+    )
+    return df_mean.reset_index()
+
+
+def partial_aggregate(*, table: pa.Table, by: list[str], operation: str) -> pa.Table:
+    """
+    Group a table by columns keeping partial aggregates, the arrow version of
+    `partial_group_by`, merged later with `merge_partial_aggregate`.
+
+    Parameters
+    ----------
+    table : pa.Table
+        The table to group.
+    by : list[str]
+        The columns to group by.
+    operation : str
+        The operation to perform on the grouped data, one of
+            - sum
+            - count
+            - mean
+
+    Returns
+    -------
+    pa.Table
+        A flat table with the keys and the partial aggregates, not sorted.
+    """
+    if operation != 'mean':
+        aggregations: list[Aggregation] = get_aggregations(columns=table.column_names, by=by, operation=operation)
+    else:
+        aggregations: list[Aggregation] = [
+            aggregation
+            for column in table.column_names if column not in by
+            for aggregation in ((column, 'sum', f'{column}_sum'), (column, 'count', f'{column}_count'))
+        ]
+    table_partial: pa.Table = aggregate(table=table, by=by, aggregations=aggregations, sort=False)
+    return table_partial
+
+
+def merge_partial_aggregate(*, table: pa.Table, by: list[str], operation: str) -> pa.Table:
+    """
+    Merge the partial aggregates given by `partial_aggregate`, the means are the
+    merged sums divided by the merged counts.
+
+    Parameters
+    ----------
+    table : pa.Table
+        The table with the partial aggregates.
+    by : list[str]
+        The columns to group by.
+    operation : str
+        The operation of the partial aggregates, one of
+            - sum
+            - count
+            - mean
+
+    Returns
+    -------
+    pa.Table
+        A flat table with the grouped data, as given by `group_by` but not sorted.
+    """
+    aggregations: list[Aggregation] = [(column, 'sum', column) for column in table.column_names if column not in by]
+    table_merged: pa.Table = aggregate(table=table, by=by, aggregations=aggregations, sort=False)
+    if operation != 'mean':
+        return table_merged
+
+    columns: list[str] = [col.removesuffix('_sum') for col in table_merged.column_names if col.endswith('_sum')]
+    table_mean: pa.Table = pa.table(
+        [table_merged.column(column) for column in by] + [
+            pc.divide(table_merged.column(f'{col}_sum').cast(pa.float64()), table_merged.column(f'{col}_count'))
+            for col in columns
+        ],
+        names=by + columns,
+    )
+    return table_mean
+
+
+def _bucket_ids(*, table: pa.Table, by: list[str], buckets: int) -> np.ndarray:
+    """
+    Get the bucket of every row of a table from the hash of its keys, the same keys
+    get the same bucket in every batch, whatever the dictionary of their batch
+    """
+    hashes: np.ndarray = np.zeros(table.num_rows, dtype=np.uint64)
+    for column in by:
+        values: pa.Array = table.column(column).combine_chunks()
+        if pa.types.is_dictionary(values.type):
+            dictionary: np.ndarray = pd.util.hash_array(values.dictionary.to_numpy(zero_copy_only=False))
+            column_hashes: np.ndarray = np.append(dictionary, np.uint64(0))[values.indices.fill_null(-1).to_numpy(zero_copy_only=False)]
+        else:
+            if pa.types.is_date32(values.type):
+                values = values.view(pa.int32())
+            if pa.types.is_integer(values.type) or pa.types.is_temporal(values.type):
+                values = values.cast(pa.int64()).fill_null(0)
+            elif pa.types.is_floating(values.type):
+                values = values.cast(pa.float64()).fill_null(0)
+            column_hashes: np.ndarray = pd.util.hash_array(values.to_numpy(zero_copy_only=False))
+        hashes = hashes * np.uint64(0x9E3779B97F4A7C15) + column_hashes
+    return (hashes % np.uint64(buckets)).astype(np.int64)
+
+
+def spill_group_by(
+        *,
+        batches: Iterable[pa.RecordBatch],
+        by: list[str],
+        operation: str,
+        buckets: int,
+        folder: str = 'data/spill',
+    ) -> pa.Table:
+    """
+    Group record batches by columns out of core, with the same result as `group_by`
+    over all of them, only a batch and a bucket are kept in memory at a time.
+
+    Every batch is hash partitioned by its keys into Arrow IPC files, one per bucket,
+    so all the rows of a group land in the same bucket, and then the buckets are
+    grouped one by one. The counts and the sums and means of integer columns are
+    partially aggregated before spilling and the partial aggregates are merged, the
+    float columns are spilled as rows, since their partial sums would change the
+    rounding of the result.
+
+    Parameters
+    ----------
+    batches : Iterable[pa.RecordBatch]
+        The record batches to group, e.g. `extr.iter_batches`.
+    by : list[str]
+        The columns to group by.
+    operation : str
+        The operation to perform on the grouped data, one of
+            - sum
+            - count
+            - mean
+    buckets : int
+        The number of buckets, the groups of a bucket must fit in memory.
+    folder : str, Optional
+        Path of the local folder of the spilled files, they are removed at the end,
+        by default 'data/spill'
+
+    Returns
+    -------
+    pa.Table
+        A flat table with the grouped data, sorted by the keys.
+    """
+    if storage.is_remote(folder):
+        raise ValueError(f'The spill folder {folder} must be a local folder')
+    os.makedirs(folder, exist_ok=True)
+    writers: dict[int, pa.ipc.RecordBatchStreamWriter] = {}
+    parts: list[pa.Table] = []
+    exact: bool | None = None
+    with tempfile.TemporaryDirectory(prefix='spill-', dir=folder) as spill:
+        try:
+            for batch in batches:
+                table: pa.Table = pa.Table.from_batches([batch])
+                if exact is None:
+                    exact = operation == 'count' or all(
+                        pa.types.is_integer(field.type) for field in table.schema if field.name not in by
+                    )
+                if exact:
+                    table = partial_aggregate(table=table, by=by, operation=operation)
+                ids: np.ndarray = _bucket_ids(table=table, by=by, buckets=buckets)
+                order: np.ndarray = np.argsort(ids, kind='stable')
+                bounds: np.ndarray = np.searchsorted(ids[order], np.arange(buckets + 1))
+                table = table.take(order)
+                for bucket in np.flatnonzero(np.diff(bounds)):
+                    if bucket not in writers:
+                        writers[bucket] = pa.ipc.new_stream(os.path.join(spill, f'{bucket}.arrows'), table.schema)
+                    writers[bucket].write_table(table.slice(bounds[bucket], bounds[bucket + 1] - bounds[bucket]))
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        for bucket in sorted(writers):
+            with pa.ipc.open_stream(os.path.join(spill, f'{bucket}.arrows')) as reader:
+                table: pa.Table = reader.read_all()
+            if exact:
+                parts.append(merge_partial_aggregate(table=table, by=by, operation=operation))
+            else:
+                aggregations: list[Aggregation] = get_aggregations(columns=table.column_names, by=by, operation=operation)
+                parts.append(aggregate(table=table, by=by, aggregations=aggregations, sort=False))
+            del table
+
+    if not parts:
+        raise ValueError('There are no batches to group')
+    table_group: pa.Table = pa.concat_tables(parts).unify_dictionaries()
+    return sort_table(table=table_group, by=by)
+
+
+def _group_ids(*, df: pd.DataFrame, events: pd.DataFrame, by: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """ Get dense ids of the groups of two dataframes, the same keys get the same id in both """
+    arrays: list[np.ndarray] = []
+    for column in by:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) or isinstance(events[column].dtype, pd.CategoricalDtype):
+            categorical: pd.Categorical = union_categoricals(
+                [df[column].astype('category'), events[column].astype('category')],
+                ignore_order=True,
+            )
+            arrays.append(categorical.codes)
+        else:
+            arrays.append(np.concatenate([df[column].to_numpy(), events[column].to_numpy()]))
+    keys: pd.DataFrame = pd.DataFrame(dict(enumerate(arrays)), copy=False)
+    ids: np.ndarray = keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy(dtype=np.int64)
+    return ids[:len(df)], ids[len(df):]
+
+
+def _days(column: pd.Series) -> np.ndarray:
+    """ Get the days since 1970-01-01 of a date column """
+    days: np.ndarray = column.astype('datetime64[s]').to_numpy().astype('datetime64[D]').astype(np.int64)
+    return days
+
+
+def trailing_window(
+        *,
+        df: pd.DataFrame,
+        events: pd.DataFrame,
+        by: list[str],
+        on: str,
+        window: tuple[int, int],
+        values: list[str] | None = None,
+    ) -> pd.DataFrame:
+    """
+    Aggregate, for every row of a dataframe, the events with the same keys whose date
+    is inside a window relative to the date of the row, e.g. (-21, -1) for the three
+    weeks before it, or (0, 0) for the same day.
+
+    The events are sorted once by their keys and date, then the first and last event
+    of the window of every row are found with a binary search, so the counts are the
+    difference of two positions and the sums the difference of two cumulative sums
+    of the group, the sums do not depend on the events of the other groups.
+    There is no join between the rows and the events, the memory is linear in both.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The dataframe with a row per window, e.g. the prints.
+    events : pd.DataFrame
+        The events to aggregate, with the same key and date column names as `df`.
+    by : list[str]
+        The key columns, e.g. ['user_id', 'event_data_value_prop'].
+    on : str
+        The date column.
+    window : tuple[int, int]
+        The first and last day of the window relative to the date of the row, both included.
+    values : list[str] | None, Optional
+        The columns of the events to sum, by default None
+
+    Returns
+    -------
+    pd.DataFrame
+        A dataframe with the index of `df`, the number of events of every window in
+        the column `count` and the sum of every column of `values`.
+    """
+    first, last = window
+    if events.empty or df.empty:
+        # The sums keep the types of the non empty windows, e.g. float for the totals,
+        # so the features of every bucket have the same schema
+        result: dict[str, Any] = {
+            'count': np.zeros(len(df), dtype=np.intp),
+            **{value: np.zeros(len(df), dtype=np.result_type(events[value].to_numpy().dtype, np.int64)) for value in values or []},
+        }
+        return pd.DataFrame(result, index=df.index)
+
+    ids_df, ids_events = _group_ids(df=df, events=events, by=by)
+    days_df: np.ndarray = _days(df[on])
+    days_events: np.ndarray = _days(events[on])
+    base: int = min(int(days_df.min()) + first - 1, int(days_events.min()))
+
+    keys_events: np.ndarray = (ids_events << 32) | (days_events - base)
+    order: np.ndarray = np.argsort(keys_events, kind='stable')
+    keys_events = keys_events[order]
+    end: np.ndarray = np.searchsorted(keys_events, (ids_df << 32) | (days_df + last - base), side='right')
+    start: np.ndarray = np.searchsorted(keys_events, (ids_df << 32) | (days_df + first - 1 - base), side='right')
 
-    return df_grouped
+    result: dict[str, np.ndarray] = {'count': end - start}
+    if values:
+        group_start: np.ndarray = np.searchsorted(keys_events, ids_df << 32, side='left')
+        groups: np.ndarray = keys_events >> 32
+    for value in values or []:
+        cumulative: np.ndarray = np.concatenate([
+            [0],
+            pd.Series(events[value].to_numpy()[order]).groupby(groups).cumsum().to_numpy(),
+        ])
+        before: np.ndarray = np.where(start > group_start, cumulative[start], 0)
+        result[value] = np.where(end > start, cumulative[end] - before, 0)
+    df_window: pd.DataFrame = pd.DataFrame(result, index=df.index)
+    return df_window
@@ -0,0 +1,232 @@
+"""
+Here you can find a content addressed cache for the outputs of the pipeline steps.
+
+The key of a step is built from the fingerprints of its input files, the code of
+the step function and its keyword arguments. When the key is found in the cache
+the cached outputs are copied instead of running the step. The cache folder is
+kept under a size limit removing the least recently used entries, it is a local
+folder while the inputs and outputs of the steps can be URIs of an object storage.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import re
+import shutil
+import types
+from typing import Any, Callable
+import pyarrow.fs as pafs
+from etl.utils import (
+    pprint,
+    storage,
+)
+
+
+CACHE_DIR: str = 'data/cache'
+MAX_BYTES: int = 10 * 1024 ** 3
+ENABLED: bool = False
+# Version of the keys, increase it to invalidate the entries when a step changes
+# in a way its code does not show, e.g. a helper it calls
+CODE_VERSION: int = 1
+KEY_PATTERN: re.Pattern = re.compile(r'[0-9a-f]{64}')
+
+
+def configure(*, enabled: bool = True, folder: str = CACHE_DIR, max_bytes: int = MAX_BYTES) -> None:
+    """
+    Configure the cache of the steps
+
+    Parameters
+    ----------
+    enabled: bool, Optional
+        If the steps use the cache, by default True
+    folder: str, Optional
+        Path of the folder of the cache, by default 'data/cache'
+    max_bytes: int, Optional
+        Maximum size of the folder of the cache, by default 10 GiB
+    """
+    global CACHE_DIR, MAX_BYTES, ENABLED
+    CACHE_DIR, MAX_BYTES, ENABLED = folder, max_bytes, enabled
+
+
+def _file_fingerprint(file_info: pafs.FileInfo, path: str) -> list[Any]:
+    """
+    Get the fingerprint of a file, the size and the footer for parquet files,
+    which holds the row group statistics, the size and mtime for other files
+    """
+    size: int = file_info.size
+    if size > 12:
+        with storage.open_input_file(path) as file:
+            file.seek(size - 8)
+            tail: bytes = file.read(8)
+            footer_size: int = int.from_bytes(tail[:4], 'little')
+            if tail[4:] == b'PAR1' and footer_size + 8 <= size:
+                file.seek(size - footer_size - 8)
+                return [size, hashlib.sha256(file.read(footer_size)).hexdigest()]
+    return [size, file_info.mtime_ns]
+
+
+def fingerprint(*, paths: list[str]) -> list[Any]:
+    """
+    Get the fingerprint of some files or folders, e.g. partitioned datasets
+
+    Parameters
+    ----------
+    paths: list[str]
+        The paths of the files or folders, local or URIs
+
+    Returns
+    -------
+    list[Any]
+        The fingerprint of every file
+    """
+    fingerprints: list[Any] = []
+    for path in paths:
+        if storage.is_dir(path):
+            prefix: str = storage.resolve(path)[1].rstrip('/') + '/'
+            for file_info in storage.walk(path):
+                name: str = file_info.path.removeprefix(prefix)
+                fingerprints.append([name, *_file_fingerprint(file_info, f'{path.rstrip("/")}/{name}')])
+        elif storage.is_file(path):
+            fingerprints.append([path, *_file_fingerprint(storage.info(path), path)])
+        else:
+            fingerprints.append([path, None])
+    return fingerprints
+
+
+def _code_hash(code: types.CodeType) -> str:
+    """ Get the hash of the code of a function, its bytecode, names and constants, the nested functions included """
+    digest: Any = hashlib.sha256(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        digest.update((_code_hash(const) if isinstance(const, types.CodeType) else repr(const)).encode())
+    return digest.hexdigest()
+
+
+def get_key(*, func: Callable, kwargs: dict[str, Any], inputs: list[str], outputs: list[str] | None = None) -> str:
+    """
+    Get the key of a step in the cache
+
+    Parameters
+    ----------
+    func: Callable
+        The function of the step
+    kwargs: dict[str, Any]
+        The keyword arguments of the step
+    inputs: list[str]
+        The paths of the input files of the step
+    outputs: list[str] | None, Optional
+        The paths of the output files of the step, so a change of the staging
+        format is a different key, by default None
+
+    Returns
+    -------
+    str
+        The key of the step
+    """
+    content: dict[str, Any] = {
+        'func': f'{func.__module__}.{func.__qualname__}',
+        'code': _code_hash(func.__code__),
+        'version': CODE_VERSION,
+        'kwargs': kwargs,
+        'inputs': fingerprint(paths=inputs),
+        'outputs': outputs or [],
+    }
+    key: str = hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+    return key
+
+
+def _size(path: str) -> int:
+    """ Get the size of a folder """
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def evict(*, folder: str, max_bytes: int, keep: str | None = None) -> None:
+    """
+    Remove the least recently used entries of the cache until its size is under the limit,
+    only the folders named by a key are entries, not the ones being written or the
+    other caches in the folder, e.g. 'data/cache/storage'
+
+    Parameters
+    ----------
+    folder: str
+        Path of the folder of the cache
+    max_bytes: int
+        Maximum size of the folder of the cache
+    keep: str | None, Optional
+        Key of an entry that is never removed, by default None
+    """
+    entries: list[tuple[float, int, str]] = sorted(
+        (os.stat(path).st_mtime, _size(path), path)
+        for path in (os.path.join(folder, name) for name in os.listdir(folder) if KEY_PATTERN.fullmatch(name))
+        if os.path.isdir(path)
+    )
+    total: int = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if os.path.basename(path) == keep:
+            continue
+        shutil.rmtree(path)
+        total -= size
+        pprint.info(f'cache entry {{ {os.path.basename(path)[:12]} }} evicted')
+
+
+def memoize(
+        *,
+        inputs: Callable[..., list[str]],
+        outputs: Callable[..., list[str]],
+    ) -> Callable:
+    """
+    Decorator to cache the outputs of a step, the step must only take keyword arguments
+
+    Parameters
+    ----------
+    inputs: Callable[..., list[str]]
+        Function of the keyword arguments of the step, defaults included, that returns
+        the paths of its inputs
+    outputs: Callable[..., list[str]]
+        Function of the keyword arguments of the step, defaults included, that returns
+        the paths of its outputs
+
+    Returns
+    -------
+    Callable
+        The decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(**kwargs):
+            if not ENABLED:
+                return func(**kwargs)
+
+            arguments: inspect.BoundArguments = inspect.signature(func).bind(**kwargs)
+            arguments.apply_defaults()
+            kwargs = arguments.kwargs
+            paths: list[str] = outputs(**kwargs)
+            key: str = get_key(func=func, kwargs=kwargs, inputs=inputs(**kwargs), outputs=paths)
+            entry: str = os.path.join(CACHE_DIR, key)
+            if os.path.isdir(entry):
+                for path in paths:
+                    storage.copy(os.path.join(entry, os.path.basename(path)), path)
+                    if not storage.is_remote(path):
+                        os.utime(path)
+                os.utime(entry)
+                pprint.success(f'{func.__name__} loaded from cache {{ {key[:12]} }}')
+                return None
+
+            result: Any = func(**kwargs)
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp: str = f'{entry}.tmp'
+            os.makedirs(tmp, exist_ok=True)
+            for path in paths:
+                storage.copy(path, os.path.join(tmp, os.path.basename(path)))
+            os.replace(tmp, entry)
+            evict(folder=CACHE_DIR, max_bytes=MAX_BYTES, keep=key)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,125 @@
+"""
+Here you can find the checkpoints of the streamed extractions.
+
+A streamed source is saved chunk by chunk as parquet parts, every part is written
+atomically and then committed in the manifest of the artifact, with the offset in
+the source of the end of the lines it has and its rows and row groups. When a run
+fails, the next run resumes from the offset of the last committed part instead of
+reading the source again from its first byte, and once the last part is committed
+the parts are saved as the artifact and the checkpoint is removed.
+
+The manifest also keeps the size and modification time of the source, a checkpoint
+of a source that changed since it was written is discarded.
+"""
+import json
+import pyarrow.parquet as pq
+from typing import Any
+from etl.utils import (
+    pprint,
+    storage,
+)
+
+
+FOLDER: str = '_checkpoints'
+# The parts are rewritten in the artifact once all of them are committed, so they
+# are compressed with a fast codec
+COMPRESSION: str = 'lz4'
+
+
+def manifest_path(*, folder: str, name: str) -> str:
+    """ Get the path of the manifest of an artifact, e.g. 'data/raw/_checkpoints/prints.json' """
+    return f'{folder}/{FOLDER}/{name}.json'
+
+
+def part_path(*, folder: str, name: str, index: int) -> str:
+    """ Get the path of a part of an artifact, e.g. 'data/raw/_checkpoints/prints/part-00000.parquet' """
+    return f'{folder}/{FOLDER}/{name}/part-{index:05d}.parquet'
+
+
+def _write(*, path: str, manifest: dict[str, Any]) -> None:
+    """ Write a manifest atomically, so a failed run never leaves it half written """
+    with storage.atomic(path) as tmp, storage.open_output_stream(tmp) as sink:
+        sink.write(json.dumps(manifest, indent=4).encode('utf-8'))
+
+
+def start(*, folder: str, name: str, source: str) -> dict[str, Any]:
+    """
+    Get the manifest of an artifact to resume its extraction, a new one if there is
+    no checkpoint or if the source changed since it was written
+
+    Parameters
+    ----------
+    folder: str
+        Path of the folder of the artifact, e.g. 'data/raw'
+    name: str
+        Name of the artifact, e.g. 'prints'
+    source: str
+        Path of the source the artifact is extracted from
+
+    Returns
+    -------
+    dict[str, Any]
+        The manifest, with the offset to resume from and the committed parts
+    """
+    fresh: dict[str, Any] = {
+        'source': source,
+        'size': storage.size(source),
+        'mtime': storage.mtime(source),
+        'offset': 0,
+        'rows': 0,
+        'parts': [],
+    }
+    path: str = manifest_path(folder=folder, name=name)
+    if storage.is_file(path):
+        with storage.open_input_stream(path) as stream:
+            manifest: dict[str, Any] = json.loads(stream.read())
+        if all(manifest.get(key) == fresh[key] for key in ('source', 'size', 'mtime')):
+            pprint.info(
+                f'checkpoint {{ {name} }} resumed from byte {manifest["offset"]}, '
+                f'{len(manifest["parts"])} parts and {manifest["rows"]} rows committed'
+            )
+            return manifest
+        pprint.warning(f'checkpoint {{ {name} }} discarded, its source changed')
+    clear(folder=folder, name=name)
+    storage.makedirs(f'{folder}/{FOLDER}/{name}')
+    return fresh
+
+
+def commit(
+        *,
+        folder: str,
+        name: str,
+        manifest: dict[str, Any],
+        part: str,
+        rows: int,
+        offset: int,
+    ) -> None:
+    """
+    Commit a written part in the manifest of an artifact
+
+    Parameters
+    ----------
+    folder: str
+        Path of the folder of the artifact
+    name: str
+        Name of the artifact
+    manifest: dict[str, Any]
+        The manifest given by `start`, it is updated in place
+    part: str
+        Path of the part
+    rows: int
+        The number of rows of the part
+    offset: int
+        The offset in the source of the end of the lines of the part
+    """
+    row_groups: int = pq.ParquetFile(storage.open_input_file(part)).metadata.num_row_groups
+    manifest['parts'].append({'path': part, 'rows': rows, 'row_groups': row_groups, 'offset': offset})
+    manifest['offset'] = offset
+    manifest['rows'] += rows
+    _write(path=manifest_path(folder=folder, name=name), manifest=manifest)
+
+
+def clear(*, folder: str, name: str) -> None:
+    """ Remove the manifest and the parts of an artifact """
+    storage.remove(f'{folder}/{FOLDER}/{name}')
+    storage.remove(manifest_path(folder=folder, name=name))
@@ -0,0 +1,199 @@
+"""
+Here you can find a small DAG scheduler for the steps of the pipelines.
+
+Every node declares the artifacts it reads and writes, the dependencies between
+nodes come from those artifacts. A node is skipped when the fingerprints of its
+inputs and outputs are the same as in its last run, so after a failure only the
+failed branch runs again.
+"""
+import functools
+import hashlib
+import json
+from typing import Any, Callable, NamedTuple
+from etl.utils import (
+    pprint,
+    executor as exe,
+    storage,
+)
+
+
+class Node(NamedTuple):
+    """
+    This class is used to declare a node of the DAG.
+    """
+    name: str
+    func: Callable[[], Any]
+    inputs: tuple[str, ...] = ()
+    outputs: tuple[str, ...] = ()
+
+
+def fingerprint(*, paths: tuple[str, ...], resolve: Callable[[str], str] = lambda path: path) -> str | None:
+    """
+    Get a fingerprint of some artifacts from the size and modification time of their files,
+    the files of the folders, e.g. partitioned datasets, are included
+
+    Parameters
+    ----------
+    paths: tuple[str, ...]
+        The artifacts
+    resolve: Callable[[str], str], Optional
+        A function to get the path of an artifact, by default the artifact itself
+
+    Returns
+    -------
+    str | None
+        The fingerprint, None if some artifact does not exist
+    """
+    stats: list[tuple[str, int, int]] = []
+    for artifact in paths:
+        path: str = resolve(artifact)
+        if not storage.is_file(path) and not storage.is_dir(path):
+            return None
+        for file in storage.walk(path):
+            stats.append((file.path, file.size, file.mtime_ns))
+    return hashlib.sha256(json.dumps(stats).encode()).hexdigest()
+
+
+def _call_node(func: Callable[[], Any]) -> Exception | None:
+    """ Run the function of a node, returning its error instead of raising it """
+    try:
+        func()
+    except Exception as error:
+        pprint.error(f'{type(error).__name__}: {error}')
+        return error
+    return None
+
+
+def get_dependencies(*, nodes: list[Node]) -> dict[str, set[str]]:
+    """
+    Get the nodes every node depends on, the ones writing its inputs
+
+    Parameters
+    ----------
+    nodes: list[Node]
+        The nodes of the DAG
+
+    Returns
+    -------
+    dict[str, set[str]]
+        The names of the nodes every node depends on
+    """
+    writers: dict[str, str] = {output: node.name for node in nodes for output in node.outputs}
+    dependencies: dict[str, set[str]] = {
+        node.name: {writers[artifact] for artifact in node.inputs if artifact in writers}
+        for node in nodes
+    }
+    return dependencies
+
+
+def get_downstream(*, nodes: list[Node], start: str) -> set[str]:
+    """
+    Get a node and all the nodes that depend on it, directly or not
+
+    Parameters
+    ----------
+    nodes: list[Node]
+        The nodes of the DAG
+    start: str
+        The name of the first node
+
+    Returns
+    -------
+    set[str]
+        The names of the nodes
+    """
+    dependencies: dict[str, set[str]] = get_dependencies(nodes=nodes)
+    if start not in dependencies:
+        raise ValueError(f'Node {start} not found')
+    downstream: set[str] = {start}
+    changed: bool = True
+    while changed:
+        changed = False
+        for name, deps in dependencies.items():
+            if name not in downstream and deps & downstream:
+                downstream.add(name)
+                changed = True
+    return downstream
+
+
+def run(
+        *,
+        nodes: list[Node],
+        state_path: str = 'data/staging/_dag.json',
+        workers: int = 1,
+        processes: bool = False,
+        from_node: str | None = None,
+        resolve: Callable[[str], str] = lambda path: path,
+    ) -> None:
+    """
+    Run the nodes of a DAG, every wave runs the nodes whose dependencies are done
+
+    Parameters
+    ----------
+    nodes: list[Node]
+        The nodes of the DAG
+    state_path: str, Optional
+        Path of the json file with the fingerprints of the last run of every node,
+        by default 'data/staging/_dag.json'
+    workers: int, Optional
+        The number of nodes to run at the same time, by default 1
+    processes: bool, Optional
+        If the nodes run in a process pool instead of a thread pool, by default False
+    from_node: str | None, Optional
+        If given, this node and the nodes downstream of it run even if they are up
+        to date, and the other nodes are not run, by default None
+    resolve: Callable[[str], str], Optional
+        A function to get the path of an artifact, by default the artifact itself
+    """
+    state: dict[str, dict[str, str | None]] = {}
+    if storage.is_file(state_path):
+        with storage.open_input_stream(state_path) as stream:
+            state = json.loads(stream.read())
+
+    dependencies: dict[str, set[str]] = get_dependencies(nodes=nodes)
+    forced: set[str] = get_downstream(nodes=nodes, start=from_node) if from_node is not None else set()
+    by_name: dict[str, Node] = {node.name: node for node in nodes}
+    done: set[str] = set()
+    while len(done) < len(nodes):
+        ready: list[Node] = [
+            node for node in nodes
+            if node.name not in done and dependencies[node.name] <= done
+        ]
+        if not ready:
+            raise ValueError(f'Cycle found between the nodes {set(by_name) - done}')
+
+        to_run: list[Node] = []
+        for node in ready:
+            inputs: str | None = fingerprint(paths=node.inputs, resolve=resolve)
+            outputs: str | None = fingerprint(paths=node.outputs, resolve=resolve)
+            last: dict[str, str | None] = state.get(node.name, {})
+            if from_node is not None and node.name not in forced:
+                pprint.info(f'Node {{ {node.name} }} skipped, not downstream of {from_node}')
+            elif (
+                node.name not in forced
+                and outputs is not None
+                and last.get('inputs') == inputs
+                and last.get('outputs') == outputs
+            ):
+                pprint.info(f'Node {{ {node.name} }} up to date')
+            else:
+                to_run.append(node)
+
+        errors: dict[str, Exception | None] = exe.run_tasks(
+            tasks=[(node.name, functools.partial(_call_node, node.func)) for node in to_run],
+            workers=workers,
+            processes=processes,
+        )
+        for node in to_run:
+            if errors[node.name] is not None:
+                continue
+            state[node.name] = {
+                'inputs': fingerprint(paths=node.inputs, resolve=resolve),
+                'outputs': fingerprint(paths=node.outputs, resolve=resolve),
+            }
+            with storage.atomic(state_path) as tmp, storage.open_output_stream(tmp) as sink:
+                sink.write(json.dumps(state, indent=4).encode('utf-8'))
+        failed: list[str] = [name for name, error in errors.items() if error is not None]
+        if failed:
+            raise RuntimeError(f'Nodes {failed} failed') from errors[failed[0]]
+        done.update(node.name for node in ready)
@@ -0,0 +1,266 @@
+"""
+Here you can find the connections to the SQL databases of the pipelines.
+
+A database is given by an url, e.g. 'sqlite:///data/meli.db', 'duckdb:///data/meli.duckdb'
+or 'adbc-sqlite:///data/meli.db', and its connections are kept in a pool shared by
+the threads of the process, so the steps do not open a connection per table. The
+ADBC and DuckDB drivers are optional, the connections of ADBC move arrow tables
+without converting them to python objects.
+"""
+import contextlib
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable, Iterator
+import pyarrow as pa
+from etl.utils import pprint
+
+try:
+    import adbc_driver_sqlite.dbapi as adbc_sqlite
+except ImportError:
+    adbc_sqlite = None
+
+try:
+    import adbc_driver_postgresql.dbapi as adbc_postgresql
+except ImportError:
+    adbc_postgresql = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+POOL_SIZE: int = 4
+
+# Types of the columns of the tables created from arrow schemas
+SQL_TYPES: tuple[tuple[Callable[[pa.DataType], bool], str], ...] = (
+    (pa.types.is_boolean, 'BOOLEAN'),
+    (pa.types.is_integer, 'BIGINT'),
+    (pa.types.is_floating, 'DOUBLE PRECISION'),
+    (pa.types.is_date, 'DATE'),
+    (pa.types.is_timestamp, 'TIMESTAMP'),
+)
+
+_pools: dict[str, 'ConnectionPool'] = {}
+_lock: threading.Lock = threading.Lock()
+
+
+def _connect(url: str) -> Any:
+    """ Open a new DB-API connection to the database of an url """
+    scheme, _, path = url.partition('://')
+    path = path.removeprefix('/') if scheme != 'adbc-postgresql' else f'postgresql://{path}'
+    if scheme == 'sqlite':
+        return sqlite3.connect(path or ':memory:', check_same_thread=False)
+    if scheme == 'duckdb' and duckdb is not None:
+        return duckdb.connect(path or ':memory:')
+    if scheme == 'adbc-sqlite' and adbc_sqlite is not None:
+        return adbc_sqlite.connect(path or ':memory:')
+    if scheme == 'adbc-postgresql' and adbc_postgresql is not None:
+        return adbc_postgresql.connect(path)
+    raise ValueError(f'The database {{ {url} }} is not supported or its driver is not installed')
+
+
+class ConnectionPool:
+    """
+    This class is used to share the connections to a database, a connection is
+    taken from the pool while it is used and then given back to it.
+    """
+
+    def __init__(self, url: str, size: int = POOL_SIZE):
+        self.url = url
+        self.dialect = url.partition('://')[0].removeprefix('adbc-')
+        self.size = size
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[Any]:
+        """ Take a connection from the pool, a new one is opened if all of them are in use """
+        try:
+            conn: Any = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                opened: bool = self.opened < self.size
+                self.opened += opened
+            conn: Any = _connect(self.url) if opened else self.idle.get()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.idle.put(conn)
+
+    def close(self) -> None:
+        """ Close the idle connections of the pool """
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.opened -= 1
+
+
+def get_pool(*, url: str, size: int = POOL_SIZE) -> ConnectionPool:
+    """
+    Get the pool of connections of a database, it is created on the first call
+
+    Parameters
+    ----------
+    url: str
+        The url of the database, e.g. 'sqlite:///data/meli.db'
+    size: int, Optional
+        The maximum number of connections of the pool, by default 4
+
+    Returns
+    -------
+    ConnectionPool
+        The pool of the database
+    """
+    with _lock:
+        if url not in _pools:
+            _pools[url] = ConnectionPool(url, size=size)
+            pprint.info(f'Pool of {size} connections to {{ {url} }} created')
+        return _pools[url]
+
+
+def close_pools() -> None:
+    """ Close the connections of all the pools """
+    with _lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def is_adbc(*, conn: Any) -> bool:
+    """ Check if a connection is an ADBC connection, which reads and writes arrow tables """
+    return hasattr(conn, 'adbc_get_info')
+
+
+def begin(*, conn: Any) -> None:
+    """
+    Open a transaction on a connection, sqlite3 and DuckDB run the statements that
+    are not inserts or updates, e.g. DROP TABLE, outside of a transaction unless one
+    is opened first, the ADBC connections are always in one
+
+    Parameters
+    ----------
+    conn: Any
+        The DB-API connection
+    """
+    if not is_adbc(conn=conn) and not getattr(conn, 'in_transaction', False):
+        conn.execute('BEGIN')
+
+
+def to_parameters(*, table: pa.Table | pa.RecordBatch, dialect: str = 'sqlite') -> pa.Table | pa.RecordBatch:
+    """
+    Cast the columns of a table to the types the drivers take as parameters, the
+    dictionaries are decoded and, for SQLite, which has no date type, the dates
+    are written as ISO strings
+
+    Parameters
+    ----------
+    table: pa.Table | pa.RecordBatch
+        The table or record batch to cast
+    dialect: str, Optional
+        The dialect of the database, by default 'sqlite'
+
+    Returns
+    -------
+    pa.Table | pa.RecordBatch
+        The table or record batch with the types of the parameters
+    """
+    fields: list[pa.Field] = []
+    for field in table.schema:
+        data_type: pa.DataType = field.type.value_type if pa.types.is_dictionary(field.type) else field.type
+        if dialect == 'sqlite' and (pa.types.is_date(data_type) or pa.types.is_timestamp(data_type)):
+            data_type = pa.string()
+        fields.append(pa.field(field.name, data_type))
+    return table.cast(pa.schema(fields))
+
+
+def quote(name: str) -> str:
+    """ Quote the name of a table or a column """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sql_type(data_type: pa.DataType) -> str:
+    """ Get the SQL type of an arrow type, the strings and dictionaries are TEXT """
+    for check, name in SQL_TYPES:
+        if check(data_type):
+            return name
+    return 'TEXT'
+
+
+def create_table_sql(*, name: str, schema: pa.Schema, keys: list[str] | None = None) -> str:
+    """
+    Get the statement to create a table from an arrow schema, if it does not exist
+
+    Parameters
+    ----------
+    name: str
+        The name of the table
+    schema: pa.Schema
+        The schema of the table
+    keys: list[str] | None, Optional
+        The columns of the primary key, needed to upsert, they are NOT NULL since
+        the rows with a null key are never in conflict, by default None
+
+    Returns
+    -------
+    str
+        The CREATE TABLE statement
+    """
+    columns: list[str] = [
+        f'{quote(field.name)} {sql_type(field.type)}' + (' NOT NULL' if keys and field.name in keys else '')
+        for field in schema
+    ]
+    if keys:
+        columns.append(f'PRIMARY KEY ({", ".join(map(quote, keys))})')
+    return f'CREATE TABLE IF NOT EXISTS {quote(name)} ({", ".join(columns)})'
+
+
+def insert_sql(
+        *,
+        name: str,
+        columns: list[str],
+        keys: list[str] | None = None,
+        dialect: str = 'sqlite',
+    ) -> str:
+    """
+    Get the statement to insert the rows of a table, the rows whose keys are already
+    in the table are updated when the keys are given
+
+    Parameters
+    ----------
+    name: str
+        The name of the table
+    columns: list[str]
+        The columns to insert
+    keys: list[str] | None, Optional
+        The columns of the primary key, if given the statement is an upsert, by default None
+    dialect: str, Optional
+        The dialect of the database, the placeholders of 'postgresql' are '$1', '$2', ...
+        and the ones of the other dialects are '?', by default 'sqlite'
+
+    Returns
+    -------
+    str
+        The INSERT statement
+    """
+    placeholders: list[str] = [
+        f'${i}' if dialect == 'postgresql' else '?'
+        for i in range(1, len(columns) + 1)
+    ]
+    statement: str = (
+        f'INSERT INTO {quote(name)} ({", ".join(map(quote, columns))}) '
+        f'VALUES ({", ".join(placeholders)})'
+    )
+    if not keys:
+        return statement
+    updates: list[str] = [f'{quote(column)} = excluded.{quote(column)}' for column in columns if column not in keys]
+    action: str = f'DO UPDATE SET {", ".join(updates)}' if updates else 'DO NOTHING'
+    return f'{statement} ON CONFLICT ({", ".join(map(quote, keys))}) {action}'
@@ -1,17 +1,35 @@
 import functools
-from datetime import datetime
-from etl.utils import pprint
+import datetime as dt
+from typing import Any
+import pandas as pd
+import pyarrow as pa
+from etl.utils import (
+    pprint,
+    logging as log,
+)
+
+
+def _rows(value: Any) -> int:
+    """ Get the number of rows of a dataframe or an arrow table, 0 for other values """
+    if isinstance(value, (pd.DataFrame, pd.Series, pa.Table, pa.RecordBatch)):
+        return len(value)
+    return 0
 
 
 def time_it(func):
-    """ Decorator for timing functions """
+    """
+    Decorator for tracing functions, the call runs in a span of `log.span` with the
+    rows of the dataframes and tables it takes and returns, and its time is printed
+    indented by the depth of the span
+    """
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start = datetime.now()
-        result = func(*args, **kwargs)
-        end = datetime.now()
-        pprint.time(f'Function {func.__name__} took {end - start}')
+        with log.span(func.__qualname__, module=func.__module__) as record:
+            record['rows_in'] += sum(_rows(value) for value in (*args, *kwargs.values()))
+            result = func(*args, **kwargs)
+            record['rows_out'] += _rows(result)
+        indent: str = '  ' * record['depth']
+        pprint.time(f'{indent}Function {func.__name__} took {dt.timedelta(seconds=record["wall"])}')
         print()
         return result
     return wrapper
-
@@ -0,0 +1,136 @@
+"""
+Here you can find an executor to run independent tasks of a step in parallel.
+
+The console output of every task is buffered and printed as one block when the
+task finishes, so the trace of the `pprint` functions is not interleaved, and the
+output of a task that fails is printed before its error. The tasks run in threads
+see the context of the caller, so their spans are nested in the span of the step.
+"""
+import io
+import sys
+import threading
+import contextlib
+import contextvars
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from typing import Any, Callable, TypeAlias
+from etl.utils import pprint
+
+
+TaskName: TypeAlias = str
+Task: TypeAlias = tuple[TaskName, Callable[[], Any]]
+
+
+class _ThreadStdout(io.TextIOBase):
+    """
+    This class is used as `sys.stdout` while the tasks run in threads,
+    the text written by every thread goes to its own buffer.
+    """
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.local = threading.local()
+
+    def start(self) -> None:
+        self.local.buffer = io.StringIO()
+
+    def stop(self) -> str:
+        output: str = self.local.buffer.getvalue()
+        self.local.buffer = None
+        return output
+
+    def write(self, text: str) -> int:
+        buffer: io.StringIO | None = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            return self.stdout.write(text)
+        return buffer.write(text)
+
+    def flush(self) -> None:
+        self.stdout.flush()
+
+
+def _run_in_thread(func: Callable[[], Any], stdout: _ThreadStdout) -> tuple[Any, str]:
+    """ Run a task in a thread and return its result and its console output, kept in the `output` of its error if it fails """
+    stdout.start()
+    try:
+        result: Any = func()
+    except Exception as error:
+        error.output = stdout.stop()
+        raise
+    output: str = stdout.stop()
+    return result, output
+
+
+def _run_in_process(func: Callable[[], Any]) -> tuple[Any, str]:
+    """ Run a task in a process and return its result and its console output, kept in the `output` of its error if it fails """
+    buffer: io.StringIO = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buffer):
+            result: Any = func()
+    except Exception as error:
+        error.output = buffer.getvalue()
+        raise
+    return result, buffer.getvalue()
+
+
+def run_tasks(
+        *,
+        tasks: list[Task],
+        workers: int = 1,
+        processes: bool = False,
+        in_processes: tuple[TaskName, ...] = (),
+    ) -> dict[TaskName, Any]:
+    """
+    Run independent tasks, in parallel if more than one worker is given
+
+    Parameters
+    ----------
+    tasks: list[Task]
+        The tasks to run, with their names, the callables must not take arguments,
+        e.g. a `functools.partial` of a module function when processes are used
+    workers: int, Optional
+        The number of tasks to run at the same time, by default 1
+    processes: bool, Optional
+        If the tasks run in a process pool instead of a thread pool, by default False
+    in_processes: tuple[TaskName, ...], Optional
+        The names of the tasks that run in a process pool while the other tasks run in
+        a thread pool at the same time, e.g. the tasks that hold the GIL, each pool has
+        `workers` workers, by default ()
+
+    Returns
+    -------
+    dict[TaskName, Any]
+        The result of every task
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        return {name: func() for name, func in tasks}
+
+    in_processes = tuple(name for name, _ in tasks) if processes else in_processes
+    results: dict[TaskName, Any] = {}
+    stdout: _ThreadStdout = _ThreadStdout(sys.stdout)
+    thread_pool: Executor = ThreadPoolExecutor(max_workers=workers)
+    process_pool: Executor | None = ProcessPoolExecutor(max_workers=workers) if in_processes else None
+    pprint.info(f'Running {len(tasks)} tasks with {workers} workers')
+    with thread_pool, process_pool or contextlib.nullcontext(), contextlib.redirect_stdout(stdout):
+        futures: dict[Any, TaskName] = {
+            (
+                process_pool.submit(_run_in_process, func) if name in in_processes
+                else thread_pool.submit(contextvars.copy_context().run, _run_in_thread, func, stdout)
+            ): name
+            for name, func in tasks
+        }
+        for future in as_completed(futures):
+            name: TaskName = futures[future]
+            try:
+                results[name], output = future.result()
+            except Exception as error:
+                stdout.stdout.write(getattr(error, 'output', ''))
+                pprint.error(f'Task {{ {name} }} failed')
+                raise
+            pprint.success(f'Task {{ {name} }} finished')
+            stdout.stdout.write(output)
+    return results
@@ -0,0 +1,292 @@
+"""
+Here you can find the governor of the memory of the pipelines.
+
+The memory budget is read from the `resources` section of 'config/config.yaml'.
+While the pipelines run the governor measures the resident set size of the process
+and the bytes allocated by the arrow memory pool, and with the memory left once
+both are taken from the budget it chooses the number of lines of the streamed chunks, the number of files processed
+at the same time, the number of buckets of the features and the size past which a
+file is grouped out of core, spilling to disk. The governor only lowers the values
+given to the pipelines, and it does nothing when there is no budget.
+
+Every decision is printed with the measures it was taken from and, when the
+tracing is enabled, saved as a span named 'governor.<decision>'.
+"""
+import os
+import re
+import pyarrow as pa
+from typing import Any
+from etl.utils import (
+    pprint,
+    logging as log,
+    storage,
+)
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+CONFIG_PATH: str = 'config/config.yaml'
+BUDGET: int | None = None
+HEADROOM: float = 0.8
+MIN_CHUNK_SIZE: int = 10_000
+# A table takes about this many times its size while it is built, e.g. the parsed
+# values and the dataframe they are converted to are in memory at the same time
+FACTOR: int = 3
+SAMPLE_BYTES: int = 1 << 20
+UNITS: dict[str, int] = {'': 1, 'B': 1, 'KB': 10**3, 'MB': 10**6, 'GB': 10**9, 'KIB': 1 << 10, 'MIB': 1 << 20, 'GIB': 1 << 30}
+
+
+def parse_bytes(value: int | str) -> int:
+    """
+    Get the number of bytes of a size, e.g. 2147483648, '2GiB' or '512 MB'
+
+    Parameters
+    ----------
+    value: int | str
+        The size, in bytes or with a decimal or binary unit
+
+    Returns
+    -------
+    int
+        The number of bytes
+    """
+    if isinstance(value, int):
+        return value
+    match: re.Match | None = re.fullmatch(r'\s*([\d_.]+)\s*([a-zA-Z]*)\s*', str(value))
+    if match is None or match.group(2).upper() not in UNITS:
+        raise ValueError(f'The size {{ {value} }} is not valid, e.g. 512MiB or 2GB')
+    return int(float(match.group(1)) * UNITS[match.group(2).upper()])
+
+
+def configure(*, path: str = CONFIG_PATH, memory_budget: int | str | None = None) -> None:
+    """
+    Configure the governor from the `resources` section of the config file, e.g.
+
+        resources:
+          memory_budget: 2GiB
+          headroom: 0.8
+          min_chunk_size: 10000
+
+    Parameters
+    ----------
+    path: str, Optional
+        Path of the config file, by default 'config/config.yaml'
+    memory_budget: int | str | None, Optional
+        The budget, it overrides the one of the config file, by default None
+    """
+    global BUDGET, HEADROOM, MIN_CHUNK_SIZE
+    config: dict[str, Any] = {}
+    if os.path.isfile(path) and os.path.getsize(path):
+        if yaml is None:
+            pprint.warning(f'PyYAML is not installed, the config {{ {path} }} is not read')
+        else:
+            with open(path, encoding='utf-8') as file:
+                config = (yaml.safe_load(file) or {}).get('resources') or {}
+    budget: int | str | None = memory_budget if memory_budget is not None else config.get('memory_budget')
+    BUDGET = parse_bytes(budget) if budget is not None else None
+    HEADROOM = float(config.get('headroom', HEADROOM))
+    MIN_CHUNK_SIZE = int(config.get('min_chunk_size', MIN_CHUNK_SIZE))
+    if BUDGET is not None:
+        pprint.info(f'governor: budget of {BUDGET} bytes, {HEADROOM:.0%} for the data')
+
+
+def is_enabled() -> bool:
+    """ Check if the governor has a budget """
+    return BUDGET is not None
+
+
+def rss() -> int:
+    """ Get the current resident set size of the process in bytes, the peak if the current one is not available """
+    try:
+        with open('/proc/self/statm', encoding='utf-8') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def used() -> int:
+    """
+    Get the bytes the process takes, the RSS plus the bytes allocated by the arrow
+    memory pool. The pool reserves its buffers before they are written, so they are
+    not resident yet, and it keeps the freed ones to reuse them, so the arrow tables
+    are counted on their own even if part of them is already in the RSS
+
+    Returns
+    -------
+    int
+        The bytes taken by the process
+    """
+    return rss() + pa.total_allocated_bytes()
+
+
+def available() -> int:
+    """ Get the bytes of the budget the data can still take, the part of the headroom minus the RSS and the arrow allocations """
+    if BUDGET is None:
+        return 0
+    return max(0, int(BUDGET * HEADROOM) - used())
+
+
+def _decide(decision: str, *, requested: Any, chosen: Any, reason: str) -> Any:
+    """ Print a decision with the measures it was taken from and save it as a span """
+    measures: dict[str, int] = {'rss': rss(), 'arrow_allocated': pa.total_allocated_bytes(), 'budget': BUDGET}
+    message: str = f'governor: {decision} {requested} -> {chosen}, {reason} (rss {measures["rss"]}, arrow {measures["arrow_allocated"]})'
+    (pprint.warning if chosen != requested else pprint.info)(message)
+    with log.span(f'governor.{decision}', requested=requested, chosen=chosen, reason=reason, **measures):
+        pass
+    return chosen
+
+
+def line_bytes(*, path: str) -> int:
+    """ Get the mean size of the lines of a text file, from its first bytes once decompressed """
+    with storage.open_input_stream(path) as stream:
+        sample: bytes = stream.read(SAMPLE_BYTES)
+    return max(1, len(sample) // max(1, sample.count(b'\n')))
+
+
+def source_bytes(*, path: str) -> int:
+    """
+    Estimate the size of a text source once decompressed, the compressed ones are
+    measured by the ratio of their first bytes
+
+    Parameters
+    ----------
+    path: str
+        Path of the source, plain or compressed
+
+    Returns
+    -------
+    int
+        The bytes of the source once decompressed
+    """
+    size: int = storage.size(path)
+    if not storage.is_compressed(path) or not size:
+        return size
+    filesystem, inner = storage.resolve(path)
+    decompressed: int = 0
+    with filesystem.open_input_file(inner) as raw, pa.CompressedInputStream(raw, pa.Codec.detect(path).name) as stream:
+        while raw.tell() < SAMPLE_BYTES:
+            read: int = len(stream.read(SAMPLE_BYTES))
+            if not read:
+                return decompressed
+            decompressed += read
+        return int(size * decompressed / raw.tell())
+
+
+def chunk_size(*, requested: int | None, path: str, workers: int = 1) -> int | None:
+    """
+    Choose the number of lines of the chunks a text source is streamed by, the
+    chunks of all the workers must fit in the memory left
+
+    Parameters
+    ----------
+    requested: int | None
+        The chunk size given to the pipeline, None to load the source at once
+    path: str
+        Path of the source, plain or compressed
+    workers: int, Optional
+        The number of sources read at the same time, by default 1
+
+    Returns
+    -------
+    int | None
+        The chunk size, None if the source is loaded at once
+    """
+    if BUDGET is None:
+        return requested
+    size: int = line_bytes(path=path)
+    limit: int = max(MIN_CHUNK_SIZE, available() // (FACTOR * size * workers))
+    compressed: bool = storage.is_compressed(path)
+    if requested is None and not compressed and storage.size(path) // size <= limit:
+        return _decide('chunk_size', requested=None, chosen=None, reason=f'{os.path.basename(path)} fits in memory')
+    chosen: int = limit if requested is None else min(requested, limit)
+    return _decide('chunk_size', requested=requested, chosen=chosen, reason=f'{os.path.basename(path)}, lines of {size} bytes')
+
+
+def workers(*, requested: int, sizes: list[int]) -> int:
+    """
+    Choose the number of tasks of a step that run at the same time, the tables of
+    the largest tasks running together must fit in the memory left
+
+    Parameters
+    ----------
+    requested: int
+        The number of workers given to the pipeline
+    sizes: list[int]
+        The bytes the table of every task takes in memory, e.g. from `extr.estimate_size`
+
+    Returns
+    -------
+    int
+        The number of workers, at least one
+    """
+    if BUDGET is None or requested <= 1:
+        return requested
+    left: int = available()
+    chosen: int = 0
+    for size in sorted(sizes, reverse=True)[:requested]:
+        left -= FACTOR * size
+        if left < 0:
+            break
+        chosen += 1
+    else:
+        chosen = requested
+    return _decide('workers', requested=requested, chosen=max(1, chosen), reason=f'tables of {sorted(sizes, reverse=True)} bytes')
+
+
+def memory_budget(*, requested: int | None, workers: int = 1) -> int | None:
+    """
+    Choose the bytes a file can take in memory when it is grouped, the larger files
+    are grouped out of core
+
+    Parameters
+    ----------
+    requested: int | None
+        The budget given to the pipeline, None to group all the files in memory
+    workers: int, Optional
+        The number of files grouped at the same time, by default 1
+
+    Returns
+    -------
+    int | None
+        The bytes a file can take in memory, None if the files are grouped in memory
+    """
+    if BUDGET is None:
+        return requested
+    limit: int = max(1, available() // (FACTOR * workers))
+    chosen: int = limit if requested is None else min(requested, limit)
+    return _decide('memory_budget', requested=requested, chosen=chosen, reason=f'{workers} files at the same time')
+
+
+def buckets(*, requested: int, size: int) -> int:
+    """
+    Choose the number of buckets of users the features are built by, the data of a
+    bucket must fit in the memory left
+
+    Parameters
+    ----------
+    requested: int
+        The number of buckets given to the pipeline
+    size: int
+        The bytes the inputs of the features take in memory
+
+    Returns
+    -------
+    int
+        The number of buckets
+    """
+    if BUDGET is None:
+        return requested
+    needed: int = -(-FACTOR * size // max(1, available()))
+    chosen: int = max(requested, needed)
+    return _decide('buckets', requested=requested, chosen=chosen, reason=f'inputs of {size} bytes')
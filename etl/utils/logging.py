@@ -0,0 +1,231 @@
+"""
+Here you can find the tracing of the steps of the pipelines.
+
+Every traced call opens a span, the spans are nested following the calls and
+record the wall time, the CPU time of the process, the growth of the peak RSS,
+the memory allocated by python when `tracemalloc` is enabled, and the rows and
+bytes read and written. The finished spans are appended as json lines to a file
+that can be exported to the Chrome trace event format, e.g. for Perfetto.
+"""
+import contextlib
+import contextvars
+import datetime as dt
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Any, Iterator
+from etl.utils import (
+    pprint,
+    storage,
+)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+ENABLED: bool = False
+TRACE_PATH: str = 'data/logs/trace.jsonl'
+RUN_ID: str = uuid.uuid4().hex[:12]
+COUNTERS: tuple[str, ...] = ('rows_in', 'rows_out', 'bytes_read', 'bytes_written')
+
+_current: contextvars.ContextVar[dict[str, Any] | None] = contextvars.ContextVar('span', default=None)
+_lock: threading.Lock = threading.Lock()
+
+
+def configure(*, enabled: bool = True, path: str = TRACE_PATH, memory: bool = False) -> None:
+    """
+    Configure the tracing, the spans are always timed but only written when it is enabled
+
+    Parameters
+    ----------
+    enabled: bool, Optional
+        If the spans are written in the json lines file, by default True
+    path: str, Optional
+        Path of the json lines file the spans are appended to, by default 'data/logs/trace.jsonl'
+    memory: bool, Optional
+        If `tracemalloc` is started to record the memory allocated by python in every
+        span, it slows down the pipelines, by default False
+    """
+    global ENABLED, TRACE_PATH
+    ENABLED, TRACE_PATH = enabled, path
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _max_rss() -> int:
+    """ Get the peak resident set size of the process in bytes, 0 if it is not available """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _emit(record: dict[str, Any]) -> None:
+    """ Append a finished span to the json lines file """
+    os.makedirs(os.path.dirname(TRACE_PATH) or '.', exist_ok=True)
+    with _lock, open(TRACE_PATH, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(record, default=str) + '\n')
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[dict[str, Any]]:
+    """
+    Open a span, nested in the span of the caller if there is one, its counters are
+    added to the ones of the parent when it is closed
+
+    Parameters
+    ----------
+    name: str
+        The name of the span, e.g. the name of the traced function
+    attributes: Any
+        Other values saved with the span
+
+    Yields
+    ------
+    dict[str, Any]
+        The record of the span, its counters can be increased with `add`
+    """
+    parent: dict[str, Any] | None = _current.get()
+    record: dict[str, Any] = {
+        'run': RUN_ID,
+        'id': uuid.uuid4().hex[:16],
+        'parent': parent['id'] if parent is not None else None,
+        'name': name,
+        'depth': parent['depth'] + 1 if parent is not None else 0,
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+        'start': dt.datetime.now().isoformat(),
+        'ts': time.time_ns() // 1000,
+        **{counter: 0 for counter in COUNTERS},
+        **attributes,
+    }
+    token: contextvars.Token = _current.set(record)
+    wall: float = time.perf_counter()
+    cpu: float = time.process_time()
+    rss: int = _max_rss()
+    allocated: int = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    try:
+        yield record
+    except Exception as error:
+        record['error'] = f'{type(error).__name__}: {error}'
+        raise
+    finally:
+        _current.reset(token)
+        if parent is not None:
+            with _lock:
+                for counter in COUNTERS:
+                    parent[counter] = parent.get(counter, 0) + record.get(counter, 0)
+        record['wall'] = time.perf_counter() - wall
+        record['cpu'] = time.process_time() - cpu
+        record['rss_peak_delta'] = _max_rss() - rss
+        if tracemalloc.is_tracing():
+            record['py_alloc_delta'] = tracemalloc.get_traced_memory()[0] - allocated
+        if ENABLED:
+            _emit(record)
+
+
+def add(**counters: int) -> None:
+    """
+    Increase the counters of the current span, e.g. `add(bytes_written=size)`,
+    nothing is done outside of a span
+
+    Parameters
+    ----------
+    counters: int
+        The values to add to the counters of the span
+    """
+    record: dict[str, Any] | None = _current.get()
+    if record is None:
+        return
+    with _lock:
+        for counter, value in counters.items():
+            record[counter] = record.get(counter, 0) + value
+
+
+def file_size(path: str) -> int:
+    """
+    Get the size of a file or of the files of a folder, e.g. a partitioned dataset
+
+    Parameters
+    ----------
+    path: str
+        The path of the file or folder, local or remote
+
+    Returns
+    -------
+    int
+        The size in bytes, 0 if the path does not exist
+    """
+    return storage.size(path)
+
+
+def read_spans(*, path: str = TRACE_PATH, run: str | None = None) -> list[dict[str, Any]]:
+    """
+    Read the spans of the json lines file
+
+    Parameters
+    ----------
+    path: str, Optional
+        Path of the json lines file, by default 'data/logs/trace.jsonl'
+    run: str | None, Optional
+        If given, only the spans of this run are read, by default all of them
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        The spans
+    """
+    with open(path, encoding='utf-8') as file:
+        spans: list[dict[str, Any]] = [json.loads(line) for line in file if line.strip()]
+    if run is not None:
+        spans = [record for record in spans if record['run'] == run]
+    return spans
+
+
+def export_chrome(*, path: str = TRACE_PATH, dest: str | None = None, run: str | None = None) -> str:
+    """
+    Export the spans to the Chrome trace event format, which can be opened in
+    chrome://tracing or in Perfetto
+
+    Parameters
+    ----------
+    path: str, Optional
+        Path of the json lines file, by default 'data/logs/trace.jsonl'
+    dest: str | None, Optional
+        Path of the json file to write, by default the json lines file with '.json'
+        as extension
+    run: str | None, Optional
+        If given, only the spans of this run are exported, by default all of them
+
+    Returns
+    -------
+    str
+        The path of the written file
+    """
+    dest = dest or f'{os.path.splitext(path)[0]}.json'
+    events: list[dict[str, Any]] = [
+        {
+            'name': record['name'],
+            'cat': record['run'],
+            'ph': 'X',
+            'ts': record['ts'],
+            'dur': round(record['wall'] * 1e6),
+            'pid': record['pid'],
+            'tid': record['tid'],
+            'args': {
+                key: value for key, value in record.items()
+                if key not in ('name', 'ts', 'pid', 'tid')
+            },
+        }
+        for record in read_spans(path=path, run=run)
+    ]
+    with open(dest, 'w', encoding='utf-8') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+    pprint.info(f'trace {{ {dest} }} exported, {len(events)} spans')
+    return dest
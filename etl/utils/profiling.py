@@ -0,0 +1,284 @@
+"""
+Here you can find an opt-in profiler for the dataframes and files of the pipelines.
+
+The statistics are taken from metadata when it is available, the row group
+statistics of the parquet footers or the null counts of the arrow buffers, and
+otherwise from a sample of rows, so profiling never adds a full pass over the
+data. The statistics of every artifact are saved in a json file.
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from typing import Any
+from etl.utils import (
+    pprint,
+    storage,
+)
+from etl.extr import extraction as extr
+
+
+ENABLED: bool = False
+FOLDER: str = 'data/stats'
+SAMPLE_ROWS: int = 10_000
+HEAD_ROWS: int = 5
+
+
+def configure(
+        *,
+        enabled: bool = True,
+        folder: str = FOLDER,
+        sample_rows: int = SAMPLE_ROWS,
+    ) -> None:
+    """
+    Configure the profiler, it is disabled until this function enables it
+
+    Parameters
+    ----------
+    enabled: bool, Optional
+        If the dataframes and files are profiled, by default True
+    folder: str, Optional
+        Path of the folder of the json files with the statistics, by default 'data/stats'
+    sample_rows: int, Optional
+        Number of rows of the sample used when the statistics are not in the metadata,
+        by default 10_000
+    """
+    global ENABLED, FOLDER, SAMPLE_ROWS
+    ENABLED, FOLDER, SAMPLE_ROWS = enabled, folder, sample_rows
+
+
+def _stats_path(path: str) -> str:
+    """ Get the path of the json file with the statistics of an artifact, e.g. 'data/stats/staging/010_prints.json' """
+    layer: str = os.path.basename(os.path.dirname(os.path.normpath(path)))
+    name: str = os.path.basename(os.path.normpath(path)).split('.')[0]
+    return os.path.join(FOLDER, layer, f'{name}.json')
+
+
+def _parquet_columns(*, metadata: pq.FileMetaData) -> dict[str, dict[str, Any]]:
+    """ Get the null count, min and max of every column from the row group statistics of a footer """
+    columns: dict[str, dict[str, Any]] = {}
+    for i in range(metadata.num_columns):
+        path: str = metadata.schema.column(i).path
+        column: dict[str, Any] = {'null_count': 0, 'min': None, 'max': None}
+        for j in range(metadata.num_row_groups):
+            stats: pq.Statistics | None = metadata.row_group(j).column(i).statistics
+            if stats is None or not stats.has_null_count:
+                column['null_count'] = None
+            elif column['null_count'] is not None:
+                column['null_count'] += stats.null_count
+            if stats is not None and stats.has_min_max:
+                column['min'] = stats.min if column['min'] is None else min(column['min'], stats.min)
+                column['max'] = stats.max if column['max'] is None else max(column['max'], stats.max)
+        columns[path] = column
+    return columns
+
+
+def _merge_columns(
+        *,
+        columns: dict[str, dict[str, Any]],
+        other: dict[str, dict[str, Any]],
+    ) -> dict[str, dict[str, Any]]:
+    """ Merge the statistics of the columns of two files of a dataset """
+    for name, stats in other.items():
+        if name not in columns:
+            columns[name] = stats
+            continue
+        merged: dict[str, Any] = columns[name]
+        if merged['null_count'] is None or stats['null_count'] is None:
+            merged['null_count'] = None
+        else:
+            merged['null_count'] += stats['null_count']
+        for key, func in (('min', min), ('max', max)):
+            values: list[Any] = [value for value in (merged[key], stats[key]) if value is not None]
+            merged[key] = func(values) if values else None
+    return columns
+
+
+def _sample(*, df: pd.DataFrame) -> pd.DataFrame:
+    """ Get a sample of the rows of a dataframe, sorted as in the dataframe """
+    if len(df) <= SAMPLE_ROWS:
+        return df
+    rows: np.ndarray = np.sort(np.random.default_rng(0).choice(len(df), size=SAMPLE_ROWS, replace=False))
+    return df.iloc[rows]
+
+
+def _sample_file(*, path: str, columns: list[str]) -> pa.Table:
+    """ Read the first rows of some columns of a parquet file or dataset, up to the size of the sample """
+    dataset: Any = (
+        extr.open_dataset(file_path=path) if extr.is_dataset(file_path=path)
+        else pq.ParquetFile(storage.open_input_file(path))
+    )
+    batches: Any = (
+        dataset.to_batches(columns=columns, batch_size=SAMPLE_ROWS)
+        if extr.is_dataset(file_path=path)
+        else dataset.iter_batches(columns=columns, batch_size=SAMPLE_ROWS)
+    )
+    batch: pa.RecordBatch | None = next(iter(batches), None)
+    if batch is None:
+        return pa.table({name: pa.array([]) for name in columns})
+    return pa.Table.from_batches([batch]).slice(0, SAMPLE_ROWS)
+
+
+def stats_file(*, path: str) -> dict[str, Any]:
+    """
+    Get the statistics of a saved file, from the parquet footers for parquet files and
+    datasets, and from the arrow buffers for the memory-mapped Arrow IPC files
+
+    Parameters
+    ----------
+    path: str
+        The path of the file, or of the folder of the partitioned dataset
+
+    Returns
+    -------
+    dict[str, Any]
+        The number of rows, the size on disk, the first rows and the type, null count,
+        min and max of every column, the null counts missing from the footers are
+        estimated from the first rows and the min and max are None
+    """
+    if extr.is_dataset(file_path=path):
+        dataset: Any = extr.open_dataset(file_path=path)
+        columns: dict[str, dict[str, Any]] = {}
+        rows: int = 0
+        for fragment in dataset.get_fragments():
+            rows += fragment.metadata.num_rows
+            columns = _merge_columns(columns=columns, other=_parquet_columns(metadata=fragment.metadata))
+        schema: pa.Schema = dataset.schema
+        head: pa.Table = dataset.head(HEAD_ROWS)
+    elif extr.is_feather(file_path=path):
+        table: pa.Table = feather.read_table(storage.local_path(path), memory_map=True)
+        columns: dict[str, dict[str, Any]] = {
+            name: {'null_count': table.column(name).null_count, 'min': None, 'max': None}
+            for name in table.column_names
+        }
+        rows: int = table.num_rows
+        schema: pa.Schema = table.schema
+        head: pa.Table = table.slice(0, HEAD_ROWS)
+    else:
+        parquet: pq.ParquetFile = pq.ParquetFile(storage.open_input_file(path))
+        columns: dict[str, dict[str, Any]] = _parquet_columns(metadata=parquet.metadata)
+        rows: int = parquet.metadata.num_rows
+        schema: pa.Schema = parquet.schema_arrow
+        batch: pa.RecordBatch | None = next(parquet.iter_batches(batch_size=HEAD_ROWS), None)
+        head: pa.Table = pa.Table.from_batches([batch]) if batch is not None else schema.empty_table()
+
+    columns = {
+        field.name: {'type': str(field.type), **columns.get(field.name, {'null_count': None, 'min': None, 'max': None})}
+        for field in schema.remove_metadata()
+    }
+    sampled: bool = False
+    missing: list[str] = [name for name, column in columns.items() if column['null_count'] is None]
+    if missing and rows:
+        sample: pa.Table = _sample_file(path=path, columns=missing)
+        sampled = sample.num_rows < rows
+        for name in missing:
+            columns[name]['null_count'] = round(sample.column(name).null_count * rows / max(sample.num_rows, 1))
+
+    stats: dict[str, Any] = {
+        'artifact': path,
+        'rows': rows,
+        'bytes': storage.size(path),
+        'sampled': sampled,
+        'columns': columns,
+        'head': head.slice(0, HEAD_ROWS).to_pylist(),
+    }
+    return stats
+
+
+def stats_frame(*, df: pd.DataFrame) -> dict[str, Any]:
+    """
+    Get the statistics of a dataframe, the null counts of the integer and boolean
+    columns are zero and the ones of the other columns are estimated from a sample
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The dataframe
+
+    Returns
+    -------
+    dict[str, Any]
+        The number of rows, the memory without the python objects, the first rows and
+        the type and null count of every column
+    """
+    sample: pd.DataFrame = _sample(df=df)
+    scale: float = len(df) / len(sample) if len(sample) else 0
+    columns: dict[str, dict[str, Any]] = {}
+    for column in df.columns:
+        dtype: Any = df[column].dtype
+        exact: bool = isinstance(dtype, np.dtype) and dtype.kind in 'iub'
+        null_count: int = 0 if exact else round(int(sample[column].isna().sum()) * scale)
+        columns[str(column)] = {'type': str(dtype), 'null_count': null_count, 'min': None, 'max': None}
+    stats: dict[str, Any] = {
+        'rows': len(df),
+        'bytes': int(df.memory_usage(index=True, deep=False).sum()),
+        'sampled': len(sample) < len(df),
+        'columns': columns,
+        'head': df.head(HEAD_ROWS).to_dict(orient='records'),
+    }
+    return stats
+
+
+def _save(*, stats: dict[str, Any], path: str, console: bool) -> None:
+    """ Save the statistics of an artifact and print them in the console """
+    stats_path: str = _stats_path(path)
+    os.makedirs(os.path.dirname(stats_path), exist_ok=True)
+    with open(stats_path, 'w', encoding='utf-8') as file:
+        json.dump(stats, file, indent=4, default=str)
+    if console:
+        nulls: dict[str, Any] = {name: col['null_count'] for name, col in stats['columns'].items() if col['null_count']}
+        pprint.info(f'rows: {stats["rows"]} | bytes: {stats["bytes"]} | sampled: {stats["sampled"]}')
+        pprint.info(f'dtypes: { {name: col["type"] for name, col in stats["columns"].items()} }')
+        pprint.info(f'null values: {nulls or 0}')
+    pprint.info(f'stats {{ {stats_path} }} saved')
+
+
+def profile_file(*, path: str, console: bool = False) -> dict[str, Any] | None:
+    """
+    Profile a saved file, if the profiler is enabled, and save its statistics
+
+    Parameters
+    ----------
+    path: str
+        The path of the file, or of the folder of the partitioned dataset
+    console: bool, Optional
+        If the statistics are also printed in the console, by default False
+
+    Returns
+    -------
+    dict[str, Any] | None
+        The statistics, None if the profiler is disabled
+    """
+    if not ENABLED:
+        return None
+    stats: dict[str, Any] = stats_file(path=path)
+    _save(stats=stats, path=path, console=console)
+    return stats
+
+
+def profile_frame(*, df: pd.DataFrame, path: str, console: bool = False) -> dict[str, Any] | None:
+    """
+    Profile a dataframe, if the profiler is enabled, and save its statistics
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The dataframe
+    path: str
+        The path of the file the dataframe was read from, used to name the statistics
+    console: bool, Optional
+        If the statistics are also printed in the console, by default False
+
+    Returns
+    -------
+    dict[str, Any] | None
+        The statistics, None if the profiler is disabled
+    """
+    if not ENABLED:
+        return None
+    stats: dict[str, Any] = {'artifact': path, **stats_frame(df=df)}
+    _save(stats=stats, path=path, console=console)
+    return stats
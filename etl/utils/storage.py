@@ -0,0 +1,304 @@
+"""
+Here you can find the filesystems of the files of the pipelines.
+
+The paths can be local, e.g. 'data/raw', or URIs of an object storage, e.g.
+'s3://bucket/raw' or 'gs://bucket/raw', every path is resolved to a pyarrow
+filesystem and the path inside it. The readers open the remote files as random
+access files, so the parquet readers only fetch the footer and the column chunks
+they need with ranged requests, and the writers stream to the object storage,
+which uploads the parts of the multipart uploads in parallel in the background.
+
+The files that can only be read from a local path, e.g. the memory-mapped Arrow
+IPC files or the pandas readers, are downloaded to a local read-through cache
+whose least recently used files are evicted past a size budget. Any pyarrow
+filesystem can be registered for a scheme, e.g. a `SubTreeFileSystem` of a local
+folder, so the pipelines can run against a stand-in of the object storage.
+
+The local files are written atomically, to a temporary file next to them that
+replaces them once it is written, so a failed write never leaves a truncated file.
+
+The pipelines of extraction and load take URIs for their folders, and so do the
+step functions of the transform pipeline, its watermarks and the fingerprints of
+the DAG and of the cache. The `run` of the transform pipeline always works on the
+local 'data/staging' folder, and the spill folder and the cache folder are local.
+"""
+import contextlib
+import hashlib
+import os
+import threading
+import uuid
+import pyarrow as pa
+import pyarrow.fs as pafs
+from typing import Iterator
+from etl.utils import pprint
+
+
+LOCAL: pafs.LocalFileSystem = pafs.LocalFileSystem()
+CACHE_DIR: str = 'data/cache/storage'
+CACHE_BYTES: int = 2 << 30
+COPY_CHUNK_SIZE: int = 8 << 20
+# Extensions of the codecs detected by `open_input_stream`
+CODECS: tuple[str, ...] = ('.gz', '.bz2', '.lz4', '.zst', '.br')
+
+_filesystems: dict[str, pafs.FileSystem] = {}
+_lock: threading.Lock = threading.Lock()
+
+
+def register(*, scheme: str, filesystem: pafs.FileSystem) -> None:
+    """
+    Register the filesystem of the URIs of a scheme, the path inside the filesystem
+    is the URI without the scheme, e.g. 'bucket/raw/pays.parquet.gzip'
+
+    Parameters
+    ----------
+    scheme: str
+        The scheme of the URIs, e.g. 's3'
+    filesystem: pafs.FileSystem
+        The filesystem, e.g. `pafs.SubTreeFileSystem('/tmp/s3', pafs.LocalFileSystem())`
+    """
+    _filesystems[scheme] = filesystem
+
+
+def configure(*, cache_dir: str = CACHE_DIR, cache_bytes: int = CACHE_BYTES) -> None:
+    """
+    Configure the local read-through cache of the remote files
+
+    Parameters
+    ----------
+    cache_dir: str, Optional
+        Path of the folder of the cached files, by default 'data/cache/storage'
+    cache_bytes: int, Optional
+        The size of the cache, the least recently used files are evicted past it,
+        by default 2 GiB
+    """
+    global CACHE_DIR, CACHE_BYTES
+    CACHE_DIR, CACHE_BYTES = cache_dir, cache_bytes
+
+
+def is_remote(path: str) -> bool:
+    """ Check if a path is the URI of a remote file, e.g. 's3://bucket/raw' """
+    return '://' in path and not path.startswith('file://')
+
+
+def resolve(path: str) -> tuple[pafs.FileSystem, str]:
+    """
+    Get the filesystem of a path and the path inside it
+
+    Parameters
+    ----------
+    path: str
+        A local path or a URI, e.g. 's3://bucket/raw/pays.parquet.gzip'
+
+    Returns
+    -------
+    tuple[pafs.FileSystem, str]
+        The filesystem and the path inside it, the local paths are kept as they are
+    """
+    if not is_remote(path):
+        return LOCAL, path.removeprefix('file://')
+    scheme, _, rest = path.partition('://')
+    if scheme in _filesystems:
+        return _filesystems[scheme], rest
+    filesystem, inner = pafs.FileSystem.from_uri(path)
+    return filesystem, inner
+
+
+def info(path: str) -> pafs.FileInfo:
+    """ Get the type, size and modification time of a file or folder """
+    filesystem, inner = resolve(path)
+    return filesystem.get_file_info(inner)
+
+
+def is_file(path: str) -> bool:
+    """ Check if a path is a file """
+    return info(path).type == pafs.FileType.File
+
+
+def is_dir(path: str) -> bool:
+    """ Check if a path is a folder, e.g. a partitioned dataset """
+    return info(path).type == pafs.FileType.Directory
+
+
+def mtime(path: str) -> int:
+    """ Get the modification time of a file in nanoseconds, 0 if the filesystem does not have it """
+    return info(path).mtime_ns or 0
+
+
+def size(path: str) -> int:
+    """ Get the size of a file or of the files of a folder, 0 if the path does not exist """
+    filesystem, inner = resolve(path)
+    file_info: pafs.FileInfo = filesystem.get_file_info(inner)
+    if file_info.type == pafs.FileType.File:
+        return file_info.size
+    if file_info.type != pafs.FileType.Directory:
+        return 0
+    return sum(
+        entry.size for entry in filesystem.get_file_info(pafs.FileSelector(inner, recursive=True))
+        if entry.type == pafs.FileType.File
+    )
+
+
+def walk(path: str) -> list[pafs.FileInfo]:
+    """ Get the files of a file or of a folder and its subfolders, sorted by path, none if the path does not exist """
+    filesystem, inner = resolve(path)
+    file_info: pafs.FileInfo = filesystem.get_file_info(inner)
+    if file_info.type == pafs.FileType.File:
+        return [file_info]
+    if file_info.type != pafs.FileType.Directory:
+        return []
+    return sorted(
+        (entry for entry in filesystem.get_file_info(pafs.FileSelector(inner, recursive=True)) if entry.type == pafs.FileType.File),
+        key=lambda entry: entry.path,
+    )
+
+
+def is_compressed(path: str) -> bool:
+    """ Check if a file is decompressed when it is read, by the extension of its codec, e.g. '.gz' """
+    return os.path.splitext(path)[1] in CODECS
+
+
+def makedirs(path: str) -> None:
+    """ Create a folder with its parents, nothing is done if it exists """
+    filesystem, inner = resolve(path)
+    filesystem.create_dir(inner, recursive=True)
+
+
+def listdir(path: str) -> list[str]:
+    """ Get the names of the entries of a folder """
+    filesystem, inner = resolve(path)
+    return [entry.base_name for entry in filesystem.get_file_info(pafs.FileSelector(inner))]
+
+
+def remove(path: str) -> None:
+    """ Remove a file or a folder with its files, nothing is done if it does not exist """
+    filesystem, inner = resolve(path)
+    file_info: pafs.FileInfo = filesystem.get_file_info(inner)
+    if file_info.type == pafs.FileType.Directory:
+        filesystem.delete_dir(inner)
+    elif file_info.type == pafs.FileType.File:
+        filesystem.delete_file(inner)
+
+
+def copy(origin: str, destination: str) -> None:
+    """ Copy a file or a folder with its files, between local paths or URIs, replacing the destination """
+    remove(destination)
+    source_filesystem, source = resolve(origin)
+    destination_filesystem, target = resolve(destination)
+    pafs.copy_files(
+        os.path.abspath(source) if source_filesystem is LOCAL else source,
+        os.path.abspath(target) if destination_filesystem is LOCAL else target,
+        source_filesystem=source_filesystem,
+        destination_filesystem=destination_filesystem,
+        chunk_size=COPY_CHUNK_SIZE,
+    )
+
+
+def open_input_file(path: str) -> pa.NativeFile:
+    """ Open a file for random access, the remote files are read with ranged requests """
+    filesystem, inner = resolve(path)
+    return filesystem.open_input_file(inner)
+
+
+def open_input_stream(path: str) -> pa.NativeFile:
+    """ Open a file for sequential reading, decompressed if its extension is of a codec, e.g. '.gz' """
+    filesystem, inner = resolve(path)
+    return filesystem.open_input_stream(inner, compression='detect')
+
+
+def open_output_stream(path: str, compression: str | None = None) -> pa.NativeFile:
+    """ Open a file for writing, compressed with the codec if it is given, e.g. 'gzip' """
+    filesystem, inner = resolve(path)
+    return filesystem.open_output_stream(inner, compression=compression)
+
+
+@contextlib.contextmanager
+def atomic(path: str) -> Iterator[str]:
+    """
+    Get a temporary path to write a file, the temporary file replaces the file once
+    it is written and it is removed if the write fails, so the file is either the
+    previous one or the new one. The remote files are written to their own path,
+    since a rename is a copy in the object storages, which only publish an object
+    when its upload completes
+
+    Parameters
+    ----------
+    path: str
+        A local path or a URI
+
+    Yields
+    ------
+    str
+        The path to write to, a hidden file in the same folder for the local files
+    """
+    if is_remote(path):
+        yield path
+        return
+    local: str = path.removeprefix('file://')
+    folder, name = os.path.split(local)
+    tmp: str = os.path.join(folder, f'.{name}.{uuid.uuid4().hex[:8]}.tmp')
+    try:
+        yield tmp
+        if os.path.exists(tmp):
+            os.replace(tmp, local)
+    except BaseException:
+        remove(tmp)
+        raise
+
+
+def _evict(*, keep: str) -> None:
+    """ Remove the least recently used files of the cache until it fits in its size """
+    entries: list[tuple[float, int, str]] = sorted(
+        (os.stat(entry).st_mtime, os.path.getsize(entry), entry)
+        for entry in (os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR))
+        if os.path.isfile(entry)
+    )
+    total: int = sum(entry_size for _, entry_size, _ in entries)
+    for _, entry_size, entry in entries:
+        if total <= CACHE_BYTES:
+            break
+        if entry == keep:
+            continue
+        os.remove(entry)
+        total -= entry_size
+        pprint.info(f'storage cache {{ {os.path.basename(entry)} }} evicted')
+
+
+def local_path(path: str) -> str:
+    """
+    Get a local path of a file, the remote files are downloaded to the read-through
+    cache, where a file is downloaded again only when its size or modification time change
+
+    Parameters
+    ----------
+    path: str
+        A local path or a URI
+
+    Returns
+    -------
+    str
+        The path itself if it is local, otherwise the path of its copy in the cache
+    """
+    if not is_remote(path):
+        return path.removeprefix('file://')
+    filesystem, inner = resolve(path)
+    file_info: pafs.FileInfo = filesystem.get_file_info(inner)
+    key: str = hashlib.sha256(f'{path}|{file_info.size}|{file_info.mtime_ns}'.encode()).hexdigest()[:24]
+    entry: str = os.path.join(CACHE_DIR, f'{key}-{file_info.base_name}')
+    with _lock:
+        if os.path.isfile(entry):
+            os.utime(entry)
+            return entry
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp: str = f'{entry}.tmp'
+        pafs.copy_files(
+            inner,
+            os.path.abspath(tmp),
+            source_filesystem=filesystem,
+            destination_filesystem=LOCAL,
+            chunk_size=COPY_CHUNK_SIZE,
+        )
+        os.replace(tmp, entry)
+        pprint.info(f'{{ {path} }} cached in {{ {entry} }}')
+        _evict(keep=entry)
+    return entry
+
@@ -1,16 +1,59 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import datetime as dt
+import functools
+import os
+from typing import Any, Iterator
 from etl.utils import (
     pprint,
+    profiling,
+    checkpoint as ckpt,
     decorators as dec,
+    executor as exe,
+    logging as log,
+    governor as gov,
+    storage,
 )
 from etl.extr import extraction as extr
+from etl.load import load
 from etl import transversal as tr
 
 
+SOURCES: dict[str, str] = {'pays': 'pays.csv', 'taps': 'taps.json', 'prints': 'prints.json'}
+COMPRESSIONS: tuple[str, ...] = ('', '.gz', '.zst', '.bz2')
+
+
+def find_source(*, folder: str, file: str) -> str:
+    """
+    Get the path of a source, which can be dropped compressed, e.g. 'prints.json.gz'
+
+    Parameters
+    ----------
+    folder: str
+        Path of the folder of the sources
+    file: str
+        The name of the uncompressed file, e.g. 'prints.json'
+
+    Returns
+    -------
+    str
+        The path of the first file found, the uncompressed one if there is none
+    """
+    paths: list[str] = [f'{folder}/{file}{extension}' for extension in COMPRESSIONS]
+    return next((path for path in paths if storage.is_file(path)), paths[0])
+
+
+def is_csv(*, path_file: str) -> bool:
+    """ Check if a source is a CSV file, plain or compressed """
+    return '.csv' in os.path.basename(path_file)
+
+
 @dec.time_it
 def load_csv(*, path_file: str) -> pd.DataFrame:
     """
-    Read CSV file and display its info in the console
+    Read CSV file with the reader of arrow, cast it to the schema of the sources and
+    profile it if the profiler is enabled
 
     Parameters
     ----------
@@ -22,16 +65,24 @@ def load_csv(*, path_file: str) -> pd.DataFrame:
     pd.DataFrame
         A Pandas dataframe with the CSV data
     """
-    csv: pd.DataFrame = extr.load_csv(file_path=path_file)
+    csv: pd.DataFrame = extr.to_pandas(table=extr.cast_table(table=extr.load_csv_table(file_path=path_file)))
     pprint.success(f'CSV {{ {path_file} }} loaded')
-    tr.print_basic_df_info(df=csv)
+    log.add(bytes_read=log.file_size(path_file))
+    pprint.info(f'shape: {csv.shape}')
+    profiling.profile_frame(df=csv, path=path_file, console=True)
     return csv
 
 
 @dec.time_it
-def load_json(*, path_file: str, multi_json: bool = False) -> pd.DataFrame:
+def load_json(
+        *,
+        path_file: str,
+        multi_json: bool = False,
+        chunk_size: int | None = None,
+    ) -> pd.DataFrame | Iterator[pa.Table]:
     """
-    Read JSON file and display its info in the console
+    Read JSON file, cast it to the schema of the sources and profile it if the profiler is enabled,
+    the JSON lines files, plain or compressed, are parsed in parallel by arrow
 
     Parameters
     ----------
@@ -39,38 +90,307 @@ def load_json(*, path_file: str, multi_json: bool = False) -> pd.DataFrame:
         Path of the JSON file to be loaded
     multi_json: bool
         If the JSON file contains multiple JSON objects
+    chunk_size: int | None, Optional
+        Number of lines per chunk, if given the JSON lines file is not loaded at once
+        and an iterator of arrow tables is returned instead, by default None
 
     Returns
     -------
-    pd.DataFrame
-        A Pandas dataframe with the JSON data
+    pd.DataFrame | Iterator[pa.Table]
+        A Pandas dataframe with the JSON data, or an iterator over its chunks as arrow
+        tables, which are written without converting their structs to python objects
     """
-    json: pd.DataFrame = extr.load_json(file_path=path_file, multi_json=multi_json)
+    if chunk_size is not None:
+        pprint.success(f'JSON {{ {path_file} }} opened, chunks of {chunk_size} lines')
+        chunks: Iterator[pa.Table] = extr.iter_json_chunks(file_path=path_file, chunk_size=chunk_size)
+        return (extr.cast_table(table=chunk, fit=False) for chunk in chunks)
+
+    if multi_json:
+        json: pd.DataFrame = extr.to_pandas(table=extr.cast_table(table=extr.load_json_table(file_path=path_file)))
+    else:
+        json: pd.DataFrame = extr.apply_schema(df=extr.load_json(file_path=path_file))
     pprint.success(f'JSON {{ {path_file} }} loaded')
-    tr.print_basic_df_info(df=json)
+    log.add(bytes_read=log.file_size(path_file))
+    pprint.info(f'shape: {json.shape}')
+    profiling.profile_frame(df=json, path=path_file, console=True)
     return json
 
 
 @dec.time_it
-def run() -> None:
+def load_sql(
+        *,
+        query: str,
+        url: str,
+        params: tuple[Any, ...] | None = None,
+        chunk_size: int | None = None,
+    ) -> pd.DataFrame | Iterator[pd.DataFrame]:
+    """
+    Read the result of a SQL query, cast it to the schema of the sources and profile
+    it if the profiler is enabled
+
+    Parameters
+    ----------
+    query: str
+        The SQL query, e.g. 'SELECT * FROM pays'
+    url: str
+        The url of the database, e.g. 'sqlite:///data/external/meli.db'
+    params: tuple[Any, ...] | None, Optional
+        The parameters of the query, by default None
+    chunk_size: int | None, Optional
+        Number of rows per chunk, if given the result is not loaded at once and an
+        iterator of dataframes is returned instead, by default None
+
+    Returns
+    -------
+    pd.DataFrame | Iterator[pd.DataFrame]
+        A Pandas dataframe with the result of the query, or an iterator over its chunks
+    """
+    chunks: Iterator[pd.DataFrame] = extr.iter_sql_chunks(
+        query=query,
+        url=url,
+        chunk_size=chunk_size or 100_000,
+        params=params,
+    )
+    if chunk_size is not None:
+        pprint.success(f'SQL {{ {query} }} opened, chunks of {chunk_size} rows')
+        return (extr.apply_schema(df=chunk, fit=False) for chunk in chunks)
+
+    sql: pd.DataFrame = extr.apply_schema(df=pd.concat(chunks, ignore_index=True))
+    pprint.success(f'SQL {{ {query} }} loaded from {{ {url} }}')
+    pprint.info(f'shape: {sql.shape}')
+    profiling.profile_frame(df=sql, path=url, console=True)
+    return sql
+
+
+@dec.time_it
+def extract_source(
+        *,
+        path_file: str,
+        name: str,
+        chunk_size: int | None = None,
+        folder_dest: str = 'data/raw',
+        checkpoint: bool = False,
+    ) -> None:
+    """
+    Extract one source and save it in the raw folder, the dataframe is only
+    referenced here so it is released as soon as its parquet is written
+
+    Parameters
+    ----------
+    path_file: str
+        Path of the CSV or JSON lines file to be loaded
+    name: str
+        Name of the source, used for the raw file
+    chunk_size: int | None, Optional
+        Number of lines per chunk used to stream the JSON lines sources into parquet,
+        if None the source is loaded at once, by default None
+    folder_dest: str, Optional
+        Path of the folder where the raw files are stored, by default 'data/raw'
+    checkpoint: bool, Optional
+        If the JSON lines sources are streamed with checkpoints, so a failed run is
+        resumed from the last committed chunk, by default False
+    """
+    if is_csv(path_file=path_file):
+        source: pd.DataFrame = load_csv(path_file=path_file)
+    elif checkpoint:
+        extract_checkpointed(path_file=path_file, name=name, chunk_size=chunk_size or 1_000_000, folder_dest=folder_dest)
+        return
+    elif chunk_size is not None:
+        chunks: Iterator[pa.Table] = load_json(path_file=path_file, multi_json=True, chunk_size=chunk_size)
+        tr.chunks_to_parquet(chunks=chunks, name=name, file_path=folder_dest)
+        return
+    else:
+        source: pd.DataFrame = load_json(path_file=path_file, multi_json=True)
+    tr.to_parquet(array=((source, name),), file_path=folder_dest, fmt='parquet-gzip')
+
+
+@dec.time_it
+def extract_checkpointed(
+        *,
+        path_file: str,
+        name: str,
+        chunk_size: int = 1_000_000,
+        folder_dest: str = 'data/raw',
+    ) -> None:
+    """
+    Extract a JSON lines source by chunks of whole blocks of lines, every chunk is
+    written as a parquet part and committed in the checkpoint of the source, so a
+    failed run is resumed from the end of the last committed chunk, and the parts
+    are saved as the raw file once all of them are committed
+
+    Parameters
+    ----------
+    path_file: str
+        Path of the JSON lines file to be loaded, plain or compressed
+    name: str
+        Name of the source, used for the raw file and its checkpoint
+    chunk_size: int, Optional
+        Minimum number of lines per chunk, by default 1_000_000
+    folder_dest: str, Optional
+        Path of the folder where the raw files are stored, by default 'data/raw'
+    """
+    manifest: dict[str, Any] = ckpt.start(folder=folder_dest, name=name, source=path_file)
+    pprint.success(f'JSON {{ {path_file} }} opened from byte {manifest["offset"]}, chunks of {chunk_size} lines')
+    chunks: Iterator[tuple[pa.Table, int]] = extr.iter_json_offset_chunks(
+        file_path=path_file,
+        chunk_size=chunk_size,
+        block_size=extr.JSON_BLOCK_SIZE,
+        offset=manifest['offset'],
+    )
+    for chunk, offset in chunks:
+        part: str = ckpt.part_path(folder=folder_dest, name=name, index=len(manifest['parts']))
+        rows: int = load.chunks_to_parquet(chunks=(extr.cast_table(table=chunk, fit=False),), path=part, compression=ckpt.COMPRESSION)
+        ckpt.commit(folder=folder_dest, name=name, manifest=manifest, part=part, rows=rows, offset=offset)
+    tr.parts_to_parquet(parts=[part['path'] for part in manifest['parts']], name=name, file_path=folder_dest)
+    ckpt.clear(folder=folder_dest, name=name)
+
+
+@dec.time_it
+def extract_new_days(
+        *,
+        path_file: str,
+        name: str,
+        date_col: str,
+        chunk_size: int | None = None,
+        folder_dest: str = 'data/raw',
+    ) -> None:
+    """
+    Extract only the days of a source after its watermark, and save them as new
+    partitions of the raw dataset of the source
+
+    Parameters
+    ----------
+    path_file: str
+        Path of the CSV or JSON lines file to be loaded
+    name: str
+        Name of the source, used for the raw dataset and its watermark
+    date_col: str
+        The date column of the source
+    chunk_size: int | None, Optional
+        Number of lines per chunk used to read the JSON lines sources, only the new
+        days of every chunk are kept in memory, by default None
+    folder_dest: str, Optional
+        Path of the folder where the raw datasets are stored, by default 'data/raw'
+    """
+    last_day: dt.date | None = tr.read_watermark(name=f'raw_{name}', as_date=True)
+    if not extr.is_dataset(file_path=f'{folder_dest}/{name}'):
+        last_day = None
+    if is_csv(path_file=path_file):
+        chunks: Iterator[pa.Table] = iter((pa.Table.from_pandas(load_csv(path_file=path_file), preserve_index=False),))
+    else:
+        chunks: Iterator[pa.Table] = load_json(
+            path_file=path_file,
+            multi_json=True,
+            chunk_size=chunk_size or 1_000_000
+        )
+
+    news: list[pa.Table] = [
+        chunk if last_day is None else chunk.filter(pc.field(date_col) > last_day)
+        for chunk in chunks
+    ]
+    new: pd.DataFrame = extr.to_pandas(table=extr.concat_tables(tables=news)) if news else pd.DataFrame()
+    if new.empty:
+        pprint.warning(f'No new days for {{ {name} }} after {last_day}')
+        return
+
+    tr.to_parquet(array=((new, name),), file_path=folder_dest, partition_by=date_col, fmt='parquet-gzip')
+    tr.write_watermark(name=f'raw_{name}', value=new[date_col].max())
+
+
+@dec.time_it
+def run(
+        chunk_size: int | None = None,
+        incremental: bool = False,
+        profile: bool = False,
+        spans: bool = False,
+        workers: int = 1,
+        folder_orig: str = 'data/external',
+        folder_dest: str = 'data/raw',
+        config: str = 'config/config.yaml',
+        checkpoint: bool = False,
+    ) -> None:
     """
     Pipeline to extract data from different sources and save it in a parquet file with gzip,
     the files are stored in the 'data/raw' folder by default
+
+    Parameters
+    ----------
+    chunk_size: int | None, Optional
+        Number of lines per chunk used to stream the JSON lines sources into parquet,
+        if None the sources are loaded at once, by default None
+    incremental: bool, Optional
+        If only the days after the last extraction are saved, the raw files are then
+        saved as datasets partitioned by day, by default False
+    profile: bool, Optional
+        If the statistics of the sources and of the raw files are written in 'data/stats',
+        by default False
+    spans: bool, Optional
+        If the spans of the steps are appended to 'data/logs/trace.jsonl', they can be
+        exported with `log.export_chrome`, by default False
+    workers: int, Optional
+        The number of sources extracted at the same time, every source is read, parsed
+        and written by its own task, the CSV sources in threads since the reader of
+        arrow releases the GIL and the JSON sources in processes since building their
+        dataframes holds it, by default 1
+    folder_orig: str, Optional
+        Path of the folder of the sources, local or an object storage URI, e.g.
+        's3://bucket/external', by default 'data/external'
+    folder_dest: str, Optional
+        Path of the folder where the raw files are stored, local or an object storage
+        URI, by default 'data/raw'
+    config: str, Optional
+        Path of the config file, if its `resources` section has a memory budget the
+        workers and the chunk sizes are lowered to fit in the memory left, and the
+        JSON lines sources that do not fit are streamed, by default 'config/config.yaml'
+    checkpoint: bool, Optional
+        If the JSON lines sources are streamed with checkpoints in the '_checkpoints'
+        folder of the raw files, a run that fails is resumed by the next one from the
+        last chunk committed, by default False
     """
     pprint.title('Pipeline Extract')
-    folder: str = 'data/external'
-    pays: pd.DataFrame = load_csv(path_file=f'{folder}/pays.csv')
-    tabs: pd.DataFrame = load_json(path_file=f'{folder}/taps.json', multi_json=True)
-    prints: pd.DataFrame = load_json(path_file=f'{folder}/prints.json', multi_json=True)
-
-    array: tr.ParquetArray = (
-        (pays, 'pays'),
-        (tabs, 'taps'),
-        (prints, 'prints')
+    profiling.configure(enabled=profile)
+    log.configure(enabled=spans)
+    gov.configure(path=config)
+    paths: dict[str, str] = {name: find_source(folder=folder_orig, file=file) for name, file in SOURCES.items()}
+
+    if incremental:
+        extract_new_days(
+            path_file=paths['pays'],
+            name='pays',
+            date_col='pay_date',
+            folder_dest=folder_dest,
+        )
+        for name in ('taps', 'prints'):
+            extract_new_days(
+                path_file=paths[name],
+                name=name,
+                date_col='day',
+                chunk_size=gov.chunk_size(requested=chunk_size, path=paths[name]),
+                folder_dest=folder_dest,
+            )
+        return
+
+    workers = gov.workers(requested=workers, sizes=[gov.source_bytes(path=path) for path in paths.values()] if gov.is_enabled() else [])
+    tasks: list[exe.Task] = [
+        (
+            name,
+            functools.partial(
+                extract_source,
+                path_file=path,
+                name=name,
+                chunk_size=chunk_size if is_csv(path_file=path) else gov.chunk_size(requested=chunk_size, path=path, workers=workers),
+                folder_dest=folder_dest,
+                checkpoint=checkpoint,
+            ),
+        )
+        for name, path in paths.items()
+    ]
+    exe.run_tasks(
+        tasks=tasks,
+        workers=workers,
+        in_processes=tuple(name for name, file in SOURCES.items() if file.endswith('.json')),
     )
-    tr.to_parquet(array=array, file_path='data/raw')
 
 
 if __name__ == '__main__':
     run()
-
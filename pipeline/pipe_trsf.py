@@ -1,18 +1,47 @@
+import numpy as np
 import pandas as pd
-from typing import Any
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Any, Iterator
 from etl.extr import extraction as extr
-from etl.trsf import transform as trsf
+from etl.trsf import (
+    transform as trsf,
+    lazy as lzy,
+)
 from etl.load import load
 from etl.utils import (
     pprint,
     decorators as dec,
+    executor as exe,
+    dag,
+    cache,
+    profiling,
+    logging as log,
+    governor as gov,
+    storage,
 )
 from etl import transversal as tr
 import datetime as dt
+import functools
+import os
+
+
+WEEKS: dict[str, int] = {'prints': 1, 'taps': 3, 'pays': 3}
+TO_GROUP: tuple[tuple[str, list[str], str], ...] = (
+    ('taps', ['user_id', 'day', 'event_data_value_prop'], 'count'),
+    ('pays', ['user_id', 'pay_date', 'value_prop'], 'sum'),
+    ('prints', ['user_id', 'day', 'event_data_value_prop', 'event_data_position'], 'count'),
+)
+CSV_SUFFIXES: dict[str | None, str] = {None: '.csv', 'gzip': '.csv.gz'}
 
 
 @dec.time_it
-def load_parquet(*, path_file: str) -> pd.DataFrame:
+def load_parquet(
+        *,
+        path_file: str,
+        columns: list[str] | None = None,
+        filters: list[tuple[str, str, Any]] | None = None,
+    ) -> pd.DataFrame:
     """
     Reads the parquet file and returns a pandas dataframe
 
@@ -20,41 +49,84 @@ def load_parquet(*, path_file: str) -> pd.DataFrame:
     ----------
     path_file: str
         Path to the parquet file
+    columns: list[str] | None, Optional
+        The columns to read, by default all of them
+    filters: list[tuple[str, str, Any]] | None, Optional
+        The row filters pushed down to the parquet reader, by default None
 
     Returns
     -------
     pd.DataFrame
         A pandas dataframe with the data from the parquet file
     """
-    parquet: pd.DataFrame = extr.load_parquet(file_path=path_file)
+    parquet: pd.DataFrame = extr.load_parquet(file_path=path_file, columns=columns, filters=filters)
     pprint.success(f'Parquet {{ {path_file} }} loaded!')
-    tr.print_basic_df_info(df=parquet)
+    log.add(bytes_read=log.file_size(path_file))
+    pprint.info(f'shape: {parquet.shape}')
     return parquet
 
 
 @dec.time_it
-def normalize_json_columns(*, df: pd.DataFrame) -> pd.DataFrame:
+def load_parquet_table(
+        *,
+        path_file: str,
+        filters: list[tuple[str, str, Any]] | None = None,
+    ) -> pa.Table:
     """
-    Normalize json columns and returns a pandas dataframe
+    Reads the parquet file and returns an arrow table
 
     Parameters
     ----------
-    df: pd.DataFrame
-        A pandas dataframe with the data from the parquet file
+    path_file: str
+        Path to the parquet file
+    filters: list[tuple[str, str, Any]] | None, Optional
+        The row filters pushed down to the parquet reader, by default None
+
+    Returns
+    -------
+    pa.Table
+        An arrow table with the data from the parquet file
+    """
+    table: pa.Table = extr.load_parquet_table(file_path=path_file, filters=filters)
+    pprint.success(f'Parquet {{ {path_file} }} loaded!')
+    log.add(bytes_read=log.file_size(path_file))
+    pprint.info(f'shape: {table.shape}')
+    pprint.info(f'schema:\n{table.schema.remove_metadata()}')
+    return table
+
+
+@dec.time_it
+def normalize_json_columns(*, table: pa.Table) -> pd.DataFrame:
+    """
+    Normalize json columns, cast them to the schema of the sources and returns a pandas dataframe
+
+    Parameters
+    ----------
+    table: pa.Table
+        An arrow table with the data from the parquet file
 
     Returns
     -------
     pd.DataFrame
         A pandas dataframe with normalized json columns
     """
-    df_norm: pd.DataFrame = trsf.pdjson_normalize(df=df)
+    df_norm: pd.DataFrame = trsf.arrow_json_normalize(table=extr.cast_table(table=table))
     pprint.success('JSON normalized!')
-    tr.print_basic_df_info(df=df_norm)
+    pprint.info(f'shape: {df_norm.shape}')
     return df_norm
 
 
 @dec.time_it
-def step_normalize(*, to_norm: tuple[str, ...], folder_files: str = 'data/raw', step_code: str = '010_') -> None:
+def step_normalize(
+        *,
+        to_norm: tuple[str, ...],
+        folder_files: str = 'data/raw',
+        folder_dest: str = 'data/staging',
+        step_code: str = '010_',
+        partitioned: bool = False,
+        workers: int = 1,
+        processes: bool = False,
+    ) -> None:
     """
     Run the normalization step
 
@@ -64,16 +136,118 @@ def step_normalize(*, to_norm: tuple[str, ...], folder_files: str = 'data/raw',
         A tuple with the names of the files to normalize
     folder_files: str, Optional
         Path to the folder where the files are stored, by default 'data/raw'
+    folder_dest: str, Optional
+        Path to the folder where the normalized files are stored, by default 'data/staging'
     step_code: str, Optional
         The step code, by default '010_'
+    partitioned: bool, Optional
+        If the normalized files are saved as datasets partitioned by their date column,
+        so the filtering steps only read the days inside their window, by default False
+    workers: int, Optional
+        The number of files to normalize at the same time, by default 1
+    processes: bool, Optional
+        If the files are normalized in a process pool instead of a thread pool, by default False
     """
     pprint.title(f'STEP : Normalize -> {step_code}')
-    ext: str = '.parquet.gzip'
-    for parquet_file in to_norm:
-        parquet: pd.DataFrame = load_parquet(path_file=f'{folder_files}/{parquet_file}{ext}')
-        parquet_norm: pd.DataFrame = normalize_json_columns(df=parquet)
-        array: tr.ParquetArray = ((parquet_norm, f'{step_code}{parquet_file}'),)
-        tr.to_parquet(array=array, file_path='data/staging')
+    tasks: list[exe.Task] = [
+        (
+            f'{step_code}{parquet_file}',
+            functools.partial(
+                normalize_file,
+                parquet_file=parquet_file,
+                folder_files=folder_files,
+                folder_dest=folder_dest,
+                step_code=step_code,
+                partitioned=partitioned,
+            ),
+        )
+        for parquet_file in to_norm
+    ]
+    exe.run_tasks(tasks=tasks, workers=workers, processes=processes)
+
+
+@cache.memoize(
+    inputs=lambda **kw: [tr.get_parquet_path(file_path=kw['folder_files'], name=kw['parquet_file'])],
+    outputs=lambda **kw: [
+        tr.get_staging_path(
+            file_path=kw['folder_dest'],
+            name=f"{kw['step_code']}{kw['parquet_file']}",
+            partitioned=kw['partitioned'],
+        )
+    ],
+)
+def normalize_file(
+        *,
+        parquet_file: str,
+        folder_files: str = 'data/raw',
+        folder_dest: str = 'data/staging',
+        step_code: str = '010_',
+        partitioned: bool = False,
+    ) -> None:
+    """
+    Normalize one file of the normalization step
+
+    Parameters
+    ----------
+    parquet_file: str
+        The name of the file to normalize
+    folder_files: str, Optional
+        Path to the folder where the file is stored, by default 'data/raw'
+    folder_dest: str, Optional
+        Path to the folder where the normalized file is stored, by default 'data/staging'
+    step_code: str, Optional
+        The step code, by default '010_'
+    partitioned: bool, Optional
+        If the normalized file is saved partitioned by its date column, by default False
+    """
+    parquet: pa.Table = load_parquet_table(path_file=tr.get_parquet_path(file_path=folder_files, name=parquet_file))
+    parquet_norm: pd.DataFrame = normalize_json_columns(table=parquet)
+    array: tr.ParquetArray = ((parquet_norm, f'{step_code}{parquet_file}'),)
+    date_col: str = get_date_column(columns=list(parquet_norm.columns))
+    tr.to_parquet(
+        array=array,
+        file_path=folder_dest,
+        sort_by=date_col,
+        partition_by=date_col if partitioned else None,
+    )
+
+
+def get_date_column(*, columns: list[str]) -> str:
+    """
+    Get the date column of a file, 'day' for prints and taps and 'pay_date' for pays
+
+    Parameters
+    ----------
+    columns: list[str]
+        The columns of the file
+
+    Returns
+    -------
+    str
+        The name of the date column
+    """
+    column: str = 'day' if 'day' in columns else 'pay_date'
+    return column
+
+
+def get_start_date(*, max_col_value: dt.date, weeks: int) -> dt.date:
+    """
+    Get the first day of the window of the last weeks
+
+    Parameters
+    ----------
+    max_col_value: dt.date
+        The last day of the window
+    weeks: int
+        The number of weeks of the window
+
+    Returns
+    -------
+    dt.date
+        The first day of the window
+    """
+    start_date: dt.date = max_col_value - dt.timedelta(days=(7 * weeks))
+    return start_date
 
 
 @dec.time_it
@@ -83,7 +257,9 @@ def filter_last_weeks(
         folder_dest: str = 'data/staging',
         folder_orig: str = 'data/staging',
         step_code: str = '021_',
-        weeks: int = 1
+        weeks: int = 1,
+        workers: int = 1,
+        processes: bool = False,
     ) -> None:
     """
     Run the filtering step
@@ -100,23 +276,67 @@ def filter_last_weeks(
         The step code, by default '021_'
     weeks: int, Optional
         The number of weeks to filter, by default 1
+    workers: int, Optional
+        The number of files to filter at the same time, by default 1
+    processes: bool, Optional
+        If the files are filtered in a process pool instead of a thread pool, by default False
     """
     pprint.title(f'STEP : Filtering | last {weeks} weeks | -> {step_code}')
-    for parquet_file in to_norm:
-        parquet: pd.DataFrame = load_parquet(path_file=f'{folder_orig}/{parquet_file}.parquet.gzip')
-        column: str = 'day' if 'day' in parquet.columns.values else 'pay_date'
-        max_col_value: Any = trsf.get_max_data_column(df=parquet, column=column)
-        max_date: dt.datetime = dt.datetime.strptime(max_col_value, '%Y-%m-%d')
-        last_7_days: dt.date = ( max_date - dt.timedelta( days=( 7 * weeks ) ) ).date()
-        start_date: str = last_7_days.strftime('%Y-%m-%d')
-        parquet_filter: pd.DataFrame = trsf.filter_by_day(
-            df=parquet,
-            date_col=column,
-            start_date=start_date,
-            end_date=max_col_value
+    tasks: list[exe.Task] = [
+        (
+            f'{step_code}{parquet_file}',
+            functools.partial(
+                filter_file_last_weeks,
+                parquet_file=parquet_file,
+                folder_dest=folder_dest,
+                folder_orig=folder_orig,
+                step_code=step_code,
+                weeks=weeks,
+            ),
         )
-        array: tr.ParquetArray = ((parquet_filter, f'{step_code}{parquet_file}'),)
-        tr.to_parquet(array=array, file_path=folder_dest, print_info=True)
+        for parquet_file in to_norm
+    ]
+    exe.run_tasks(tasks=tasks, workers=workers, processes=processes)
+
+
+@cache.memoize(
+    inputs=lambda **kw: [tr.get_parquet_path(file_path=kw['folder_orig'], name=kw['parquet_file'])],
+    outputs=lambda **kw: [tr.get_staging_path(file_path=kw['folder_dest'], name=f"{kw['step_code']}{kw['parquet_file']}")],
+)
+def filter_file_last_weeks(
+        *,
+        parquet_file: str,
+        folder_dest: str = 'data/staging',
+        folder_orig: str = 'data/staging',
+        step_code: str = '021_',
+        weeks: int = 1,
+    ) -> None:
+    """
+    Filter the last weeks of one file of the filtering step
+
+    Parameters
+    ----------
+    parquet_file: str
+        The name of the file to filter
+    folder_dest: str, Optional
+        Path to the folder where the filtered file is stored, by default 'data/staging'
+    folder_orig: str, Optional
+        Path to the folder where the file is stored, by default 'data/staging'
+    step_code: str, Optional
+        The step code, by default '021_'
+    weeks: int, Optional
+        The number of weeks to filter, by default 1
+    """
+    path_file: str = tr.get_parquet_path(file_path=folder_orig, name=parquet_file)
+    column: str = get_date_column(columns=extr.get_parquet_columns(file_path=path_file))
+    max_col_value: Any = extr.get_max_statistic(file_path=path_file, column=column)
+    start_date: dt.date = get_start_date(max_col_value=max_col_value, weeks=weeks)
+    parquet_filter: pd.DataFrame = load_parquet(
+        path_file=path_file,
+        filters=[(column, '>=', start_date), (column, '<=', max_col_value)],
+    )
+    array: tr.ParquetArray = ((parquet_filter, f'{step_code}{parquet_file}'),)
+    tr.to_parquet(array=array, file_path=folder_dest, print_info=True)
 
 
 @dec.time_it
@@ -126,23 +346,167 @@ def filter_by_values(
         folder_dest: str = 'data/staging',
         folder_orig: str = 'data/staging',
         step_code: str = '022_',
-        column: str = 'user_id',
+        column: str | list[str] = 'user_id',
         filter_from: str = 'prints',
-    ):
+        workers: int = 1,
+        processes: bool = False,
+    ) -> None:
+    """
+    Run the filtering step by values, a semi join of every file against the keys of
+    another file, the set of keys is built once and reused for all the files. Only
+    the range of the keys is pushed down to the parquet reader, to skip row groups,
+    the exact keys are kept by the semi join
+
+    Parameters
+    ----------
+    to_filter: tuple[str, ...]
+        A tuple with the names of the files to filter
+    folder_dest: str, Optional
+        Path to the folder where the files are stored, by default 'data/staging'
+    folder_orig: str, Optional
+        Path to the folder where the file with the keys is stored, by default 'data/staging'
+    step_code: str, Optional
+        The step code, by default '022_'
+    column: str | list[str], Optional
+        The key column, or columns for a composite key, by default 'user_id'
+    filter_from: str, Optional
+        The file with the keys to keep, by default 'prints'
+    workers: int, Optional
+        The number of files to filter at the same time, by default 1
+    processes: bool, Optional
+        If the files are filtered in a process pool instead of a thread pool, by default False
+    """
     pprint.title(f'STEP : Filtering | Users ID | -> {step_code}')
 
-    prints: pd.DataFrame = load_parquet(path_file=f'{folder_orig}/{filter_from}.parquet.gzip')
-    column_value: pd.Series = trsf.get_column(df=prints, column=column)
-    for tfilter in to_filter:
-        parquet: pd.DataFrame = load_parquet(path_file=f'{folder_dest}/{tfilter}.parquet.gzip')
-        parquet_filter: pd.DataFrame = trsf.filter_by_values(df=parquet, column=column, values=column_value)
-        tr.to_parquet(
-            array=(
-                (parquet_filter, f'{step_code}{tfilter}'),
+    columns: list[str] = [column] if isinstance(column, str) else list(column)
+    prints: pd.DataFrame = load_parquet(path_file=tr.get_parquet_path(file_path=folder_orig, name=filter_from), columns=columns)
+    keys: pd.Index = trsf.build_key_set(df=prints, columns=columns)
+    filters: list[tuple[str, str, Any]] = trsf.key_set_filters(keys=keys, columns=columns)
+    tasks: list[exe.Task] = [
+        (
+            f'{step_code}{tfilter}',
+            functools.partial(
+                filter_file_by_values,
+                tfilter=tfilter,
+                keys=keys,
+                columns=columns,
+                filters=filters,
+                folder_dest=folder_dest,
+                step_code=step_code,
             ),
-            file_path=folder_dest,
-            print_info=True
         )
+        for tfilter in to_filter
+    ]
+    exe.run_tasks(tasks=tasks, workers=workers, processes=processes)
+
+
+@dec.time_it
+def save_key_set(
+        *,
+        filter_from: str,
+        column: str | list[str] = 'user_id',
+        folder_orig: str = 'data/staging',
+        folder_dest: str = 'data/staging',
+        step_code: str = 'keys_',
+    ) -> None:
+    """
+    Build the key set of a file once and save it, so the filters of the nodes of the
+    DAG load it instead of building it again from the file for every target
+
+    Parameters
+    ----------
+    filter_from: str
+        The file with the keys to keep, e.g. '021_010_prints'
+    column: str | list[str], Optional
+        The key column, or columns for a composite key, by default 'user_id'
+    folder_orig: str, Optional
+        Path to the folder where the file with the keys is stored, by default 'data/staging'
+    folder_dest: str, Optional
+        Path to the folder where the key set is stored, by default 'data/staging'
+    step_code: str, Optional
+        The step code, by default 'keys_'
+    """
+    columns: list[str] = [column] if isinstance(column, str) else list(column)
+    values: pd.DataFrame = load_parquet(path_file=tr.get_parquet_path(file_path=folder_orig, name=filter_from), columns=columns)
+    keys: pd.Index = trsf.build_key_set(df=values, columns=columns)
+    tr.to_parquet(array=((keys.to_frame(index=False), f'{step_code}{filter_from}'),), file_path=folder_dest, print_info=True)
+
+
+def filter_file_by_key_set(
+        *,
+        tfilter: str,
+        key_set: str,
+        folder_dest: str = 'data/staging',
+        step_code: str = '022_',
+    ) -> None:
+    """
+    Filter one file by the key set saved by `save_key_set`
+
+    Parameters
+    ----------
+    tfilter: str
+        The name of the file to filter
+    key_set: str
+        The name of the saved key set, e.g. 'keys_021_010_prints'
+    folder_dest: str, Optional
+        Path to the folder where the files and the key set are stored, by default 'data/staging'
+    step_code: str, Optional
+        The step code, by default '022_'
+    """
+    values: pd.DataFrame = load_parquet(path_file=tr.get_parquet_path(file_path=folder_dest, name=key_set))
+    columns: list[str] = list(values.columns)
+    # The saved keys are already distinct, the index is made from them as they are
+    keys: pd.Index = pd.MultiIndex.from_frame(values) if len(columns) > 1 else pd.Index(values[columns[0]], name=columns[0])
+    filter_file_by_values(
+        tfilter=tfilter,
+        keys=keys,
+        columns=columns,
+        filters=trsf.key_set_filters(keys=keys, columns=columns),
+        folder_dest=folder_dest,
+        step_code=step_code,
+    )
+
+
+def filter_file_by_values(
+        *,
+        tfilter: str,
+        keys: pd.Index,
+        columns: list[str],
+        filters: list[tuple[str, str, Any]],
+        folder_dest: str = 'data/staging',
+        step_code: str = '022_',
+    ) -> None:
+    """
+    Filter one file of the filtering step by values
+
+    Parameters
+    ----------
+    tfilter: str
+        The name of the file to filter
+    keys: pd.Index
+        The key set to keep, given by `trsf.build_key_set`
+    columns: list[str]
+        The key columns of the file
+    filters: list[tuple[str, str, Any]]
+        The row filters of the key set pushed down to the parquet reader
+    folder_dest: str, Optional
+        Path to the folder where the files are stored, by default 'data/staging'
+    step_code: str, Optional
+        The step code, by default '022_'
+    """
+    parquet: pd.DataFrame = load_parquet(
+        path_file=tr.get_parquet_path(file_path=folder_dest, name=tfilter),
+        filters=filters or None,
+    )
+    parquet_filter: pd.DataFrame = trsf.semi_join(df=parquet, keys=keys, columns=columns)
+    tr.to_parquet(
+        array=(
+            (parquet_filter, f'{step_code}{tfilter}'),
+        ),
+        file_path=folder_dest,
+        print_info=True
+    )
+
 
 @dec.time_it
 def step_filtering(
@@ -150,29 +514,52 @@ def step_filtering(
         to_filter: dict[int, tuple[str, ...]],
         folder_dest: str = 'data/staging',
         folder_orig: str = 'data/staging',
-        step_code: str = '020_'
+        step_code: str = '020_',
+        workers: int = 1,
+        processes: bool = False,
     ) -> None:
     """
-    Run the filtering step
+    Run the filtering step, the files of the last weeks filter (021) run at the same
+    time, and the users filter (022) runs once all of them are done, because it
+    needs '021_010_prints'
 
     Parameters
     ----------
-    to_norm: tuple[str, ...]
-        A tuple with the names of the files to normalize
+    to_filter: dict[int, tuple[str, ...]]
+        The names of the files to filter for every number of weeks
     folder_dest: str, Optional
         Path to the folder where the files are stored, by default 'data/staging'
     folder_orig: str, Optional
         Path to the folder where the files are stored, by default 'data/staging'
     step_code: str, Optional
         The step code, by default '020_'
+    workers: int, Optional
+        The number of files to filter at the same time, by default 1
+    processes: bool, Optional
+        If the files are filtered in a process pool instead of a thread pool, by default False
     """
     pprint.title(f'STEP : Filtering -> {step_code}')
-    for ws, tfilter in to_filter.items():
-        filter_last_weeks(to_norm=tfilter, folder_dest=folder_dest, folder_orig=folder_orig, weeks=ws)
+    tasks: list[exe.Task] = [
+        (
+            f'021_{parquet_file}',
+            functools.partial(
+                filter_file_last_weeks,
+                parquet_file=parquet_file,
+                folder_dest=folder_dest,
+                folder_orig=folder_orig,
+                weeks=ws,
+            ),
+        )
+        for ws, tfilter in to_filter.items()
+        for parquet_file in tfilter
+    ]
+    exe.run_tasks(tasks=tasks, workers=workers, processes=processes)
 
     filter_by_values(
         to_filter=('021_010_taps', '021_010_pays'),
         filter_from='021_010_prints',
+        workers=workers,
+        processes=processes,
     )
 
 
@@ -182,7 +569,12 @@ def step_grouping(
         to_group: tuple[tuple[str, str, str], ...],
         folder_orig: str = 'data/staging',
         folder_dest: str = 'data/staging',
-        step_code: str = '030_'
+        step_code: str = '030_',
+        workers: int = 1,
+        processes: bool = False,
+        exports: dict[str, str] | None = None,
+        csv_compression: str | None = None,
+        memory_budget: int | None = None,
     ) -> None:
     """
     Step to group the data
@@ -197,58 +589,863 @@ def step_grouping(
         Path to the folder where the files are stored, by default 'data/staging'
     step_code: str, Optional
         The step code, by default '030_'
+    workers: int, Optional
+        The number of files to group at the same time, by default 1
+    processes: bool, Optional
+        If the files are grouped in a process pool instead of a thread pool, by default False
+    exports: dict[str, str] | None, Optional
+        The CSV files the grouped tables are exported to from memory, by the name of
+        the file to group, by default None
+    csv_compression: str | None, Optional
+        The compression of the CSV files, e.g. 'gzip', by default None
+    memory_budget: int | None, Optional
+        The bytes a file can take in memory, the larger files are grouped out of core,
+        by default None
     """
     pprint.title(f'STEP : Grouping -> {step_code}')
+    exports = exports or {}
+    tasks: list[exe.Task] = [
+        (
+            f'{step_code}{parquet_file}',
+            functools.partial(
+                group_file,
+                parquet_file=parquet_file,
+                by=by,
+                op=op,
+                folder_orig=folder_orig,
+                folder_dest=folder_dest,
+                step_code=step_code,
+                csv_path=exports.get(parquet_file),
+                csv_compression=csv_compression,
+                memory_budget=memory_budget,
+            ),
+        )
+        for parquet_file, by, op in to_group
+    ]
+    exe.run_tasks(tasks=tasks, workers=workers, processes=processes)
+
+
+@cache.memoize(
+    inputs=lambda **kw: [tr.get_parquet_path(file_path=kw['folder_orig'], name=kw['parquet_file'])],
+    outputs=lambda **kw: [
+        tr.get_staging_path(file_path=kw['folder_dest'], name=f"{kw['step_code']}{kw['parquet_file']}"),
+        *([kw['csv_path']] if kw['csv_path'] is not None else []),
+    ],
+)
+def group_file(
+        *,
+        parquet_file: str,
+        by: list[str],
+        op: str,
+        folder_orig: str = 'data/staging',
+        folder_dest: str = 'data/staging',
+        step_code: str = '030_',
+        csv_path: str | None = None,
+        csv_compression: str | None = None,
+        memory_budget: int | None = None,
+        spill_dir: str = 'data/spill',
+    ) -> None:
+    """
+    Group one file of the grouping step
+
+    Parameters
+    ----------
+    parquet_file: str
+        The name of the file to group
+    by: list[str]
+        The columns to group by
+    op: str
+        The operation to perform on the grouped data
+    folder_orig: str, Optional
+        Path to the folder where the file is stored, by default 'data/staging'
+    folder_dest: str, Optional
+        Path to the folder where the grouped file is stored, by default 'data/staging'
+    step_code: str, Optional
+        The step code, by default '030_'
+    csv_path: str | None, Optional
+        If given, the grouped table is also exported to this CSV file from memory,
+        by default None
+    csv_compression: str | None, Optional
+        The compression of the CSV file, e.g. 'gzip', by default None
+    memory_budget: int | None, Optional
+        The bytes the file can take in memory, if its uncompressed size is larger it
+        is grouped out of core, spilling its batches to disk, by default None
+    spill_dir: str, Optional
+        Path to the folder of the spilled files, by default 'data/spill'
+    """
+    path_file: str = tr.get_parquet_path(file_path=folder_orig, name=parquet_file)
+    rows, size = extr.estimate_size(file_path=path_file) if memory_budget is not None else (0, 0)
+    if memory_budget is not None and size > memory_budget:
+        buckets: int = -(-2 * size // memory_budget)
+        batch_size: int = max(1024, memory_budget // 4 // max(1, size // max(1, rows)))
+        pprint.info(f'{parquet_file} : {size} bytes over the budget of {memory_budget}, spilling to {buckets} buckets')
+        table_group: pa.Table = trsf.spill_group_by(
+            batches=extr.iter_batches(file_path=path_file, batch_size=batch_size),
+            by=by,
+            operation=op,
+            buckets=buckets,
+            folder=spill_dir,
+        )
+    else:
+        parquet: pa.Table = load_parquet_table(path_file=path_file)
+        table_group: pa.Table = trsf.group_by(table=extr.drop_pandas_index(table=parquet), by=by, operation=op)
+    parquet_group: pa.Table = extr.cast_table(table=table_group)
+    tr.to_parquet(array=((parquet_group, f'{step_code}{parquet_file}'),), file_path=folder_dest, print_info=True)
+    if csv_path is not None:
+        rows: int = load.batches_to_csv(batches=parquet_group, path=csv_path, compression=csv_compression)
+        pprint.success(f'CSV {{ {csv_path} }} exported, {rows} rows')
+
+
+@dec.time_it
+def step_lazy(
+        *,
+        weeks: dict[str, int],
+        to_group: tuple[tuple[str, list[str], str], ...],
+        filter_from: str = 'prints',
+        column: str = 'user_id',
+        folder_orig: str = 'data/raw',
+        folder_dest: str = 'data/staging',
+        trace: bool = False,
+    ) -> None:
+    """
+    Run the normalize (010), last weeks filter (021), users filter (022) and grouping (030)
+    steps as one lazy plan per file, only the outputs needed by the export are written,
+    i.e. the 030 files and the 021 file used to filter the users
+
+    Parameters
+    ----------
+    weeks: dict[str, int]
+        The number of weeks to keep for every file
+    to_group: tuple[tuple[str, list[str], str], ...]
+        The files to group, with the columns to group by and the operation
+    filter_from: str, Optional
+        The file with the values used to filter the other files, by default 'prints'
+    column: str, Optional
+        The column to filter the files by, by default 'user_id'
+    folder_orig: str, Optional
+        Path to the folder where the raw files are stored, by default 'data/raw'
+    folder_dest: str, Optional
+        Path to the folder where the files are stored, by default 'data/staging'
+    trace: bool, Optional
+        If the intermediate 010, 021 and 022 files are also written, by default False
+    """
+    pprint.title('STEP : Lazy -> 010_ | 021_ | 022_ | 030_')
+    plans: dict[str, lzy.Plan] = {}
+    columns: dict[str, list[str]] = {}
+    names: dict[str, str] = {}
+    for parquet_file, ws in weeks.items():
+        path_file: str = tr.get_parquet_path(file_path=folder_orig, name=parquet_file)
+        date_col: str = get_date_column(columns=extr.get_parquet_columns(file_path=path_file))
+        max_col_value: Any = extr.get_max_statistic(file_path=path_file, column=date_col)
+        start_date: dt.date = get_start_date(max_col_value=max_col_value, weeks=ws)
+        if trace:
+            plan, schema = lzy.scan_parquet(file_path=path_file)
+            plan, _ = lzy.normalize(plan=plan, schema=schema, types=extr.SCHEMA)
+            tr.to_parquet(
+                array=((lzy.to_dataframe(plan=plan, types=extr.SCHEMA), f'010_{parquet_file}'),),
+                file_path=folder_dest,
+                sort_by=date_col,
+            )
+
+        plan, schema = lzy.scan_parquet(
+            file_path=path_file,
+            filter=(pc.field(date_col) >= start_date) & (pc.field(date_col) <= max_col_value),
+        )
+        plan, columns[parquet_file] = lzy.normalize(plan=plan, schema=schema, types=extr.SCHEMA)
+        plans[parquet_file] = lzy.filter_by_day(
+            plan=plan,
+            date_col=date_col,
+            start_date=start_date,
+            end_date=max_col_value,
+        )
+        names[parquet_file] = f'021_010_{parquet_file}'
+        if trace and parquet_file != filter_from:
+            tr.to_parquet(array=((lzy.to_dataframe(plan=plans[parquet_file], types=extr.SCHEMA), names[parquet_file]),), file_path=folder_dest)
+
+    values: pd.DataFrame = lzy.to_dataframe(plan=plans[filter_from], types=extr.SCHEMA)
+    tr.to_parquet(array=((values, names[filter_from]),), file_path=folder_dest)
+    values_table: pa.Table = pa.Table.from_pandas(values[[column]], preserve_index=False)
+    plans[filter_from] = lzy.from_table(table=pa.Table.from_pandas(values, preserve_index=False))
+    for parquet_file in weeks:
+        if parquet_file == filter_from:
+            continue
+        plans[parquet_file] = lzy.filter_by_values(
+            plan=plans[parquet_file],
+            values=lzy.from_table(table=values_table),
+            columns=[column],
+        )
+        names[parquet_file] = f'022_{names[parquet_file]}'
+        if trace:
+            tr.to_parquet(array=((lzy.to_dataframe(plan=plans[parquet_file], types=extr.SCHEMA), names[parquet_file]),), file_path=folder_dest)
+
     for parquet_file, by, op in to_group:
-        parquet: pd.DataFrame = load_parquet(path_file=f'{folder_orig}/{parquet_file}.parquet.gzip')
-        parquet_group: pd.DataFrame = trsf.group_by(df=parquet, by=by, operation=op)
-        array: tr.ParquetArray = ((parquet_group, f'{step_code}{parquet_file}'),)
-        tr.to_parquet(array=array, file_path=folder_dest, print_info=True)
+        plan: lzy.Plan = lzy.group_by(
+            plan=plans[parquet_file],
+            by=by,
+            values=[col for col in columns[parquet_file] if col not in by],
+            operation=op,
+        )
+        parquet_group: pa.Table = trsf.sort_table(
+            table=extr.cast_table(table=lzy.to_table(plan=plan), schema=extr.SCHEMA),
+            by=by,
+        )
+        tr.to_parquet(array=((parquet_group, f'030_{names[parquet_file]}'),), file_path=folder_dest, print_info=True)
 
 
 @dec.time_it
-def run(steps: tuple[str, ...] = ('normalize','filter_las_week', 'grouping')) -> None:
+def step_incremental(
+        *,
+        weeks: dict[str, int],
+        to_group: tuple[tuple[str, list[str], str], ...],
+        filter_from: str = 'prints',
+        column: str = 'user_id',
+        folder_orig: str = 'data/raw',
+        folder_dest: str = 'data/staging',
+    ) -> None:
+    """
+    Run the normalize, filter and grouping steps only for the days after the last run.
+
+    The new days are normalized into the 010 datasets and grouped into per day partial
+    aggregates, the 031 datasets, both partitioned by day. The 030 files are then built
+    merging the partial aggregates of the days inside every window, so the last weeks are
+    never normalized or grouped again.
+
+    Parameters
+    ----------
+    weeks: dict[str, int]
+        The number of weeks to keep for every file
+    to_group: tuple[tuple[str, list[str], str], ...]
+        The files to group, with the columns to group by and the operation, the date
+        column of every file must be one of the columns to group by
+    filter_from: str, Optional
+        The file with the values used to filter the other files, by default 'prints'
+    column: str, Optional
+        The column to filter the files by, by default 'user_id'
+    folder_orig: str, Optional
+        Path to the folder where the raw files are stored, by default 'data/raw'
+    folder_dest: str, Optional
+        Path to the folder where the files are stored, by default 'data/staging'
+    """
+    pprint.title('STEP : Incremental -> 010_ | 031_ | 030_')
+    groups: dict[str, tuple[list[str], str]] = {name: (by, op) for name, by, op in to_group}
+    windows: dict[str, list[tuple[str, str, Any]]] = {}
+    for parquet_file, ws in weeks.items():
+        path_file: str = tr.get_parquet_path(file_path=folder_orig, name=parquet_file)
+        date_col: str = get_date_column(columns=extr.get_parquet_columns(file_path=path_file))
+        by, op = groups[parquet_file]
+        if date_col not in by:
+            raise ValueError(f'The date column {date_col} must be grouped by to merge the days of {parquet_file}')
+
+        last_day: dt.date | None = tr.read_watermark(name=f'010_{parquet_file}', as_date=True)
+        if not extr.is_dataset(file_path=f'{folder_dest}/010_{parquet_file}'):
+            last_day = None
+        parquet: pa.Table = load_parquet_table(
+            path_file=path_file,
+            filters=None if last_day is None else [(date_col, '>', last_day)],
+        )
+        if parquet.num_rows > 0:
+            parquet_norm: pd.DataFrame = normalize_json_columns(table=parquet)
+            parquet_partial: pd.DataFrame = trsf.partial_group_by(df=parquet_norm, by=by, operation=op)
+            tr.to_parquet(
+                array=(
+                    (parquet_norm, f'010_{parquet_file}'),
+                    (parquet_partial, f'031_010_{parquet_file}'),
+                ),
+                file_path=folder_dest,
+                partition_by=date_col,
+            )
+            tr.write_watermark(name=f'010_{parquet_file}', value=parquet_norm[date_col].max())
+        else:
+            pprint.warning(f'No new days for {{ {parquet_file} }} after {last_day}')
+
+        max_col_value: Any = extr.get_max_statistic(file_path=f'{folder_dest}/010_{parquet_file}', column=date_col)
+        start_date: dt.date = get_start_date(max_col_value=max_col_value, weeks=ws)
+        windows[parquet_file] = [(date_col, '>=', start_date), (date_col, '<=', max_col_value)]
+
+    values: pd.DataFrame = load_parquet(
+        path_file=f'{folder_dest}/010_{filter_from}',
+        filters=windows[filter_from],
+    )
+    tr.to_parquet(array=((values, f'021_010_{filter_from}'),), file_path=folder_dest)
+    keys: pd.Index = trsf.build_key_set(df=values, columns=[column])
+
+    for parquet_file, (by, op) in groups.items():
+        name: str = f'021_010_{parquet_file}'
+        parquet_partial: pd.DataFrame = load_parquet(
+            path_file=f'{folder_dest}/031_010_{parquet_file}',
+            filters=windows[parquet_file],
+        )
+        if parquet_file != filter_from:
+            parquet_partial = trsf.semi_join(df=parquet_partial, keys=keys, columns=[column])
+            name = f'022_{name}'
+        parquet_group: pd.DataFrame = trsf.merge_partial_group_by(df=parquet_partial, by=by, operation=op)
+        tr.to_parquet(array=((parquet_group, f'030_{name}'),), file_path=folder_dest, print_info=True)
+
+
+def iter_features(
+        *,
+        weeks: int = 3,
+        last_weeks: int = 1,
+        buckets: int = 1,
+        filter_from: str = '021_010_prints',
+        folder_orig: str = 'data/staging',
+    ) -> Iterator[pd.DataFrame]:
+    """
+    Build the features of the prints, one dataframe per bucket of users, only the
+    prints and the events of the users of one bucket are kept in memory
+
+    Parameters
+    ----------
+    weeks: int, Optional
+        The number of weeks before every print that are aggregated, by default 3
+    last_weeks: int, Optional
+        The number of weeks of the prints, used to read only the days of the events
+        needed by their windows, by default 1
+    buckets: int, Optional
+        The number of buckets of users, by default 1
+    filter_from: str, Optional
+        The file with the prints, by default '021_010_prints'
+    folder_orig: str, Optional
+        Path to the folder where the files are stored, by default 'data/staging'
+
+    Yields
+    ------
+    pd.DataFrame
+        The features of the prints of a bucket of users
+    """
+    prints_path: str = tr.get_parquet_path(file_path=folder_orig, name=filter_from)
+    max_day: dt.date = extr.get_max_statistic(file_path=prints_path, column='day')
+    start_date: dt.date = get_start_date(max_col_value=max_day, weeks=last_weeks + weeks)
+    max_user: int = extr.get_max_statistic(file_path=prints_path, column='user_id')
+    edges: list[int] = [int(edge) for edge in np.linspace(0, max_user + 1, buckets + 1)]
+    by: list[str] = ['user_id', 'event_data_value_prop']
+    sources: dict[str, tuple[list[str], dict[str, str]]] = {
+        '010_prints': (['day', 'user_id', 'event_data_value_prop'], {}),
+        '010_taps': (['day', 'user_id', 'event_data_value_prop'], {}),
+        '010_pays': (['pay_date', 'user_id', 'value_prop', 'total'], {'pay_date': 'day', 'value_prop': 'event_data_value_prop'}),
+    }
+    for i in range(buckets):
+        users: list[tuple[str, str, Any]] = []
+        if i > 0:
+            users.append(('user_id', '>=', edges[i]))
+        if i < buckets - 1:
+            users.append(('user_id', '<', edges[i + 1]))
+        prints: pd.DataFrame = load_parquet(path_file=prints_path, filters=users or None).reset_index(drop=True)
+        if prints.empty:
+            continue
+
+        events: dict[str, pd.DataFrame] = {}
+        for name, (columns, renames) in sources.items():
+            events[name] = load_parquet(
+                path_file=tr.get_parquet_path(file_path=folder_orig, name=name),
+                columns=columns,
+                filters=users + [(columns[0], '>=', start_date), (columns[0], '<=', max_day)],
+            ).rename(columns=renames)
+
+        window: tuple[int, int] = (-7 * weeks, -1)
+        pays: pd.DataFrame = trsf.trailing_window(
+            df=prints, events=events['010_pays'], by=by, on='day', window=window, values=['total'],
+        )
+        features: pd.DataFrame = prints.assign(
+            clicked=trsf.trailing_window(df=prints, events=events['010_taps'], by=by, on='day', window=(0, 0))['count'] > 0,
+            views=trsf.trailing_window(df=prints, events=events['010_prints'], by=by, on='day', window=window)['count'],
+            taps=trsf.trailing_window(df=prints, events=events['010_taps'], by=by, on='day', window=window)['count'],
+            pays=pays['count'],
+            pays_total=pays['total'],
+        )
+        yield features
+
+
+@dec.time_it
+def step_features(
+        *,
+        weeks: int = 3,
+        last_weeks: int = 1,
+        buckets: int = 1,
+        filter_from: str = '021_010_prints',
+        folder_orig: str = 'data/staging',
+        folder_dest: str = 'data/staging',
+        step_code: str = '040_',
+    ) -> None:
+    """
+    Build the features of every print of the last weeks, if it was clicked and how many
+    times the user saw, clicked and paid the value prop of the print in the weeks before
+    it, the day of the print excluded
+
+    The windows are aggregated by `trsf.trailing_window` over the normalized files,
+    which keep the days before the windows of the grouped files, and the features are
+    written bucket by bucket of users, so the memory is bounded by the size of a bucket
+
+    Parameters
+    ----------
+    weeks: int, Optional
+        The number of weeks before every print that are aggregated, by default 3
+    last_weeks: int, Optional
+        The number of weeks of the prints, by default 1
+    buckets: int, Optional
+        The number of buckets of users, a higher number uses less memory and reads
+        the normalized files more times, by default 1
+    filter_from: str, Optional
+        The file with the prints, by default '021_010_prints'
+    folder_orig: str, Optional
+        Path to the folder where the files are stored, by default 'data/staging'
+    folder_dest: str, Optional
+        Path to the folder where the features are stored, by default 'data/staging'
+    step_code: str, Optional
+        The step code, by default '040_'
+    """
+    pprint.title(f'STEP : Features | {weeks} weeks | -> {step_code}')
+    tr.chunks_to_parquet(
+        chunks=iter_features(
+            weeks=weeks,
+            last_weeks=last_weeks,
+            buckets=buckets,
+            filter_from=filter_from,
+            folder_orig=folder_orig,
+        ),
+        name=f'{step_code}features',
+        file_path=folder_dest,
+    )
+
+
+def export_csv(
+        *,
+        name: str,
+        path: str,
+        folder_orig: str = 'data/staging',
+        compression: str | None = None,
+    ) -> None:
+    """
+    Export a staging parquet to a CSV file, streaming its record batches so the
+    file is never loaded at once
+
+    Parameters
+    ----------
+    name: str
+        The name of the parquet to export
+    path: str
+        The path of the CSV file
+    folder_orig: str, Optional
+        Path to the folder where the parquet is stored, by default 'data/staging'
+    compression: str | None, Optional
+        The compression of the CSV file, e.g. 'gzip', by default None
+    """
+    path_file: str = tr.get_parquet_path(file_path=folder_orig, name=name)
+    rows: int = load.batches_to_csv(batches=extr.iter_batches(file_path=path_file), path=path, compression=compression)
+    pprint.success(f'CSV {{ {path} }} exported, {rows} rows')
+
+
+@dec.time_it
+def step_database(
+        *,
+        to_export: tuple[tuple[str, str, list[str] | None], ...],
+        url: str,
+        folder_orig: str = 'data/staging',
+    ) -> None:
+    """
+    Step to save the grouped and features files in the tables of a SQL database, the
+    files are streamed by record batches, the tables with keys are upserted so the
+    days of an incremental run update their rows and the other tables are replaced
+
+    Parameters
+    ----------
+    to_export: tuple[tuple[str, str, list[str] | None], ...]
+        The files to save with the name of their table and the columns of its key
+    url: str
+        The url of the database, e.g. 'sqlite:///data/processed/meli.db'
+    folder_orig: str, Optional
+        Path to the folder where the files are stored, by default 'data/staging'
+    """
+    pprint.title(f'STEP : Database -> {url}')
+    for name, table, keys in to_export:
+        path_file: str = tr.get_parquet_path(file_path=folder_orig, name=name)
+        rows: int = load.batches_to_database(
+            batches=extr.iter_batches(file_path=path_file),
+            name=table,
+            url=url,
+            mode='upsert' if keys else 'replace',
+            keys=keys,
+        )
+        pprint.success(f'Table {{ {table} }} saved, {rows} rows')
+
+
+def resolve_artifact(artifact: str) -> str:
+    """
+    Get the path of an artifact of the DAG, the artifacts of parquet files are
+    declared without extension, e.g. 'data/staging/010_prints'
+
+    Parameters
+    ----------
+    artifact: str
+        The artifact
+
+    Returns
+    -------
+    str
+        The path of the artifact
+    """
+    if artifact.endswith('.csv'):
+        return artifact
+    folder, name = artifact.rsplit('/', 1)
+    return tr.get_parquet_path(file_path=folder, name=name)
+
+
+def estimate_sizes(*, names: tuple[str, ...], folder: str = 'data/staging') -> list[int]:
+    """
+    Get the bytes the tables of saved files take in memory, from their metadata, they
+    are only used by the governor so nothing is read when it has no budget
+
+    Parameters
+    ----------
+    names: tuple[str, ...]
+        The names of the files, e.g. ('010_taps', '010_pays')
+    folder: str, Optional
+        Path to the folder where the files are stored, by default 'data/staging'
+
+    Returns
+    -------
+    list[int]
+        The size of every file, 0 for the files that are not saved yet or when the
+        governor has no budget
+    """
+    if not gov.is_enabled():
+        return [0] * len(names)
+    paths: list[str] = [tr.get_parquet_path(file_path=folder, name=name) for name in names]
+    sizes: list[int] = [
+        extr.estimate_size(file_path=path)[1] if storage.is_file(path) or storage.is_dir(path) else 0
+        for path in paths
+    ]
+    return sizes
+
+
+def build_dag(
+        *,
+        weeks: dict[str, int],
+        to_group: tuple[tuple[str, list[str], str], ...],
+        filter_from: str = 'prints',
+        partitioned: bool = False,
+        csv_compression: str | None = None,
+        memory_budget: int | None = None,
+    ) -> list[dag.Node]:
+    """
+    Declare the nodes of the transform pipeline, from the raw files to the CSV exports,
+    the names of the nodes are the names of the artifacts they write
+
+    Parameters
+    ----------
+    weeks: dict[str, int]
+        The number of weeks to keep for every file
+    to_group: tuple[tuple[str, list[str], str], ...]
+        The files to group, with the columns to group by and the operation
+    filter_from: str, Optional
+        The file with the users used to filter the other files, by default 'prints'
+    partitioned: bool, Optional
+        If the normalized files are saved partitioned by day, by default False
+    csv_compression: str | None, Optional
+        The compression of the CSV exports, e.g. 'gzip', by default None
+    memory_budget: int | None, Optional
+        The bytes a file can take in memory when it is grouped, the larger files are
+        grouped out of core, by default None
+
+    Returns
+    -------
+    list[dag.Node]
+        The nodes of the DAG
+    """
+    raw: str = 'data/raw'
+    staging: str = 'data/staging'
+    nodes: list[dag.Node] = []
+    names: dict[str, str] = {}
+    for parquet_file, ws in weeks.items():
+        nodes.append(dag.Node(
+            name=f'010_{parquet_file}',
+            func=functools.partial(normalize_file, parquet_file=parquet_file, partitioned=partitioned),
+            inputs=(f'{raw}/{parquet_file}',),
+            outputs=(f'{staging}/010_{parquet_file}',),
+        ))
+        nodes.append(dag.Node(
+            name=f'021_010_{parquet_file}',
+            func=functools.partial(filter_file_last_weeks, parquet_file=f'010_{parquet_file}', weeks=ws),
+            inputs=(f'{staging}/010_{parquet_file}',),
+            outputs=(f'{staging}/021_010_{parquet_file}',),
+        ))
+        names[parquet_file] = f'021_010_{parquet_file}'
+
+    # The key set of the users is built once and every filter node reads it
+    key_set: str = f'keys_021_010_{filter_from}'
+    nodes.append(dag.Node(
+        name=key_set,
+        func=functools.partial(save_key_set, filter_from=f'021_010_{filter_from}'),
+        inputs=(f'{staging}/021_010_{filter_from}',),
+        outputs=(f'{staging}/{key_set}',),
+    ))
+    for parquet_file in weeks:
+        if parquet_file == filter_from:
+            continue
+        nodes.append(dag.Node(
+            name=f'022_021_010_{parquet_file}',
+            func=functools.partial(filter_file_by_key_set, tfilter=f'021_010_{parquet_file}', key_set=key_set),
+            inputs=(f'{staging}/021_010_{parquet_file}', f'{staging}/{key_set}'),
+            outputs=(f'{staging}/022_021_010_{parquet_file}',),
+        ))
+        names[parquet_file] = f'022_021_010_{parquet_file}'
+
+    for parquet_file, by, op in to_group:
+        name: str = names[parquet_file]
+        nodes.append(dag.Node(
+            name=f'030_{name}',
+            func=functools.partial(group_file, parquet_file=name, by=by, op=op, memory_budget=memory_budget),
+            inputs=(f'{staging}/{name}',),
+            outputs=(f'{staging}/030_{name}',),
+        ))
+
+    nodes.append(dag.Node(
+        name='040_features',
+        func=functools.partial(step_features, weeks=weeks['taps'], last_weeks=weeks[filter_from]),
+        inputs=(f'{staging}/{names[filter_from]}', *(f'{staging}/010_{parquet_file}' for parquet_file in weeks)),
+        outputs=(f'{staging}/040_features',),
+    ))
+
+    exports: dict[str, str] = {
+        f'030_{names[parquet_file]}': parquet_file
+        for parquet_file in weeks if parquet_file != filter_from
+    }
+    exports[names[filter_from]] = filter_from
+    exports['040_features'] = 'features'
+    for name, parquet_file in exports.items():
+        path: str = f'data/processed/{parquet_file}{CSV_SUFFIXES[csv_compression]}'
+        nodes.append(dag.Node(
+            name=os.path.basename(path),
+            func=functools.partial(export_csv, name=name, path=path, compression=csv_compression),
+            inputs=(f'{staging}/{name}',),
+            outputs=(path,),
+        ))
+    return nodes
+
+
+@dec.time_it
+def step_dag(
+        *,
+        partitioned: bool = False,
+        workers: int = 1,
+        processes: bool = False,
+        from_step: str | None = None,
+        csv_compression: str | None = None,
+        memory_budget: int | None = None,
+    ) -> None:
+    """
+    Run the transform pipeline as a DAG, the nodes whose dependencies are done run at
+    the same time and the nodes whose artifacts did not change since their last run
+    are skipped
+
+    Parameters
+    ----------
+    partitioned: bool, Optional
+        If the normalized files are saved partitioned by day, by default False
+    workers: int, Optional
+        The number of nodes to run at the same time, by default 1
+    processes: bool, Optional
+        If the nodes run in a process pool instead of a thread pool, by default False
+    from_step: str | None, Optional
+        The node to start from, e.g. '022_021_010_taps', it runs with all the nodes
+        downstream of it and the other nodes are not run, by default None
+    csv_compression: str | None, Optional
+        The compression of the CSV exports, e.g. 'gzip', by default None
+    memory_budget: int | None, Optional
+        The bytes a file can take in memory when it is grouped, by default None
+    """
+    pprint.title('STEP : DAG')
+    nodes: list[dag.Node] = build_dag(
+        weeks=WEEKS,
+        to_group=TO_GROUP,
+        partitioned=partitioned,
+        csv_compression=csv_compression,
+        memory_budget=memory_budget,
+    )
+    dag.run(
+        nodes=nodes,
+        workers=workers,
+        processes=processes,
+        from_node=from_step,
+        resolve=resolve_artifact,
+    )
+
+
+@dec.time_it
+def run(
+        steps: tuple[str, ...] = ('normalize','filter_las_week', 'grouping', 'features'),
+        lazy: bool = False,
+        trace: bool = False,
+        partitioned: bool = False,
+        incremental: bool = False,
+        workers: int = 1,
+        processes: bool = False,
+        scheduled: bool = False,
+        from_step: str | None = None,
+        cached: bool = False,
+        staging_format: str = 'parquet-gzip',
+        buckets: int = 1,
+        profile: bool = False,
+        spans: bool = False,
+        csv_compression: str | None = None,
+        database: str | None = None,
+        memory_budget: int | None = None,
+        config: str = 'config/config.yaml',
+    ) -> None:
     """
     Pipeline to transform the data and save it in a parquet files with gzip compression,
-    the data fules are stored in the 'data/staging' folder by default
+    the data fules are stored in the 'data/staging' folder by default. The pipeline
+    reads 'data/raw' and writes 'data/staging' as local folders, URIs of an object
+    storage are only taken by the extraction, the load and the step functions
+    called with their folders, e.g. `normalize_file(folder_dest='s3://bucket/staging')`
 
     Parameters
     ----------
     steps: tuple[str]
         Steps to execute in the pipeline
+    lazy: bool, Optional
+        If the normalize, filter and grouping steps run as one lazy plan, the lazy,
+        incremental and scheduled modes can not be combined, by default False
+    trace: bool, Optional
+        If the lazy mode also writes the intermediate staging files, by default False
+    partitioned: bool, Optional
+        If the normalized files are saved partitioned by day, by default False
+    incremental: bool, Optional
+        If only the days after the last run are normalized and grouped, and the grouped
+        files are built merging per day partial aggregates, by default False
+    workers: int, Optional
+        The number of files processed at the same time by every step, by default 1
+    processes: bool, Optional
+        If the files are processed in a process pool instead of a thread pool, by default False
+    scheduled: bool, Optional
+        If the pipeline runs as a DAG that skips the steps whose files are up to date,
+        by default False
+    from_step: str | None, Optional
+        The step the DAG starts from, e.g. '022_021_010_taps', by default None
+    cached: bool, Optional
+        If the normalize, last weeks filter and grouping outputs are reused from the
+        cache in 'data/cache' when their inputs and arguments did not change, by default False
+    staging_format: str, Optional
+        The format of the staging files, one of the keys of `tr.STAGING_FORMATS`, e.g.
+        'parquet-zstd', 'parquet-lz4' or 'feather' for uncompressed Arrow IPC files that
+        are memory-mapped when read, by default 'parquet-gzip'
+    buckets: int, Optional
+        The number of buckets of users the features are built by, more buckets use
+        less memory, by default 1
+    profile: bool, Optional
+        If the statistics of every saved file are written in 'data/stats', taken from
+        the parquet footers when possible, by default False
+    spans: bool, Optional
+        If the spans of the steps are appended to 'data/logs/trace.jsonl', they can be
+        exported with `log.export_chrome`, by default False
+    csv_compression: str | None, Optional
+        The compression of the CSV files of 'data/processed', e.g. 'gzip', by default None
+    database: str | None, Optional
+        The url of a SQL database the grouped taps and pays are upserted into and the
+        features are saved into, e.g. 'sqlite:///data/processed/meli.db', by default None
+    memory_budget: int | None, Optional
+        The bytes a file can take in memory when it is grouped, the files whose
+        uncompressed size is larger are grouped out of core, spilling to 'data/spill',
+        by default None
+    config: str, Optional
+        Path of the config file, if its `resources` section has a memory budget the
+        workers, the grouping budget and the buckets of the features are lowered to
+        fit in the memory left before every step, by default 'config/config.yaml'
     """
+    modes: list[str] = [mode for mode, enabled in (('lazy', lazy), ('incremental', incremental), ('scheduled', scheduled)) if enabled]
+    if len(modes) > 1:
+        raise ValueError(f'The modes {modes} can not be combined, use only one of them')
+
     pprint.title('Pipeline Transform')
+    gov.configure(path=config)
+    cache.configure(enabled=cached)
+    profiling.configure(enabled=profile)
+    log.configure(enabled=spans)
+    tr.set_staging_format(fmt=staging_format)
+    keys: dict[str, list[str]] = {name: by for name, by, _ in TO_GROUP}
+    to_database: list[tuple[str, str, list[str] | None]] = [
+        ('030_022_021_010_taps', 'taps', keys['taps']),
+        ('030_022_021_010_pays', 'pays', keys['pays']),
+    ]
+
+    if scheduled:
+        workers = gov.workers(requested=workers, sizes=estimate_sizes(names=tuple(WEEKS), folder='data/raw'))
+        step_dag(
+            partitioned=partitioned,
+            workers=workers,
+            processes=processes,
+            from_step=from_step,
+            csv_compression=csv_compression,
+            memory_budget=gov.memory_budget(requested=memory_budget, workers=workers),
+        )
+        if database is not None:
+            step_database(to_export=(*to_database, ('040_features', 'features', None)), url=database)
+        return
+
+    if incremental:
+        step_incremental(weeks=WEEKS, to_group=TO_GROUP)
+        steps = tuple(step for step in steps if step == 'features')
+
+    if lazy:
+        step_lazy(weeks=WEEKS, to_group=TO_GROUP, trace=trace)
+        if 'features' in steps and not trace:
+            pprint.warning('The features need the normalized files, run the lazy mode with trace')
+        steps = tuple(step for step in steps if step == 'features' and trace)
 
     if 'normalize' in steps:
-        step_normalize(to_norm=('prints', 'taps', 'pays'))
+        step_normalize(
+            to_norm=('prints', 'taps', 'pays'),
+            partitioned=partitioned,
+            workers=gov.workers(requested=workers, sizes=estimate_sizes(names=('prints', 'taps', 'pays'), folder='data/raw')),
+            processes=processes,
+        )
 
     if 'filter_las_week' in steps:
-        step_filtering(to_filter={
-            1: ('010_prints',),
-            3: ('010_taps', '010_pays'),
-        })
+        step_filtering(
+            to_filter={
+                1: ('010_prints',),
+                3: ('010_taps', '010_pays'),
+            },
+            workers=gov.workers(requested=workers, sizes=estimate_sizes(names=('010_prints', '010_taps', '010_pays'))),
+            processes=processes,
+        )
 
+    suffix: str = CSV_SUFFIXES[csv_compression]
+    exports: dict[str, str] = {
+        '030_022_021_010_taps': f'data/processed/taps{suffix}',
+        '030_022_021_010_pays': f'data/processed/pays{suffix}',
+    }
     if 'grouping' in steps:
+        to_group: tuple[tuple[str, list[str], str], ...] = (
+            ('022_021_010_taps', ['user_id', 'day', 'event_data_value_prop'], 'count'),
+            ('022_021_010_pays', ['user_id', 'pay_date', 'value_prop'], 'sum'),
+            ('021_010_prints', ['user_id', 'day', 'event_data_value_prop', 'event_data_position'], 'count'),
+        )
+        group_workers: int = gov.workers(requested=workers, sizes=estimate_sizes(names=tuple(name for name, _, _ in to_group)))
         step_grouping(
-            to_group=(
-                ('022_021_010_taps', ['user_id', 'day', 'event_data_value_prop'], 'count'),
-                ('022_021_010_pays', ['user_id', 'pay_date', 'value_prop'], 'sum'),
-                ('021_010_prints', ['user_id', 'day', 'event_data_value_prop', 'event_data_position'], 'count'),
-            )
+            to_group=to_group,
+            workers=group_workers,
+            processes=processes,
+            exports={name.removeprefix('030_'): path for name, path in exports.items()},
+            csv_compression=csv_compression,
+            memory_budget=gov.memory_budget(requested=memory_budget, workers=group_workers),
         )
+        exports = {}
 
-    load.dataframe_to_csv(
-        df=load_parquet(path_file='data/staging/030_022_021_010_taps.parquet.gzip'),
-        path='data/processed/taps.csv'
-    )
-    load.dataframe_to_csv(
-        df=load_parquet(path_file='data/staging/030_022_021_010_pays.parquet.gzip'),
-        path='data/processed/pays.csv'
-    )
-    load.dataframe_to_csv(
-        df=load_parquet(path_file='data/staging/021_010_prints.parquet.gzip'),
-        path='data/processed/prints.csv'
-    )
+    if 'features' in steps:
+        buckets = gov.buckets(
+            requested=buckets,
+            size=sum(estimate_sizes(names=('021_010_prints', '010_prints', '010_taps', '010_pays'))),
+        )
+        step_features(weeks=WEEKS['taps'], last_weeks=WEEKS['prints'], buckets=buckets)
+        exports['040_features'] = f'data/processed/features{suffix}'
+        to_database.append(('040_features', 'features', None))
+
+    exports['021_010_prints'] = f'data/processed/prints{suffix}'
+    for name, path in exports.items():
+        export_csv(name=name, path=path, compression=csv_compression)
+    if database is not None:
+        step_database(to_export=tuple(to_database), url=database)
 
 
 if __name__ == '__main__':